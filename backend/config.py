@@ -18,10 +18,12 @@ class Settings(BaseSettings):
     ovh_application_secret: str = ""
     ovh_consumer_key: str = ""
     ovh_zone_name: str = ""
+    ovh_api_url: str = ""  # Overrides the endpoint URL (e.g. a local stub)
 
     # Cloudflare API Configuration
     cloudflare_api_token: str = ""
     cloudflare_zone_id: str = ""
+    cloudflare_api_url: str = "https://api.cloudflare.com/client/v4"
 
     # Nginx Proxy Manager Configuration
     npm_url: str
@@ -34,12 +36,102 @@ class Settings(BaseSettings):
     # Server Configuration
     server_public_ip: str
 
+    # Upstream rate limits (requests per second, adapted on HTTP 429)
+    npm_rate_limit: float = 20.0
+    ovh_rate_limit: float = 10.0
+    cloudflare_rate_limit: float = 4.0
+    upstream_max_retries: int = 3
+
+    # Upstream timeouts and circuit breakers
+    upstream_timeout: float = 10.0
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30.0
+
+    # Let's Encrypt certificates (issued in the background)
+    certificate_concurrency: int = 2
+    certificate_timeout: float = 180.0
+    certificate_max_attempts: int = 3
+
+    # Seconds the in-memory NPM proxy host index is served before reloading
+    npm_host_cache_ttl: float = 30.0
+
+    # Seconds between background refreshes of the subdomain availability indexes
+    availability_refresh_interval: float = 60.0
+
+    # Inventory import: items recreated concurrently
+    import_concurrency: int = 4
+
+    # Logging: "json" or "text" lines on stdout, written from a background thread
+    log_level: str = "INFO"
+    log_levels: str = ""  # Per-module levels, e.g. "services.npm_service=DEBUG,services.upstream=WARNING"
+    log_format: str = "json"
+    log_success_sample_rate: float = 0.1  # Fraction of successful upstream calls/requests logged
+    log_queue_size: int = 10000
+
+    # Tracing: "" (off), "file" (JSON lines) or "otlp" (OpenTelemetry collector)
+    tracing_exporter: str = ""
+    tracing_file: str = "./traces.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318"
+    tracing_service_name: str = "docker-orchestrator"
+
+    # Container resource defaults (0 = unlimited) and admission control
+    container_default_cpus: float = 0.0
+    container_default_memory_mb: int = 0
+    container_default_pids_limit: int = 0
+    container_restart_policy: str = "unless-stopped"
+    host_cpus: int = 0  # 0 = as reported by Docker
+    host_memory_mb: int = 0  # 0 = as reported by Docker
+    host_reserved_memory_mb: int = 1024  # Kept for NPM, the orchestrator and the OS
+    memory_overcommit_ratio: float = 1.0
+    max_replicas: int = 10  # Per service
+    replica_drain_seconds: float = 5.0  # Before removing a container NPM no longer routes to
+
+    # Service deletion: seconds DELETE waits for the teardown before answering (the rest
+    # goes on in the background), and background retries of failed teardown steps
+    teardown_wait: float = 5.0
+    teardown_max_attempts: int = 5
+    teardown_retry_delay: float = 30.0
+
+    # Garbage collection of resources no service owns (0 = only on POST /api/gc): removed
+    # once orphaned for the grace period, in batches of gc_batch_size every gc_batch_interval
+    gc_interval: float = 0.0
+    gc_grace_period: float = 3600.0
+    gc_batch_size: int = 20
+    gc_batch_interval: float = 1.0
+    # Unowned A records to SERVER_PUBLIC_IP may have been made by hand: only reported unless enabled
+    gc_collect_dns: bool = False
+
+    # Seconds the read-only list endpoints may be served from a cache such as the
+    # nginx frontend's micro-cache (0 = every response is Cache-Control: no-store)
+    http_cache_max_age: int = 2
+
+    # Readiness probing before NPM registration: "healthcheck" (HEALTHCHECK, else running),
+    # "auto" (HEALTHCHECK, else TCP port; needs to reach the container networks), "tcp" or "none"
+    readiness_probe: str = "healthcheck"
+    readiness_timeout: float = 60.0
+    readiness_initial_delay: float = 0.2
+    readiness_max_delay: float = 5.0
+
     # Network Configuration
-    subnet_pool: str = "172.20.0.0/16"
-    subnet_size: int = 24
+    subnet_pool: str = "172.20.0.0/16"  # Comma-separated for several pools
+    subnet_size: int = 24  # Default prefix length, requests may ask for another
+    subnet_min_prefix: int = 20  # Largest subnet a request may ask for
+    subnet_reserved: str = ""  # Never allocated: comma-separated subnets or first-last ranges
+    # "dedicated": a network and subnet per service; "shared": services packed onto pooled networks
+    network_mode: str = "dedicated"
+    shared_network_size: int = 22  # Prefix length of the pooled networks' subnets
+
+    # Seconds a request waits for startup to finish before getting 503
+    startup_request_wait: float = 30.0
 
     # Database
     database_url: str = "sqlite:///./orchestrator.db"
+    db_busy_timeout_ms: int = 5000
+
+    # Multi-worker deployment
+    workers: int = 1
+    broadcast_dir: str = "./.orchestrator-broadcast"
+    job_lock_ttl: int = 300
 
     class Config:
         env_file = str(ENV_FILE)
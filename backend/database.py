@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Boolean, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from config import settings
+from tracing import tracer
+from request_cache import memoized
 
 # Create database engine
 engine = create_engine(
@@ -10,9 +12,69 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
 )
 
+
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Let several uvicorn workers share the SQLite file without lock errors"""
+    if "sqlite" not in settings.database_url:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+    cursor.close()
+
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+# Tracing: one span per SQL statement and per session transaction
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_statement_span(conn, cursor, statement, parameters, context, executemany):
+    if tracer.enabled:
+        context._trace_span = tracer.start_span(
+            "db.statement",
+            {"db.system": engine.dialect.name, "db.statement": statement[:500]}
+        )
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _end_statement_span(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span:
+        span.end()
+
+
+@event.listens_for(engine, "handle_error")
+def _fail_statement_span(exception_context):
+    span = getattr(exception_context.execution_context, "_trace_span", None)
+    if span:
+        span.record_error(exception_context.original_exception)
+        span.end()
+
+
+@event.listens_for(SessionLocal, "after_begin")
+def _start_transaction_span(session, transaction, connection):
+    if tracer.enabled and "trace_span" not in session.info:
+        session.info["trace_span"] = tracer.start_span("db.transaction", {"db.system": engine.dialect.name})
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _mark_transaction_rollback(session):
+    span = session.info.get("trace_span")
+    if span:
+        span.set_attribute("db.rollback", True)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _end_transaction_span(session, transaction):
+    if transaction.parent is None:
+        span = session.info.pop("trace_span", None)
+        if span:
+            span.end()
+
 # Create base class for models
 Base = declarative_base()
 
@@ -30,11 +92,28 @@ class Service(Base):
     subnet = Column(String)
     internal_port = Column(Integer)
     npm_proxy_host_id = Column(Integer)
-    dns_record_id = Column(Integer)
+    dns_record_id = Column(String)
+    dns_zone = Column(String)
+    resources = Column(Text)  # JSON of the limits applied to the container
+    replicas = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="active")
 
 
+class ServiceReplica(Base):
+    """One container of a service (see services.replicas)"""
+    __tablename__ = "service_replicas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    replica_key = Column(String, unique=True, index=True)  # "<service name>:<replica index>"
+    service_name = Column(String, index=True)
+    replica_index = Column(Integer)
+    container_id = Column(String)
+    container_name = Column(String)
+    container_ip = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Subnet(Base):
     """Subnet model for tracking subnet allocation"""
     __tablename__ = "subnets"
@@ -46,6 +125,132 @@ class Subnet(Base):
     allocated_at = Column(DateTime, default=datetime.utcnow)
 
 
+class SharedNetwork(Base):
+    """Docker network shared by the services created in shared-network mode"""
+    __tablename__ = "shared_networks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    network_name = Column(String, unique=True, index=True)
+    subnet = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class NetworkAddress(Base):
+    """Static IP of a container on a shared network"""
+    __tablename__ = "network_addresses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    address_key = Column(String, unique=True, index=True)  # "<network name>/<ip>"
+    network_name = Column(String, index=True)
+    ip = Column(String)
+    service_name = Column(String, index=True)
+    container_name = Column(String, unique=True, index=True)
+    allocated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobLock(Base):
+    """Named lock shared by all workers (see services.coordination.JobLockManager)"""
+    __tablename__ = "job_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    acquired_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class ProvisioningJob(Base):
+    """Journal of one service provisioning run (see services.provisioning)"""
+    __tablename__ = "provisioning_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    idempotency_key = Column(String, unique=True, index=True)
+    service_name = Column(String, index=True)
+    subdomain = Column(String)
+    dns_zone = Column(String)
+    request = Column(Text)  # JSON of the ServiceCreateRequest
+    status = Column(String, default="running")  # running | completed | partial | failed
+    current_step = Column(String)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ProvisioningStep(Base):
+    """One journaled step of a provisioning job"""
+    __tablename__ = "provisioning_steps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, index=True)
+    step = Column(String)
+    idempotency_key = Column(String, unique=True, index=True)  # "<job key>:<step>"
+    status = Column(String)  # started | completed | failed
+    attempts = Column(Integer, default=0)
+    result = Column(Text)  # JSON
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CertificateRequest(Base):
+    """Background Let's Encrypt issuance for one proxy host (see services.certificates)"""
+    __tablename__ = "certificate_requests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    proxy_host_id = Column(Integer, unique=True, index=True)
+    domain_name = Column(String)
+    status = Column(String, default="pending")  # pending | issuing | issued | failed
+    certificate_id = Column(Integer)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TeardownStep(Base):
+    """One cleanup step of a deleted service (see services.teardown)"""
+    __tablename__ = "teardown_steps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    teardown_id = Column(String, index=True)
+    service_name = Column(String, index=True)
+    step = Column(String)  # containers | network | subnet | npm_host | dns_record
+    target = Column(Text)  # JSON of what the step removes
+    status = Column(String, default="pending")  # pending | running | done | failed
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    next_attempt_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OrphanedResource(Base):
+    """Resource found with no owner, removed once the grace period is over (see services.garbage_collector)"""
+    __tablename__ = "orphaned_resources"
+
+    id = Column(Integer, primary_key=True, index=True)
+    resource_key = Column(String, unique=True, index=True)  # "<kind>:<resource id>"
+    kind = Column(String)  # container | address | network | subnet | npm_host | dns_record
+    resource_id = Column(String)
+    name = Column(String)
+    detail = Column(Text)  # JSON
+    first_seen_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+
+
+class ImportItem(Base):
+    """Outcome of one inventory item of an import run (see services.inventory)"""
+    __tablename__ = "import_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    import_id = Column(String, index=True)
+    item_key = Column(String, unique=True, index=True)  # "<import id>:<kind>:<natural key>"
+    kind = Column(String)
+    status = Column(String)  # created | skipped | failed
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class NPMConfig(Base):
     """NPM configuration stored in database"""
     __tablename__ = "npm_config"
@@ -78,6 +283,17 @@ class DNSConfig(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class DNSZone(Base):
+    """Additional DNS zone managed alongside the primary zone of DNSConfig"""
+    __tablename__ = "dns_zones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, nullable=False)  # "ovh" or "cloudflare"
+    zone_name = Column(String, unique=True, index=True)  # e.g. "example.org"
+    cloudflare_zone_id = Column(String, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 def get_db():
     """Dependency to get database session"""
     db = SessionLocal()
@@ -90,6 +306,7 @@ def get_db():
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
 
     # Initialize default configurations from .env if they don't exist
     db = SessionLocal()
@@ -126,7 +343,51 @@ def init_db():
         db.close()
 
 
+# Per-process configuration snapshots, dropped by invalidate_config_cache()
+_config_cache = {}
+
+
+def invalidate_config_cache():
+    """Forget cached configuration so the next read goes to the database"""
+    _config_cache.clear()
+
+
+def _add_missing_columns():
+    """Add columns introduced after a table was first created (create_all skips them)"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    ))
+
+
+def _cached(key: str, load):
+    """A per-process snapshot, fixed for the duration of a request"""
+    def snapshot():
+        if key not in _config_cache:
+            _config_cache[key] = load()
+        return _config_cache[key]
+    return memoized(f"config:{key}", snapshot)
+
+
 def get_npm_config():
+    """Get NPM configuration (cached per process until invalidated)"""
+    return dict(_cached('npm', _load_npm_config))
+
+
+def get_dns_config():
+    """Get DNS configuration (cached per process until invalidated)"""
+    return dict(_cached('dns', _load_dns_config))
+
+
+def _load_npm_config():
     """Get NPM configuration from database"""
     db = SessionLocal()
     try:
@@ -147,7 +408,7 @@ def get_npm_config():
         db.close()
 
 
-def get_dns_config():
+def _load_dns_config():
     """Get DNS configuration from database"""
     db = SessionLocal()
     try:
@@ -176,3 +437,40 @@ def get_dns_config():
         }
     finally:
         db.close()
+
+
+def get_dns_zones():
+    """
+    Get every managed DNS zone (cached per process until invalidated)
+
+    The zone configured in DNSConfig comes first and is the default zone;
+    rows of the dns_zones table follow.
+    """
+    return [dict(zone) for zone in _cached('zones', _load_dns_zones)]
+
+
+def _load_dns_zones():
+    config = get_dns_config()
+    provider = config['dns_provider'].lower()
+    zones = [{
+        'id': None,
+        'provider': provider,
+        'zone_name': config['ovh_zone_name'] if provider == "ovh" else "",
+        'cloudflare_zone_id': config['cloudflare_zone_id'] if provider == "cloudflare" else "",
+        'primary': True
+    }]
+
+    db = SessionLocal()
+    try:
+        for zone in db.query(DNSZone).order_by(DNSZone.id).all():
+            zones.append({
+                'id': zone.id,
+                'provider': zone.provider.lower(),
+                'zone_name': zone.zone_name or "",
+                'cloudflare_zone_id': zone.cloudflare_zone_id or "",
+                'primary': False
+            })
+    finally:
+        db.close()
+
+    return zones
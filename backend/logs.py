@@ -0,0 +1,181 @@
+"""
+Structured, non-blocking logging
+
+Records are put on a bounded queue by a QueueHandler and written to stdout
+by a QueueListener thread, so request handlers never wait on I/O. Each
+record is rendered as one JSON object (or a key=value text line) carrying
+the context of the request or job that logged it - request_id, job_id,
+trace_id - plus the structured fields passed as `extra`, e.g.:
+
+    logger.warning("Error creating proxy host: %s", e, extra={"upstream": "npm", "method": "create_proxy_host"})
+
+Records logged with extra={"sample": True} are high-volume success logs
+(upstream calls, requests) kept with probability LOG_SUCCESS_SAMPLE_RATE;
+warnings and errors are never sampled. LOG_LEVELS sets per-module levels.
+"""
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from config import settings
+from tracing import tracer
+
+_log_context = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "context", "sample", "taskName"
+}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["_ContextQueueHandler"] = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Add fields (request_id, job_id, ...) to every record logged inside the block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _fields(record: logging.LogRecord) -> Dict:
+    fields = dict(getattr(record, "context", None) or {})
+    for key, value in vars(record).items():
+        if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+            fields[key] = value
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record)
+        }
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable line with the structured fields appended as key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created).isoformat(sep=" ", timespec="milliseconds")
+        line = f"{timestamp} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = " ".join(f"{key}={value}" for key, value in _fields(record).items() if value is not None)
+        if fields:
+            line = f"{line} [{fields}]"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the records marked sample=True below WARNING"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sample", False) and record.levelno < logging.WARNING:
+            return self.rate >= 1 or random.random() < self.rate
+        return True
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    QueueHandler capturing the log context in the calling thread
+
+    The message and traceback are rendered here, before the record crosses
+    to the listener thread, but JSON formatting and the write happen there.
+    When the queue is full, records are dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        context = dict(_log_context.get())
+        span = tracer.current_span()
+        if span:
+            context["trace_id"] = span.trace_id
+        record.context = context
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(value: str) -> Dict[str, str]:
+    """'services.npm_service=DEBUG,services.upstream=WARNING' -> {module: level}"""
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Route every logger through the queue to stdout (idempotent)"""
+    global _listener, _queue_handler
+    if _listener:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+
+    _queue_handler = _ContextQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _queue_handler.addFilter(SamplingFilter(settings.log_success_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(settings.log_level.upper())
+    for name, level in _parse_levels(settings.log_levels).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_queue_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Write the queued records and stop the listener thread"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0
+    }
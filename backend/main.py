@@ -1,14 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import json
+import logging
+import time
+import uuid
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from config import settings
-from database import get_db, init_db, Service, get_npm_config, get_dns_config, NPMConfig, DNSConfig, SessionLocal
+from logs import configure_logging, log_context, logging_stats, shutdown_logging
+from request_cache import forget as forget_request_cache, memoized, request_scope
+from tracing import KIND_SERVER, parse_traceparent, tracer
+from database import (
+    get_db,
+    init_db,
+    Service,
+    get_npm_config,
+    get_dns_config,
+    get_dns_zones,
+    invalidate_config_cache,
+    NPMConfig,
+    DNSConfig,
+    DNSZone,
+    SessionLocal
+)
 from models import (
     ServiceCreateRequest,
     ServiceCreateResponse,
     ServiceInfo,
+    ServiceScaleRequest,
+    ServiceUpdateRequest,
     HealthResponse,
     DNSProxyCreateRequest,
     DNSProxyCreateResponse,
@@ -16,13 +39,49 @@ from models import (
     NPMConfigUpdateRequest,
     ConfigUpdateResponse,
     DNSConfigResponse,
-    DNSConfigUpdateRequest
+    DNSConfigUpdateRequest,
+    DNSZoneInfo,
+    DNSZoneCreateRequest
 )
 from services import (
+    CapacityError,
+    CapacityLedger,
+    CertificateQueue,
+    DNSRecordIndex,
+    ClientRegistry,
     DockerService,
-    SubnetManager
+    GarbageCollector,
+    IdempotencyConflict,
+    InvalidationBus,
+    Inventory,
+    JobLockManager,
+    NETWORK_MODES,
+    NetworkPool,
+    NPMHostIndex,
+    NPMService,
+    ProvisioningError,
+    ProvisioningJournal,
+    Provisioner,
+    ReadinessProbe,
+    ReplicaManager,
+    SubnetManager,
+    TeardownQueue,
+    ZoneRegistry,
+    background_priority,
+    breaker_states,
+    breaker_stats,
+    effective_limits,
+    iter_lines,
+    provider_class,
+    scheduler_stats
 )
 
+# Readiness is reported relative to this; benchmarks/startup.py also covers the imports
+STARTED_AT = time.monotonic()
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Docker Orchestrator API",
@@ -30,6 +89,29 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Startup: liveness is served at once, everything else once warm-up has finished
+LIVENESS_PATHS = {"/", "/health/live", "/health/ready", "/docs", "/openapi.json"}
+startup_state = {"ready": False, "stage": "starting", "error": None, "ready_after": None}
+_ready = asyncio.Event()
+
+
+# Registered first, so it is the innermost middleware: its 503 still gets
+# the CORS, trace and Cache-Control headers of the middlewares around it
+@app.middleware("http")
+async def wait_until_ready(request: Request, call_next):
+    """Hold requests that need the database until warm-up has finished (503 if it takes too long)"""
+    if not _ready.is_set() and request.url.path not in LIVENESS_PATHS:
+        try:
+            await asyncio.wait_for(_ready.wait(), timeout=settings.startup_request_wait)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": f"Starting up ({startup_state['stage']})"},
+                headers={"Retry-After": "5"}
+            )
+    return await call_next(request)
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -37,16 +119,156 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Request-Id"],
 )
 
-# Initialize infrastructure services (these don't change)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Run each request in a trace span, a log context and a request cache scope
+
+    The trace continues an incoming traceparent; the request ID is taken
+    from X-Request-Id or generated. Both IDs are returned as headers, and
+    the request is logged (successful ones sampled). Config reads and
+    provider lookups are memoized for the request (see request_cache).
+    """
+    request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    started = time.monotonic()
+    with log_context(request_id=request_id), request_scope() as request_cache, tracer.span(
+        f"{request.method} {request.url.path}",
+        kind=KIND_SERVER,
+        parent=parse_traceparent(request.headers.get("traceparent")),
+        **{"http.method": request.method, "http.target": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            # Name by route template so spans of /api/services/{service_name} group together
+            span.name = f"{request.method} {route.path}"
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        span.set_attribute("request_cache.hits", request_cache.hits)
+        if response.status_code >= 500:
+            span.record_error(f"HTTP {response.status_code}")
+        response.headers["X-Trace-Id"] = span.trace_id
+        response.headers["X-Request-Id"] = request_id
+
+        fields = {
+            "http_method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+        if response.status_code >= 500:
+            logger.warning("Request failed", extra=fields)
+        else:
+            logger.info("Request", extra={**fields, "sample": True})
+        return response
+
+
+# Initialize infrastructure services (these don't change; the Docker client connects on first use)
 docker_service = DockerService()
-subnet_manager = SubnetManager(settings.subnet_pool, settings.subnet_size)
+lock_manager = JobLockManager(default_ttl=settings.job_lock_ttl)
+subnet_manager = SubnetManager(
+    settings.subnet_pool,
+    settings.subnet_size,
+    lock_manager=lock_manager,
+    min_prefix=settings.subnet_min_prefix,
+    reserved=settings.subnet_reserved
+)
+capacity_ledger = CapacityLedger(docker_service)
+network_pool = NetworkPool(docker_service, subnet_manager, lock_manager=lock_manager)
+
+# Cross-worker invalidation of config snapshots and provider clients
+CONFIG_TOPIC = "config"
+invalidation_bus = InvalidationBus(settings.broadcast_dir)
+
+# Provider clients built lazily from the current config, reused until invalidated
+clients = ClientRegistry()
+
+
+def _invalidate_provider_state():
+    """Drop cached config and provider clients after a config change"""
+    invalidate_config_cache()
+    forget_request_cache()
+    clients.invalidate()
+    npm_host_index.invalidate()
+
+
+invalidation_bus.subscribe(CONFIG_TOPIC, _invalidate_provider_state)
+
+
+def publish_config_change():
+    """Apply a config change locally and broadcast it to the other workers"""
+    _invalidate_provider_state()
+    zone_registry.invalidate()
+    invalidation_bus.publish(CONFIG_TOPIC)
+
+
+# Read-mostly list endpoints the nginx frontend may micro-cache (see nginx.conf), by route.
+# Status that clients poll for progress (provisioning jobs, teardowns, certificate
+# issuance, capacity) is left out, so it is always no-store.
+CACHEABLE_ROUTES = {
+    "/api/services",
+    "/api/dns/records",
+    "/api/npm/hosts",
+    "/api/npm/certificates",
+    "/api/subnets",
+    "/api/networks"
+}
+
+
+@app.middleware("http")
+async def cache_headers(request: Request, call_next):
+    """
+    Mark successful reads of the list endpoints cacheable for HTTP_CACHE_MAX_AGE seconds
+
+    Every other response is no-store, and so is a list asked for with
+    ?refresh=true, so only data at most a few seconds old is ever served
+    from a cache.
+    """
+    response = await call_next(request)
+    if "cache-control" in response.headers:
+        return response
+    route = request.scope.get("route")
+    if (
+        settings.http_cache_max_age > 0
+        and request.method in ("GET", "HEAD")
+        and response.status_code == 200
+        and route is not None and route.path in CACHEABLE_ROUTES
+        and "refresh" not in request.query_params
+    ):
+        response.headers["Cache-Control"] = f"public, max-age={settings.http_cache_max_age}"
+    else:
+        response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.middleware("http")
+async def sync_invalidations(request: Request, call_next):
+    """Pick up invalidations published by other workers before handling a request"""
+    invalidation_bus.poll()
+    return await call_next(request)
+
+
+async def acquire_service_lock(service_name: str) -> str:
+    """Lock a service name across workers or fail with 409"""
+    token = await lock_manager.acquire_async(f"service:{service_name}")
+    if not token:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Service '{service_name}' is being modified by another request"
+        )
+    return token
 
 
 def get_npm_service():
-    """Get NPM service with current database configuration"""
-    from services import NPMService
+    """Get NPM service with current database configuration (the same one for a whole request)"""
+    return memoized("client:npm", lambda: clients.get("npm"))
+
+
+def _build_npm_service():
     config = get_npm_config()
 
     # Create a custom NPM service with database config
@@ -55,56 +277,207 @@ def get_npm_service():
     service.email = config['npm_email']
     service.password = config['npm_password']
     service.token = None  # Force re-authentication with new creds
+    service.host_index = npm_host_index
 
     return service
 
 
-def get_ovh_service():
-    """Get OVH service with current database configuration"""
-    import ovh
-    from services import OVHService
+clients.register("npm", _build_npm_service)
+
+# Proxy hosts served from memory, written through by our own NPM calls
+npm_host_index = NPMHostIndex(get_npm_service, ttl=settings.npm_host_cache_ttl)
+
+
+def _build_dns_provider(zone: dict):
+    """Build the DNS client of one zone, with provider credentials from the database"""
     config = get_dns_config()
+    service = provider_class("cloudflare" if zone['provider'] == "cloudflare" else "ovh")()
 
-    # Create OVH service with database config
-    service = OVHService()
-    service.client = ovh.Client(
+    if zone['provider'] == "cloudflare":
+        service.api_token = config['cloudflare_api_token']
+        service.zone_id = zone['cloudflare_zone_id']
+        if zone['zone_name']:
+            # Zone name already known: no metadata round trip needed
+            service._zone_info = {'id': zone['cloudflare_zone_id'], 'name': zone['zone_name']}
+        return service
+
+    service.connect(
         endpoint=config['ovh_endpoint'],
         application_key=config['ovh_application_key'],
         application_secret=config['ovh_application_secret'],
         consumer_key=config['ovh_consumer_key']
     )
-    service.zone_name = config['ovh_zone_name']
-
+    service.zone_name = zone['zone_name']
     return service
 
 
-def get_cloudflare_service():
-    """Get Cloudflare service with current database configuration"""
-    from services.cloudflare_service import CloudflareService
-    config = get_dns_config()
+# DNS names of every managed zone, for availability checks without provider calls
+dns_record_index = DNSRecordIndex()
 
-    # Create Cloudflare service with database config
-    service = CloudflareService()
-    service.api_token = config['cloudflare_api_token']
-    service.zone_id = config['cloudflare_zone_id']
-
-    return service
+# One pooled DNS client per managed zone
+zone_registry = ZoneRegistry(get_dns_zones, _build_dns_provider, record_index=dns_record_index)
+invalidation_bus.subscribe(CONFIG_TOPIC, zone_registry.invalidate)
 
 
 def get_dns_service():
-    """Get the configured DNS service (OVH or Cloudflare) from database"""
-    config = get_dns_config()
+    """Get the DNS service of the primary zone"""
+    return zone_registry.default()
 
-    if config['dns_provider'].lower() == "cloudflare":
-        return get_cloudflare_service()
-    else:
-        return get_ovh_service()
+
+# Let's Encrypt certificates, issued in the background and attached when ready
+certificate_queue = CertificateQueue(
+    get_npm_service,
+    concurrency=settings.certificate_concurrency,
+    max_attempts=settings.certificate_max_attempts
+)
+
+# Journaled, resumable service provisioning
+provisioning_journal = ProvisioningJournal()
+replica_manager = ReplicaManager(
+    docker_service,
+    get_npm_service,
+    capacity_ledger=capacity_ledger,
+    readiness_probe=ReadinessProbe(docker_service),
+    network_pool=network_pool
+)
+provisioner = Provisioner(
+    provisioning_journal,
+    docker_service,
+    subnet_manager,
+    get_npm_service,
+    zone_registry,
+    settings.server_public_ip,
+    replica_manager,
+    certificate_queue=certificate_queue,
+    network_pool=network_pool
+)
+
+# Service deletion: parallel, ordered cleanup, failed steps retried in the background
+teardown_queue = TeardownQueue(
+    docker_service,
+    replica_manager,
+    subnet_manager,
+    get_npm_service,
+    zone_registry,
+    certificate_queue=certificate_queue,
+    network_pool=network_pool,
+    max_attempts=settings.teardown_max_attempts,
+    retry_delay=settings.teardown_retry_delay
+)
+
+# Removal of resources left behind with no owner, after a grace period
+garbage_collector = GarbageCollector(
+    docker_service,
+    subnet_manager,
+    get_npm_service,
+    zone_registry,
+    provisioning_journal,
+    settings.server_public_ip,
+    lock_manager=lock_manager,
+    certificate_queue=certificate_queue,
+    network_pool=network_pool,
+    grace_period=settings.gc_grace_period,
+    batch_size=settings.gc_batch_size,
+    batch_interval=settings.gc_batch_interval,
+    collect_dns=settings.gc_collect_dns
+)
+
+# Streaming NDJSON export/import of services, subnets, DNS records and NPM hosts
+inventory = Inventory(
+    zone_registry,
+    npm_host_index,
+    get_npm_service,
+    subnet_manager,
+    provisioning_journal,
+    provisioner,
+    lock_manager,
+    certificate_queue=certificate_queue,
+    concurrency=settings.import_concurrency
+)
+
+
+async def resolve_dns_zone(name: str, zone_name: Optional[str] = None):
+    """Pick the DNS client and relative subdomain for a name, or fail with 400"""
+    try:
+        return await zone_registry.resolve(name, zone_name)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e).strip("'\""))
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    init_db()
+    """Start warming up in the background so the API answers liveness probes immediately"""
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+
+
+async def warm_up():
+    """Initialize the database, resume interrupted work, then connect to Docker"""
+    delay = 1.0
+    while True:
+        startup_state["stage"] = "database"
+        try:
+            await asyncio.to_thread(init_db)
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            logger.error("Database initialization failed, retrying in %.0fs: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    startup_state["stage"] = "resuming"
+    certificate_queue.resume()
+    teardown_queue.resume()
+    asyncio.create_task(resume_interrupted_jobs())
+    asyncio.create_task(refresh_availability_indexes())
+    if settings.gc_interval > 0:
+        asyncio.create_task(collect_garbage())
+
+    startup_state.update(
+        ready=True,
+        stage="ready",
+        error=None,
+        ready_after=round(time.monotonic() - STARTED_AT, 3)
+    )
+    _ready.set()
+    logger.info("Ready", extra={"ready_after_s": startup_state["ready_after"]})
+
+    # Connect now rather than on the first service request; a failure is retried on use
+    try:
+        await asyncio.to_thread(lambda: docker_service.client)
+    except Exception as e:
+        logger.warning("Docker is not reachable yet: %s", e, extra={"upstream": "docker"})
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Export the trace spans and write the log records still queued"""
+    await asyncio.to_thread(tracer.flush)
+    await asyncio.to_thread(shutdown_logging)
+
+
+async def refresh_availability_indexes():
+    """Keep the DNS and NPM indexes behind /api/subdomains/{name}/availability warm"""
+    while True:
+        with background_priority():
+            try:
+                await zone_registry.list_records(types=("A", "CNAME"))
+            except Exception as e:
+                logger.warning("Error refreshing DNS record index: %s", e)
+            try:
+                await asyncio.to_thread(npm_host_index.hosts)
+            except Exception as e:
+                logger.warning("Error refreshing NPM host index: %s", e, extra={"upstream": "npm"})
+        await asyncio.sleep(settings.availability_refresh_interval)
+
+
+async def collect_garbage():
+    """Remove orphaned resources every GC_INTERVAL seconds (one worker at a time)"""
+    while True:
+        await asyncio.sleep(settings.gc_interval)
+        try:
+            await garbage_collector.collect()
+        except Exception as e:
+            logger.warning("Garbage collection failed: %s", e)
 
 
 @app.get("/")
@@ -119,14 +492,39 @@ async def root():
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving (no database or upstream access)"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once the database is initialized, 503 while starting"""
+    return JSONResponse(
+        status_code=200 if startup_state["ready"] else 503,
+        content={
+            "status": "ready" if startup_state["ready"] else "starting",
+            "stage": startup_state["stage"],
+            "error": startup_state["error"],
+            "ready_after_seconds": startup_state["ready_after"],
+            "docker_connected": docker_service.connected,
+            "clients": clients.stats()
+        }
+    )
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
-    docker_ok = docker_service.health_check()
+    """Health check endpoint (upstreams with an open circuit are not contacted)"""
     npm_service = get_npm_service()
-    npm_ok = npm_service.health_check()
     dns_service = get_dns_service()
-    dns_ok = dns_service.health_check()
+    docker_ok, npm_ok, dns_ok = await asyncio.gather(
+        asyncio.to_thread(docker_service.health_check),
+        asyncio.to_thread(npm_service.health_check),
+        asyncio.to_thread(dns_service.health_check)
+    )
+    breakers = breaker_states()
 
     return HealthResponse(
         status="healthy" if (docker_ok and npm_ok and dns_ok) else "degraded",
@@ -135,124 +533,37 @@ async def health_check():
         ovh=dns_ok,
         docker_error=docker_service.last_error if not docker_ok else None,
         npm_error=npm_service.last_error if not npm_ok else None,
-        ovh_error=dns_service.last_error if not dns_ok else None
+        ovh_error=dns_service.last_error if not dns_ok else None,
+        breakers=breakers
     )
 
 
+@app.get("/api/upstreams")
+async def get_upstream_stats():
+    """Rate-limit scheduler and circuit breaker state per upstream, client builds, trace export and log queue counters"""
+    return {
+        "upstreams": scheduler_stats(),
+        "breakers": breaker_stats(),
+        "clients": {**clients.stats(), "docker": {"built": docker_service.connected}},
+        "tracing": tracer.stats(),
+        "logging": logging_stats()
+    }
+
+
 @app.get("/api/dns/records")
 async def get_dns_records():
-    """Get all DNS records from configured DNS provider"""
+    """Get DNS records of every managed zone, listed concurrently"""
     try:
-        all_records = []
-        zone_name = ""
-
-        # Get DNS config and determine provider
-        dns_config = get_dns_config()
-
-        if dns_config['dns_provider'].lower() == "cloudflare":
-            # Get Cloudflare service with current DB config
-            cloudflare_service = get_cloudflare_service()
-
-            # Get records from Cloudflare
-            records = cloudflare_service.get_records()
-            zone_info = cloudflare_service._get_zone_info()
-            zone_name = zone_info.get('name') if zone_info else dns_config['cloudflare_zone_id']
-
-            for record in records:
-                # Extract subdomain from full name
-                full_name = record.get('name', '')
-                if full_name.endswith(f".{zone_name}"):
-                    subdomain = full_name[:-len(f".{zone_name}")]
-                elif full_name == zone_name:
-                    subdomain = "@"
-                else:
-                    subdomain = full_name
-
-                all_records.append({
-                    "id": record.get('id'),
-                    "type": record.get('type'),
-                    "subdomain": subdomain,
-                    "target": record.get('content'),
-                    "ttl": record.get('ttl'),
-                    "zone": zone_name
-                })
-
-            # Also get CNAME records
-            try:
-                import requests
-                response = requests.get(
-                    f"{cloudflare_service.base_url}/zones/{cloudflare_service.zone_id}/dns_records",
-                    headers=cloudflare_service._get_headers(),
-                    params={'type': 'CNAME'},
-                    timeout=10
-                )
-                if response.ok:
-                    data = response.json()
-                    if data.get('success'):
-                        for record in data.get('result', []):
-                            full_name = record.get('name', '')
-                            if full_name.endswith(f".{zone_name}"):
-                                subdomain = full_name[:-len(f".{zone_name}")]
-                            elif full_name == zone_name:
-                                subdomain = "@"
-                            else:
-                                subdomain = full_name
-
-                            all_records.append({
-                                "id": record.get('id'),
-                                "type": record.get('type'),
-                                "subdomain": subdomain,
-                                "target": record.get('content'),
-                                "ttl": record.get('ttl'),
-                                "zone": zone_name
-                            })
-            except:
-                pass
-
-        else:
-            # Get OVH service with current DB config
-            ovh_service = get_ovh_service()
-            zone_name = dns_config['ovh_zone_name']
-
-            # Get A records
-            a_record_ids = ovh_service.get_records()
-            for record_id in a_record_ids:
-                record = ovh_service.get_record_details(record_id)
-                if record:
-                    all_records.append({
-                        "id": record_id,
-                        "type": "A",
-                        "subdomain": record.get("subDomain") or "@",
-                        "target": record.get("target"),
-                        "ttl": record.get("ttl"),
-                        "zone": record.get("zone")
-                    })
-
-            # Get CNAME records
-            try:
-                cname_ids = ovh_service.client.get(
-                    f'/domain/zone/{dns_config["ovh_zone_name"]}/record',
-                    fieldType='CNAME'
-                )
-                for record_id in cname_ids:
-                    record = ovh_service.get_record_details(record_id)
-                    if record:
-                        all_records.append({
-                            "id": record_id,
-                            "type": "CNAME",
-                            "subdomain": record.get("subDomain") or "@",
-                            "target": record.get("target"),
-                            "ttl": record.get("ttl"),
-                            "zone": record.get("zone")
-                        })
-            except:
-                pass
+        zones = await zone_registry.zone_names()
+        records, errors = await zone_registry.list_records(types=("A", "CNAME"))
 
         return {
             "success": True,
-            "zone": zone_name,
-            "count": len(all_records),
-            "records": all_records
+            "zone": zones[0][0] if zones else "",
+            "zones": [name for name, _ in zones],
+            "count": len(records),
+            "records": records,
+            "errors": errors or None
         }
 
     except Exception as e:
@@ -271,27 +582,19 @@ async def create_dns_proxy(request: DNSProxyCreateRequest):
     errors = []
     dns_record_id = None
     npm_proxy_host_id = None
+    certificate_status = None
 
-    # Get DNS service based on configured provider
-    dns_service = get_dns_service()
-
-    # Get DNS config and zone name based on provider
-    dns_config = get_dns_config()
-    if dns_config['dns_provider'].lower() == "cloudflare":
-        cloudflare_service = get_cloudflare_service()
-        zone_info = cloudflare_service._get_zone_info()
-        zone_name = zone_info.get('name') if zone_info else dns_config['cloudflare_zone_id']
-    else:
-        zone_name = dns_config['ovh_zone_name']
-
-    full_domain = f"{request.subdomain}.{zone_name}"
+    # Pick the zone by suffix (bare labels go to the primary zone)
+    dns_service, subdomain, zone_name = await resolve_dns_zone(request.subdomain, request.zone)
+    full_domain = zone_name if subdomain == "@" else f"{subdomain}.{zone_name}"
 
     try:
         # Step 1: Create DNS CNAME record (if requested)
         if request.create_dns:
             try:
-                dns_record_id = dns_service.create_cname_record(
-                    subdomain=request.subdomain,
+                dns_record_id = await dns_service.create_record(
+                    "CNAME",
+                    subdomain=subdomain,
                     target=request.cname_target,
                     ttl=request.ttl
                 )
@@ -306,14 +609,23 @@ async def create_dns_proxy(request: DNSProxyCreateRequest):
         # Step 2: Create NPM proxy host
         try:
             npm_service = get_npm_service()
-            npm_proxy_host_id = npm_service.create_proxy_host(
+            certificate_id = None
+            if request.enable_ssl:
+                certificate_id = await certificate_queue.find_existing(full_domain)
+            npm_proxy_host_id = await asyncio.to_thread(
+                npm_service.create_proxy_host,
                 domain_name=full_domain,
                 forward_host=request.target_host,
                 forward_port=request.target_port,
-                enable_ssl=request.enable_ssl
+                enable_ssl=request.enable_ssl,
+                certificate_id=certificate_id
             )
             if not npm_proxy_host_id:
                 raise Exception("NPM proxy host creation returned no ID")
+            if certificate_id:
+                certificate_status = certificate_queue.record_reused(npm_proxy_host_id, full_domain, certificate_id)
+            elif request.enable_ssl:
+                certificate_status = certificate_queue.enqueue(npm_proxy_host_id, full_domain)
         except Exception as e:
             errors.append(f"NPM proxy host creation failed: {str(e)}")
 
@@ -332,7 +644,9 @@ async def create_dns_proxy(request: DNSProxyCreateRequest):
             dns_record_id=dns_record_id,
             npm_proxy_host_id=npm_proxy_host_id,
             message=success_message if not errors else warning_message,
-            errors=errors if errors else None
+            errors=errors if errors else None,
+            upstreams=breaker_states(),
+            certificate_status=certificate_status
         )
 
     except Exception as e:
@@ -340,11 +654,12 @@ async def create_dns_proxy(request: DNSProxyCreateRequest):
 
 
 @app.get("/api/npm/hosts")
-async def get_npm_hosts():
-    """Get all NPM proxy hosts"""
+async def get_npm_hosts(refresh: bool = False):
+    """Get all NPM proxy hosts (projections served from the in-memory index)"""
     try:
-        npm_service = get_npm_service()
-        hosts = npm_service.get_proxy_hosts()
+        if refresh:
+            npm_host_index.invalidate()
+        hosts = await asyncio.to_thread(npm_host_index.hosts)
         return {
             "success": True,
             "count": len(hosts),
@@ -358,151 +673,310 @@ async def get_npm_hosts():
         }
 
 
+@app.get("/api/npm/hosts/{proxy_host_id}")
+async def get_npm_host(proxy_host_id: int):
+    """Get one NPM proxy host from the in-memory index"""
+    host = await asyncio.to_thread(npm_host_index.get, proxy_host_id)
+    if not host:
+        raise HTTPException(status_code=404, detail="NPM proxy host not found")
+    return host
+
+
+@app.get("/api/subdomains/{name}/availability")
+async def check_subdomain_availability(name: str, zone: Optional[str] = None):
+    """
+    Check whether a subdomain is free in DNS and NPM
+
+    Answered from the in-memory indexes (refreshed in the background and by
+    our own changes), without calling the DNS provider or NPM.
+    """
+    _, subdomain, zone_name = await resolve_dns_zone(name.lower(), zone)
+    full_domain = zone_name if subdomain == "@" else f"{subdomain}.{zone_name}"
+
+    dns_conflicts = dns_record_index.lookup(full_domain)
+    npm_host = npm_host_index.find(full_domain, reload=False)
+    npm_conflicts = [npm_host] if npm_host else []
+    dns_age = dns_record_index.age(zone_name)
+    npm_age = npm_host_index.age()
+
+    return {
+        "name": name,
+        "full_domain": full_domain,
+        "zone": zone_name,
+        "available": not dns_conflicts and not npm_conflicts,
+        "conflicts": {"dns": dns_conflicts, "npm": npm_conflicts},
+        "indexed": dns_age is not None and npm_age is not None,
+        "index_age": {
+            "dns": round(dns_age, 1) if dns_age is not None else None,
+            "npm": round(npm_age, 1) if npm_age is not None else None
+        }
+    }
+
+
+@app.get("/api/certificates")
+async def list_certificate_requests():
+    """Let's Encrypt issuance status of every proxy host created with SSL"""
+    certificates = certificate_queue.list_requests()
+    return {"count": len(certificates), "certificates": certificates}
+
+
+@app.get("/api/npm/certificates")
+async def get_npm_certificates():
+    """Certificates held by NPM, indexed by covered domain for reuse"""
+    await asyncio.to_thread(certificate_queue.index.refresh)
+    domains = certificate_queue.index.snapshot()
+    return {"count": len(domains), "domains": domains}
+
+
+@app.get("/api/npm/hosts/{proxy_host_id}/certificate")
+async def get_certificate_status(proxy_host_id: int):
+    """Let's Encrypt issuance status of one proxy host"""
+    status = certificate_queue.status(proxy_host_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="No certificate requested for this proxy host")
+    return status
+
+
+@app.post("/api/npm/hosts/{proxy_host_id}/certificate")
+async def request_host_certificate(proxy_host_id: int, domain_name: Optional[str] = None):
+    """Queue (or retry) Let's Encrypt issuance for a proxy host"""
+    current = certificate_queue.status(proxy_host_id)
+    domain_name = domain_name or (current['domain_name'] if current else None)
+    if not domain_name:
+        raise HTTPException(status_code=400, detail="domain_name is required")
+    return {"proxy_host_id": proxy_host_id, "status": certificate_queue.enqueue(proxy_host_id, domain_name)}
+
+
 @app.post("/api/services", response_model=ServiceCreateResponse)
 async def create_service(
     request: ServiceCreateRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
     Create a new service with Docker container, NPM proxy, and OVH DNS
+
+    Every step is journaled: retrying with the same Idempotency-Key (defaults
+    to the service name) replays a finished job or resumes an interrupted one.
     """
-    errors = []
-    container_id = None
-    network_name = None
-    npm_proxy_host_id = None
-    dns_record_id = None
-    subnet = None
+    lock_token = await acquire_service_lock(request.service_name)
+    try:
+        return await _create_service(request, db, idempotency_key, lock_token)
+    finally:
+        await lock_manager.release_async(f"service:{request.service_name}", lock_token)
+
+
+def _service_response(outcome: dict) -> ServiceCreateResponse:
+    """Build the creation response from a provisioning job outcome"""
+    job = outcome['job']
+    results = outcome['results']
+    errors = outcome['errors']
+    npm_proxy_host_id = (results.get('npm') or {}).get('proxy_host_id')
+    certificate = certificate_queue.status(npm_proxy_host_id) if npm_proxy_host_id else None
+    return ServiceCreateResponse(
+        success=len(errors) == 0,
+        service_name=job['service_name'],
+        subdomain=job['subdomain'],
+        container_id=results['container']['container_id'],
+        network_name=results['network']['network_name'],
+        npm_proxy_host_id=npm_proxy_host_id,
+        dns_record_id=(results.get('dns') or {}).get('record_id'),
+        message="Service created successfully" if not errors else "Service created with warnings",
+        errors=errors if errors else None,
+        upstreams=breaker_states(),
+        job_id=job['id'],
+        certificate_status=certificate['status'] if certificate else None
+    )
 
+
+def _replay_response(job: dict) -> ServiceCreateResponse:
+    """Response of an already finished job, from its journal"""
+    steps = provisioning_journal.steps(job['id'])
+    results = {name: s['result'] for name, s in steps.items() if s['status'] == "completed"}
+    errors = job['error'].split("; ") if job['error'] else []
+    return _service_response({'job': job, 'results': results, 'errors': errors})
+
+
+async def _run_provisioning(job: dict, lock_token: str) -> ServiceCreateResponse:
+    lock_name = f"service:{job['service_name']}"
     try:
-        # Check if service already exists
-        existing = db.query(Service).filter(
-            Service.service_name == request.service_name
-        ).first()
-        if existing:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Service '{request.service_name}' already exists"
-            )
+        outcome = await provisioner.run(
+            job['id'],
+            heartbeat=lambda: lock_manager.refresh(lock_name, lock_token)
+        )
+    except ProvisioningError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"{e} (job {e.job_id}: retry to resume, or DELETE /api/provisioning/jobs/{e.job_id} to roll back)"
+        )
+    return _service_response(outcome)
 
-        # Step 1: Allocate subnet
-        subnet = subnet_manager.allocate_subnet(db, request.service_name)
-        if not subnet:
-            raise HTTPException(
-                status_code=500,
-                detail="No available subnets"
-            )
 
-        # Step 2: Create Docker network
-        network_name = f"{request.service_name}-network"
-        try:
-            docker_service.create_network(network_name, subnet)
-        except Exception as e:
-            errors.append(f"Docker network creation failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+async def check_capacity(service_name: str, resources: Optional[dict], restart_policy: Optional[str], count: int):
+    """Check that count replicas with these limits could be admitted (400/409 otherwise)"""
+    if count > settings.max_replicas:
+        raise HTTPException(status_code=400, detail=f"At most {settings.max_replicas} replicas per service")
+    limits = effective_limits(resources, restart_policy)
+    try:
+        await asyncio.to_thread(capacity_ledger.check, service_name, limits, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CapacityError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-        # Step 3: Create Docker container
+
+async def _create_service(
+    request: ServiceCreateRequest,
+    db: Session,
+    idempotency_key: Optional[str],
+    lock_token: str
+) -> ServiceCreateResponse:
+    key = idempotency_key or f"service:{request.service_name}"
+
+    existing_job = provisioning_journal.find_job(key)
+    if existing_job and existing_job['status'] in ("completed", "partial"):
         try:
-            container = docker_service.create_container(
-                name=request.service_name,
-                image=request.docker_image,
-                network=network_name,
-                internal_port=request.internal_port,
-                environment=request.environment_vars,
-                volumes=request.volumes
+            provisioning_journal.start_job(
+                key, request.service_name, request.model_dump(),
+                existing_job['subdomain'], existing_job['dns_zone']
             )
-            container_id = container.id
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return _replay_response(existing_job)
 
-            # Get container IP
-            container_ip = docker_service.get_container_ip(container_id, network_name)
-            if not container_ip:
-                raise Exception("Could not retrieve container IP")
+    # Check if service already exists
+    existing = db.query(Service).filter(
+        Service.service_name == request.service_name
+    ).first()
+    if existing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Service '{request.service_name}' already exists"
+        )
+    if teardown_queue.pending(request.service_name):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Service '{request.service_name}' is still being torn down, see GET /api/teardowns"
+        )
 
-        except Exception as e:
-            errors.append(f"Docker container creation failed: {str(e)}")
-            # Cleanup network
-            if network_name:
-                docker_service.remove_network(network_name)
-            raise HTTPException(status_code=500, detail=str(e))
-
-        # Step 4: Create DNS record
-        dns_config = get_dns_config()
-        dns_service = get_dns_service()
-
-        # Get zone name based on provider
-        if dns_config['dns_provider'].lower() == "cloudflare":
-            cloudflare_service = get_cloudflare_service()
-            zone_info = cloudflare_service._get_zone_info()
-            zone_name = zone_info.get('name') if zone_info else dns_config['cloudflare_zone_id']
-        else:
-            zone_name = dns_config['ovh_zone_name']
+    dns_service, record_name, zone_name = await resolve_dns_zone(
+        f"{request.service_name}.{request.domain}" if request.domain else request.service_name
+    )
+    subdomain = f"{record_name}.{zone_name}"
 
-        subdomain = f"{request.service_name}.{zone_name}"
-        try:
-            dns_record_id = dns_service.create_a_record(
-                subdomain=request.service_name,
-                target_ip=settings.server_public_ip
-            )
-            if not dns_record_id:
-                raise Exception("DNS record creation returned no ID")
-        except Exception as e:
-            errors.append(f"DNS record creation failed: {str(e)}")
-            # Continue anyway, we can create DNS later
+    # Fail fast instead of starting a container that cannot be published
+    open_circuits = [
+        name for name, state in breaker_states().items()
+        if state == "open" and name in ("npm", dns_service.provider_name)
+    ]
+    if open_circuits:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Upstream unavailable (circuit open): {', '.join(open_circuits)}"
+        )
 
-        # Step 5: Create NPM proxy host
+    if request.network_mode and request.network_mode not in NETWORK_MODES:
+        raise HTTPException(status_code=400, detail=f"network_mode must be one of: {', '.join(NETWORK_MODES)}")
+    if (request.network_mode or settings.network_mode) == "dedicated":
+        prefix = request.subnet_prefix or settings.subnet_size
         try:
-            npm_service = get_npm_service()
-            npm_proxy_host_id = npm_service.create_proxy_host(
-                domain_name=subdomain,
-                forward_host=container_ip,
-                forward_port=request.internal_port,
-                enable_ssl=request.enable_ssl
-            )
-            if not npm_proxy_host_id:
-                raise Exception("NPM proxy host creation returned no ID")
-        except Exception as e:
-            errors.append(f"NPM proxy host creation failed: {str(e)}")
-            # Continue anyway
-
-        # Step 6: Save to database
-        service = Service(
-            service_name=request.service_name,
-            subdomain=subdomain,
-            docker_image=request.docker_image,
-            container_id=container_id,
-            network_name=network_name,
-            subnet=subnet,
-            internal_port=request.internal_port,
-            npm_proxy_host_id=npm_proxy_host_id,
-            dns_record_id=dns_record_id,
-            status="active" if not errors else "partial"
+            subnet_manager.validate_prefix(prefix)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if request.replicas > SubnetManager.container_capacity(f"0.0.0.0/{prefix}"):
+            raise HTTPException(status_code=400, detail=f"A /{prefix} subnet cannot hold {request.replicas} replicas")
+
+    # Reject limits the host cannot honour before anything is created
+    await check_capacity(
+        request.service_name,
+        request.resources.model_dump() if request.resources else None,
+        request.restart_policy,
+        request.replicas
+    )
+
+    try:
+        job, _ = provisioning_journal.start_job(
+            key, request.service_name, request.model_dump(), subdomain, zone_name
         )
-        db.add(service)
-        db.commit()
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-        return ServiceCreateResponse(
-            success=len(errors) == 0,
-            service_name=request.service_name,
-            subdomain=subdomain,
-            container_id=container_id,
-            network_name=network_name,
-            npm_proxy_host_id=npm_proxy_host_id,
-            dns_record_id=dns_record_id,
-            message="Service created successfully" if not errors else "Service created with warnings",
-            errors=errors if errors else None
+    return await _run_provisioning(job, lock_token)
+
+
+@app.get("/api/provisioning/jobs")
+async def list_provisioning_jobs(status: Optional[str] = None):
+    """List provisioning jobs (optionally filtered by status)"""
+    jobs = provisioning_journal.list_jobs(status)
+    return {"count": len(jobs), "jobs": jobs}
+
+
+@app.get("/api/provisioning/jobs/{job_id}")
+async def get_provisioning_job(job_id: int):
+    """Get a provisioning job with its step journal"""
+    job = provisioning_journal.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Provisioning job not found")
+    return {**job, "steps": provisioning_journal.steps(job_id)}
+
+
+@app.post("/api/provisioning/jobs/{job_id}/resume", response_model=ServiceCreateResponse)
+async def resume_provisioning_job(job_id: int):
+    """Resume a failed or interrupted job from its first incomplete step"""
+    job = provisioning_journal.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Provisioning job not found")
+
+    lock_token = await acquire_service_lock(job['service_name'])
+    try:
+        return await _run_provisioning(job, lock_token)
+    finally:
+        await lock_manager.release_async(f"service:{job['service_name']}", lock_token)
+
+
+@app.delete("/api/provisioning/jobs/{job_id}")
+async def cancel_provisioning_job(job_id: int):
+    """Roll back the resources of an unfinished job and drop its journal"""
+    job = provisioning_journal.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Provisioning job not found")
+    if job['status'] in ("completed", "partial"):
+        raise HTTPException(
+            status_code=400,
+            detail="Job already finished; delete the service instead"
         )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        # Cleanup on failure
-        if container_id:
-            docker_service.stop_and_remove_container(container_id)
-        if network_name:
-            docker_service.remove_network(network_name)
-        if subnet:
-            subnet_manager.release_subnet(db, subnet)
+    lock_token = await acquire_service_lock(job['service_name'])
+    try:
+        errors = await provisioner.rollback(job_id)
+    finally:
+        await lock_manager.release_async(f"service:{job['service_name']}", lock_token)
 
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "success": len(errors) == 0,
+        "message": "Provisioning job rolled back" if not errors else "Rollback incomplete, retry to finish",
+        "errors": errors if errors else None
+    }
+
+
+async def resume_interrupted_jobs():
+    """Resume jobs left running by a crashed or restarted worker"""
+    for job in provisioning_journal.list_jobs(status="running"):
+        lock_name = f"service:{job['service_name']}"
+        lock_token = await lock_manager.acquire_async(lock_name)
+        if not lock_token:
+            # Still being provisioned by another worker
+            continue
+        try:
+            with background_priority():
+                await provisioner.run(
+                    job['id'],
+                    heartbeat=lambda: lock_manager.refresh(lock_name, lock_token)
+                )
+        except Exception as e:
+            logger.error("Error resuming provisioning job %s: %s", job['id'], e, extra={"job_id": job['id']})
+        finally:
+            await lock_manager.release_async(lock_name, lock_token)
 
 
 @app.get("/api/services", response_model=List[ServiceInfo])
@@ -520,7 +994,10 @@ async def list_services(db: Session = Depends(get_db)):
             subnet=s.subnet,
             internal_port=s.internal_port,
             npm_proxy_host_id=s.npm_proxy_host_id,
-            dns_record_id=s.dns_record_id,
+            dns_record_id=str(s.dns_record_id) if s.dns_record_id is not None else None,
+            dns_zone=s.dns_zone,
+            resources=json.loads(s.resources) if s.resources else None,
+            replicas=s.replicas or 1,
             created_at=s.created_at.isoformat(),
             status=s.status
         )
@@ -528,9 +1005,173 @@ async def list_services(db: Session = Depends(get_db)):
     ]
 
 
+@app.get("/api/services/{service_name}/replicas")
+async def list_replicas(service_name: str, db: Session = Depends(get_db)):
+    """List the container replicas of a service"""
+    service = db.query(Service).filter(Service.service_name == service_name).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    replicas = await asyncio.to_thread(replica_manager.list_replicas, service_name)
+    return {"service_name": service_name, "count": len(replicas), "replicas": replicas}
+
+
+@app.post("/api/services/{service_name}/scale")
+async def scale_service(service_name: str, body: ServiceScaleRequest, db: Session = Depends(get_db)):
+    """
+    Scale a service to a number of replicas
+
+    New replicas are started and probed before NPM routes to them; surplus
+    replicas are removed only once NPM no longer does.
+    """
+    lock_token = await acquire_service_lock(service_name)
+    try:
+        return await _scale_service(service_name, body, db)
+    finally:
+        await lock_manager.release_async(f"service:{service_name}", lock_token)
+
+
+def _current_request(service: Service) -> dict:
+    """Creation request of a service, with the image it runs now"""
+    # Services imported without their creation request keep the limits they were created with
+    limits = json.loads(service.resources) if service.resources else {}
+    request = provisioning_journal.service_request(service.service_name) or {
+        "internal_port": service.internal_port,
+        "resources": limits,
+        "restart_policy": limits.get("restart_policy")
+    }
+    return {**request, "docker_image": service.docker_image}
+
+
+async def _scale_service(service_name: str, body: ServiceScaleRequest, db: Session):
+    service = db.query(Service).filter(Service.service_name == service_name).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    request = _current_request(service)
+    if body.replicas > settings.max_replicas:
+        raise HTTPException(status_code=400, detail=f"At most {settings.max_replicas} replicas per service")
+    if service.subnet and not network_pool.is_shared(service.network_name):
+        if body.replicas > SubnetManager.container_capacity(service.subnet):
+            raise HTTPException(status_code=400, detail=f"Subnet {service.subnet} cannot hold {body.replicas} replicas")
+    added = body.replicas - (service.replicas or 1)
+    if added > 0:
+        await check_capacity(service_name, request.get("resources"), request.get("restart_policy"), added)
+
+    outcome = await replica_manager.scale(
+        {
+            "service_name": service_name,
+            "network_name": service.network_name,
+            "internal_port": service.internal_port,
+            "npm_proxy_host_id": service.npm_proxy_host_id
+        },
+        request,
+        body.replicas
+    )
+    errors = outcome["errors"]
+    return {
+        "success": len(errors) == 0,
+        "service_name": service_name,
+        "replicas": len(outcome["replicas"]),
+        "started": outcome["started"],
+        "stopped": outcome["stopped"],
+        "message": f"Service scaled to {body.replicas} replicas" if not errors else "Service scaled with errors",
+        "errors": errors if errors else None
+    }
+
+
+@app.post("/api/services/{service_name}/update")
+async def update_service(service_name: str, body: ServiceUpdateRequest, db: Session = Depends(get_db)):
+    """
+    Move a service to a new image without downtime
+
+    New containers are started and probed next to the old ones, NPM is
+    switched to them, then the old ones are removed. DNS and the
+    certificate are left untouched.
+    """
+    lock_token = await acquire_service_lock(service_name)
+    try:
+        return await _update_service(service_name, body, db)
+    finally:
+        await lock_manager.release_async(f"service:{service_name}", lock_token)
+
+
+async def _update_service(service_name: str, body: ServiceUpdateRequest, db: Session):
+    service = db.query(Service).filter(Service.service_name == service_name).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    request = _current_request(service)
+    # The new containers run next to the old ones until the switch
+    await check_capacity(
+        service_name, request.get("resources"), request.get("restart_policy"), service.replicas or 1
+    )
+
+    # Pulled before anything is started, so a bad image or registry leaves the service as it is
+    try:
+        await asyncio.to_thread(docker_service.pull_image, body.docker_image)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to pull image {body.docker_image}: {e}")
+
+    outcome = await replica_manager.update_image(
+        {
+            "service_name": service_name,
+            "container_id": service.container_id,
+            "network_name": service.network_name,
+            "internal_port": service.internal_port,
+            "npm_proxy_host_id": service.npm_proxy_host_id
+        },
+        request,
+        body.docker_image
+    )
+    errors = outcome["errors"]
+    if not outcome["switched"]:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Update aborted, the service still runs {service.docker_image}: {'; '.join(errors)}"
+        )
+    return {
+        "success": len(errors) == 0,
+        "service_name": service_name,
+        "docker_image": body.docker_image,
+        "replicas": outcome["replicas"],
+        "message": f"Service updated to {body.docker_image}" if not errors else "Service updated with warnings",
+        "errors": errors if errors else None
+    }
+
+
+@app.get("/api/subnets")
+async def get_subnet_stats(db: Session = Depends(get_db)):
+    """Utilization and fragmentation of the subnet pools"""
+    return await asyncio.to_thread(subnet_manager.stats, db)
+
+
+@app.get("/api/networks")
+async def list_shared_networks():
+    """Pooled networks of shared-network mode, with their address usage"""
+    networks = await asyncio.to_thread(network_pool.stats)
+    return {"mode": settings.network_mode, "count": len(networks), "networks": networks}
+
+
+@app.get("/api/capacity")
+async def get_capacity():
+    """Host capacity, resources committed to managed containers and memory left for new ones"""
+    try:
+        return await asyncio.to_thread(capacity_ledger.snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Docker unavailable: {e}")
+
+
 @app.delete("/api/services/{service_name}")
 async def delete_service(service_name: str, db: Session = Depends(get_db)):
     """Delete a service and cleanup all resources"""
+    lock_token = await acquire_service_lock(service_name)
+    try:
+        return await _delete_service(service_name, db)
+    finally:
+        await lock_manager.release_async(f"service:{service_name}", lock_token)
+
+
+async def _delete_service(service_name: str, db: Session):
     service = db.query(Service).filter(
         Service.service_name == service_name
     ).first()
@@ -538,57 +1179,71 @@ async def delete_service(service_name: str, db: Session = Depends(get_db)):
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
 
-    errors = []
+    # The cleanup steps are recorded with the deletion, so a stopped worker resumes them
+    teardown_id = teardown_queue.enqueue(db, service)
+    db.delete(service)
+    db.commit()
+    provisioning_journal.forget_service(service_name)
+
+    # Containers, NPM and DNS are removed concurrently, then the network and subnet;
+    # whatever is not done after TEARDOWN_WAIT goes on (and is retried) in the background
+    steps = await teardown_queue.run(teardown_id, settings.teardown_wait)
+    errors = [step["error"] for step in steps if step["error"]]
+    if not steps:
+        message = "Service deleted"
+    elif errors:
+        message = "Service deleted with warnings, failed cleanup steps are retried in the background"
+    else:
+        message = "Service deleted, cleanup continues in the background"
 
-    # Cleanup Docker container
-    if service.container_id:
-        if not docker_service.stop_and_remove_container(service.container_id):
-            errors.append("Failed to remove Docker container")
+    return {
+        "success": len(errors) == 0,
+        "message": message,
+        "errors": errors if errors else None,
+        "teardown_id": teardown_id if steps else None,
+        "teardown": steps or None
+    }
 
-    # Cleanup Docker network
-    if service.network_name:
-        if not docker_service.remove_network(service.network_name):
-            errors.append("Failed to remove Docker network")
 
-    # Cleanup NPM proxy host
-    if service.npm_proxy_host_id:
-        npm_service = get_npm_service()
-        if not npm_service.delete_proxy_host(service.npm_proxy_host_id):
-            errors.append("Failed to remove NPM proxy host")
+@app.get("/api/gc")
+async def garbage_collection_report():
+    """Dry run: orphaned resources and what a collection would do with them (nothing is changed)"""
+    return await garbage_collector.report()
 
-    # Cleanup DNS record
-    if service.dns_record_id:
-        dns_service = get_dns_service()
-        if not dns_service.delete_record(service.dns_record_id):
-            errors.append("Failed to remove DNS record")
 
-    # Release subnet
-    if service.subnet:
-        subnet_manager.release_subnet(db, service.subnet)
+@app.post("/api/gc")
+async def collect_garbage_now():
+    """Mark new orphaned resources and remove those orphaned for longer than GC_GRACE_PERIOD"""
+    result = await garbage_collector.collect()
+    if result is None:
+        raise HTTPException(status_code=409, detail="A garbage collection is already running")
+    return result
 
-    # Delete from database
-    db.delete(service)
-    db.commit()
 
-    return {
-        "success": len(errors) == 0,
-        "message": "Service deleted" if not errors else "Service deleted with warnings",
-        "errors": errors if errors else None
-    }
+@app.get("/api/teardowns")
+async def list_teardowns():
+    """Cleanup of deleted services still running or waiting for a retry"""
+    teardowns = await asyncio.to_thread(teardown_queue.list_teardowns)
+    return {"count": len(teardowns), "teardowns": teardowns}
 
 
-@app.delete("/api/dns/records/{record_id}")
-async def delete_dns_record(record_id: str):
-    """Delete a DNS record from configured DNS provider"""
-    try:
-        dns_service = get_dns_service()
-        dns_config = get_dns_config()
+@app.post("/api/teardowns/{teardown_id}/retry")
+async def retry_teardown(teardown_id: str):
+    """Retry the cleanup steps of a deleted service that ran out of attempts"""
+    if not await asyncio.to_thread(teardown_queue.retry, teardown_id):
+        raise HTTPException(status_code=404, detail="No failed teardown step to retry")
+    return {"teardown_id": teardown_id, "steps": await asyncio.to_thread(teardown_queue.steps, teardown_id)}
 
-        # For OVH, convert to int
-        if dns_config['dns_provider'].lower() == "ovh":
-            record_id = int(record_id)
 
-        success = dns_service.delete_record(record_id)
+@app.delete("/api/dns/records/{record_id}")
+async def delete_dns_record(record_id: str, zone: Optional[str] = None):
+    """Delete a DNS record (from the primary zone unless zone is given)"""
+    try:
+        try:
+            dns_service = await zone_registry.get(zone)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e).strip("'\""))
+        success = (await dns_service.batch_delete([record_id]))[0]
         if success:
             return {
                 "success": True,
@@ -599,6 +1254,8 @@ async def delete_dns_record(record_id: str):
                 status_code=500,
                 detail="Failed to delete DNS record"
             )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -608,8 +1265,9 @@ async def delete_npm_host(proxy_host_id: int):
     """Delete an NPM proxy host"""
     try:
         npm_service = get_npm_service()
-        success = npm_service.delete_proxy_host(proxy_host_id)
+        success = await asyncio.to_thread(npm_service.delete_proxy_host, proxy_host_id)
         if success:
+            certificate_queue.forget(proxy_host_id)
             return {
                 "success": True,
                 "message": f"NPM proxy host {proxy_host_id} deleted successfully"
@@ -623,6 +1281,34 @@ async def delete_npm_host(proxy_host_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/export")
+async def export_inventory():
+    """Stream services, subnets, DNS records and NPM hosts as NDJSON"""
+    return StreamingResponse(
+        inventory.export(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=orchestrator-inventory.ndjson"}
+    )
+
+
+@app.post("/api/import")
+async def import_inventory(request: Request, import_id: Optional[str] = None):
+    """
+    Recreate the resources of an NDJSON export (streamed, bounded parallelism)
+
+    Items already handled by an earlier run with the same import_id are
+    skipped, so a failed import is resumed by posting the file again.
+    """
+    import_id = import_id or uuid.uuid4().hex
+    return await inventory.import_lines(iter_lines(request.stream()), import_id)
+
+
+@app.get("/api/import/{import_id}")
+async def get_import_status(import_id: str):
+    """Counts per status and failed items of an import"""
+    return inventory.status(import_id)
+
+
 @app.get("/api/admin/npm-config", response_model=NPMConfigResponse)
 async def get_npm_config_endpoint():
     """Get current NPM configuration (password masked)"""
@@ -654,6 +1340,7 @@ async def update_npm_config(config: NPMConfigUpdateRequest):
             npm_config.npm_password = config.npm_password
 
         db.commit()
+        publish_config_change()
 
         return ConfigUpdateResponse(
             success=True,
@@ -724,6 +1411,7 @@ async def update_dns_config(config: DNSConfigUpdateRequest):
             dns_config.cloudflare_zone_id = config.cloudflare_zone_id
 
         db.commit()
+        publish_config_change()
 
         return ConfigUpdateResponse(
             success=True,
@@ -738,6 +1426,75 @@ async def update_dns_config(config: DNSConfigUpdateRequest):
         db.close()
 
 
+@app.get("/api/admin/dns-zones", response_model=List[DNSZoneInfo])
+async def list_dns_zones():
+    """List every managed DNS zone (the primary zone first)"""
+    zones = await zone_registry.zone_names()
+    names = {id(provider): name for name, provider in zones}
+    return [
+        DNSZoneInfo(
+            id=zone['id'],
+            provider=zone['provider'],
+            zone_name=names.get(id(provider), zone['zone_name']),
+            cloudflare_zone_id=zone['cloudflare_zone_id'],
+            primary=zone['primary']
+        )
+        for zone, provider in zip(get_dns_zones(), zone_registry.providers())
+    ]
+
+
+@app.post("/api/admin/dns-zones", response_model=DNSZoneInfo)
+async def add_dns_zone(request: DNSZoneCreateRequest):
+    """Add a DNS zone managed with the provider credentials of the DNS configuration"""
+    provider = request.provider.lower()
+    if provider not in ("ovh", "cloudflare"):
+        raise HTTPException(status_code=400, detail="Provider must be 'ovh' or 'cloudflare'")
+
+    zone = {
+        'provider': provider,
+        'zone_name': (request.zone_name or "").rstrip('.'),
+        'cloudflare_zone_id': request.cloudflare_zone_id or ""
+    }
+    if provider == "cloudflare" and not zone['cloudflare_zone_id']:
+        raise HTTPException(status_code=400, detail="cloudflare_zone_id is required for Cloudflare zones")
+    if provider == "ovh" and not zone['zone_name']:
+        raise HTTPException(status_code=400, detail="zone_name is required for OVH zones")
+
+    if not zone['zone_name']:
+        zone['zone_name'] = await _build_dns_provider(zone).resolve_zone_name()
+        if not zone['zone_name']:
+            raise HTTPException(status_code=400, detail="Could not resolve the Cloudflare zone name")
+
+    db = SessionLocal()
+    try:
+        row = DNSZone(**zone)
+        db.add(row)
+        db.commit()
+        publish_config_change()
+        return DNSZoneInfo(id=row.id, **zone)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Failed to add DNS zone: {str(e)}")
+    finally:
+        db.close()
+
+
+@app.delete("/api/admin/dns-zones/{zone_id}")
+async def delete_dns_zone(zone_id: int):
+    """Stop managing an additional DNS zone (records are left untouched)"""
+    db = SessionLocal()
+    try:
+        zone = db.query(DNSZone).filter(DNSZone.id == zone_id).first()
+        if not zone:
+            raise HTTPException(status_code=404, detail="DNS zone not found")
+        db.delete(zone)
+        db.commit()
+        publish_config_change()
+        return {"success": True, "message": f"DNS zone {zone.zone_name} removed"}
+    finally:
+        db.close()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -2,6 +2,14 @@ from pydantic import BaseModel, Field
 from typing import Optional, Dict, List
 
 
+class ResourceLimits(BaseModel):
+    """Resource limits and CPU placement of a service container"""
+    cpus: Optional[float] = Field(default=None, gt=0, description="CPU quota in cores, e.g. 0.5")
+    memory_mb: Optional[int] = Field(default=None, gt=0, description="Memory limit in MiB (swap included); reserved by admission control")
+    pids_limit: Optional[int] = Field(default=None, gt=0, description="Maximum number of processes")
+    cpuset_cpus: Optional[str] = Field(default=None, description="CPUs the container is pinned to, e.g. \"0-1\" or \"2,3\"")
+
+
 class ServiceCreateRequest(BaseModel):
     """Request model for creating a new service"""
     service_name: str = Field(..., description="Name of the service (used for subdomain)")
@@ -10,6 +18,22 @@ class ServiceCreateRequest(BaseModel):
     environment_vars: Optional[Dict[str, str]] = Field(default=None, description="Environment variables")
     volumes: Optional[List[str]] = Field(default=None, description="Volume mounts")
     enable_ssl: bool = Field(default=True, description="Enable SSL via Let's Encrypt")
+    domain: Optional[str] = Field(default=None, description="Managed DNS zone (or sub-domain of one) to create the service under; defaults to the primary zone")
+    resources: Optional[ResourceLimits] = Field(default=None, description="Resource limits (unset limits use the host defaults)")
+    restart_policy: Optional[str] = Field(default=None, description="no, on-failure[:N], always or unless-stopped (default from CONTAINER_RESTART_POLICY)")
+    replicas: int = Field(default=1, ge=1, description="Number of containers NPM spreads the requests over")
+    network_mode: Optional[str] = Field(default=None, description="dedicated (own network and subnet) or shared (pooled network, static IP); default from NETWORK_MODE")
+    subnet_prefix: Optional[int] = Field(default=None, description="Prefix length of the service subnet in dedicated mode, e.g. 28 (default from SUBNET_SIZE)")
+
+
+class ServiceScaleRequest(BaseModel):
+    """Request model for scaling a service"""
+    replicas: int = Field(..., ge=1, description="Target number of replicas")
+
+
+class ServiceUpdateRequest(BaseModel):
+    """Request model for updating the image of a service"""
+    docker_image: str = Field(..., description="New Docker image (pulled again even if present, for moving tags)")
 
 
 class ServiceCreateResponse(BaseModel):
@@ -20,9 +44,12 @@ class ServiceCreateResponse(BaseModel):
     container_id: Optional[str] = None
     network_name: Optional[str] = None
     npm_proxy_host_id: Optional[int] = None
-    dns_record_id: Optional[int] = None
+    dns_record_id: Optional[str] = None
     message: str
     errors: Optional[List[str]] = None
+    upstreams: Optional[Dict[str, str]] = Field(default=None, description="Circuit breaker state per upstream")
+    job_id: Optional[int] = Field(default=None, description="Provisioning job (resumable with the same Idempotency-Key)")
+    certificate_status: Optional[str] = Field(default=None, description="Let's Encrypt issuance status (pending, issuing, issued, failed)")
 
 
 class ServiceInfo(BaseModel):
@@ -35,8 +62,11 @@ class ServiceInfo(BaseModel):
     network_name: str
     subnet: str
     internal_port: int
-    npm_proxy_host_id: int
-    dns_record_id: int
+    npm_proxy_host_id: Optional[int] = None
+    dns_record_id: Optional[str] = None
+    dns_zone: Optional[str] = None
+    resources: Optional[Dict] = Field(default=None, description="Limits and restart policy applied to the container")
+    replicas: int = Field(default=1, description="Number of replicas")
     created_at: str
     status: str
 
@@ -50,11 +80,13 @@ class HealthResponse(BaseModel):
     docker_error: Optional[str] = None
     npm_error: Optional[str] = None
     ovh_error: Optional[str] = None
+    breakers: Dict[str, str] = Field(default_factory=dict, description="Circuit breaker state per upstream")
 
 
 class DNSProxyCreateRequest(BaseModel):
     """Request model for creating DNS + NPM host without Docker"""
-    subdomain: str = Field(..., description="Subdomain name")
+    subdomain: str = Field(..., description="Subdomain name, or a full name inside any managed zone")
+    zone: Optional[str] = Field(default=None, description="DNS zone to use (default: chosen by suffix, else the primary zone)")
     create_dns: bool = Field(default=True, description="Create DNS CNAME record")
     cname_target: str = Field(default="@", description="CNAME target (@ for zone root)")
     ttl: int = Field(default=3600, description="TTL in seconds (default 3600 = 1 hour)")
@@ -68,10 +100,12 @@ class DNSProxyCreateResponse(BaseModel):
     success: bool
     subdomain: str
     full_domain: str
-    dns_record_id: Optional[int] = None
+    dns_record_id: Optional[str] = None
     npm_proxy_host_id: Optional[int] = None
     message: str
     errors: Optional[List[str]] = None
+    upstreams: Optional[Dict[str, str]] = Field(default=None, description="Circuit breaker state per upstream")
+    certificate_status: Optional[str] = Field(default=None, description="Let's Encrypt issuance status (pending, issuing, issued, failed)")
 
 
 class NPMConfigResponse(BaseModel):
@@ -122,3 +156,19 @@ class DNSConfigUpdateRequest(BaseModel):
     # Cloudflare fields (optional if using OVH)
     cloudflare_api_token: Optional[str] = Field(default=None, description="Cloudflare API token")
     cloudflare_zone_id: Optional[str] = Field(default=None, description="Cloudflare zone ID")
+
+
+class DNSZoneInfo(BaseModel):
+    """Model for a managed DNS zone"""
+    id: Optional[int] = None
+    provider: str
+    zone_name: str
+    cloudflare_zone_id: str = ""
+    primary: bool = False
+
+
+class DNSZoneCreateRequest(BaseModel):
+    """Request model for adding a DNS zone"""
+    provider: str = Field(..., description="DNS provider: 'ovh' or 'cloudflare'")
+    zone_name: Optional[str] = Field(default=None, description="Zone name (required for OVH, resolved from the zone ID for Cloudflare)")
+    cloudflare_zone_id: Optional[str] = Field(default=None, description="Cloudflare zone ID")
@@ -0,0 +1,80 @@
+"""
+Request-scoped memoization
+
+Each API request runs in a request_scope(). Values read through memoized()
+- configuration snapshots, provider clients, resolved DNS zone names - are
+loaded once per request and reused by every later read in it, including
+reads from threads started with asyncio.to_thread, which share the request
+context. A request therefore sees one consistent configuration even if
+another worker changes it mid-request, and helpers that each look up the
+same client or zone do not repeat the work.
+
+Outside a request, or in a background task that outlives the request that
+started it, memoized() simply calls the loader, so long-running work keeps
+following configuration changes.
+"""
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class RequestScope:
+    """Values memoized for one request"""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.active = True
+        self.hits = 0
+
+
+_scope = contextvars.ContextVar("request_scope", default=None)
+
+
+def _current() -> Optional[RequestScope]:
+    scope = _scope.get()
+    return scope if scope is not None and scope.active else None
+
+
+@contextmanager
+def request_scope():
+    """Memoize reads for the duration of the block (one request)"""
+    scope = RequestScope()
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        # Tasks spawned by the request hold the scope in their copied context
+        scope.active = False
+        scope.values.clear()
+        _scope.reset(token)
+
+
+def memoized(key: str, load: Callable[[], Any]) -> Any:
+    """The value of key for the current request, loaded on first read"""
+    scope = _current()
+    if scope is None:
+        return load()
+    if key in scope.values:
+        scope.hits += 1
+        return scope.values[key]
+    value = scope.values[key] = load()
+    return value
+
+
+async def memoized_async(key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+    """memoized() for a coroutine loader"""
+    scope = _current()
+    if scope is None:
+        return await load()
+    if key in scope.values:
+        scope.hits += 1
+        return scope.values[key]
+    value = scope.values[key] = await load()
+    return value
+
+
+def forget():
+    """Drop the values memoized by the current request (after it changed the configuration)"""
+    scope = _current()
+    if scope is not None:
+        scope.values.clear()
@@ -1,11 +1,58 @@
+from .capacity import CapacityError, CapacityLedger, effective_limits
+from .certificates import CertificateQueue
+from .circuit_breaker import CircuitOpenError, breaker_states, breaker_stats
+from .coordination import InvalidationBus, JobLockManager
+from .dns_index import DNSRecordIndex
+from .dns_provider import DNSProvider
+from .dns_zones import ZoneRegistry
 from .docker_service import DockerService
+from .garbage_collector import GarbageCollector
+from .inventory import Inventory, iter_lines
+from .network_pool import NETWORK_MODES, NetworkPool
+from .npm_index import NPMHostIndex
 from .npm_service import NPMService
-from .ovh_service import OVHService
+from .provisioning import IdempotencyConflict, ProvisioningError, ProvisioningJournal, Provisioner
+from .rate_limiter import background_priority, scheduler_stats
+from .readiness import NotReadyError, ReadinessProbe
+# DNS providers (services.ovh_service, services.cloudflare_service) are not
+# imported here: provider_class() loads the configured one on first use
+from .registry import ClientRegistry, provider_class
+from .replicas import ReplicaManager
 from .subnet_manager import SubnetManager
+from .teardown import TeardownQueue
 
 __all__ = [
+    "CapacityError",
+    "CapacityLedger",
+    "CertificateQueue",
+    "CircuitOpenError",
+    "ClientRegistry",
+    "DNSProvider",
+    "DNSRecordIndex",
     "DockerService",
+    "GarbageCollector",
+    "IdempotencyConflict",
+    "InvalidationBus",
+    "Inventory",
+    "JobLockManager",
+    "NETWORK_MODES",
+    "NPMHostIndex",
     "NPMService",
-    "OVHService",
-    "SubnetManager"
+    "NetworkPool",
+    "NotReadyError",
+    "ProvisioningError",
+    "ProvisioningJournal",
+    "Provisioner",
+    "ReadinessProbe",
+    "ReplicaManager",
+    "SubnetManager",
+    "TeardownQueue",
+    "ZoneRegistry",
+    "background_priority",
+    "breaker_states",
+    "breaker_stats",
+    "effective_limits",
+    "iter_lines",
+    "provider_class",
+    "scheduler_stats"
 ]
@@ -0,0 +1,134 @@
+import ipaddress
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
+Subnet = Union[str, ipaddress.IPv4Network]
+Span = Tuple[int, int]  # First and last address, as integers, both included
+
+
+def span(subnet: Subnet) -> Span:
+    """
+    First and last address of a subnet
+
+    Raises:
+        ValueError: If the subnet is malformed or has host bits set
+    """
+    if isinstance(subnet, ipaddress.IPv4Network):
+        first = int(subnet.network_address)
+        return first, first + subnet.num_addresses - 1
+    # Parsed by hand: building an IPv4Network costs more than the arithmetic itself
+    address, _, prefix = subnet.partition("/")
+    prefix = int(prefix) if prefix else 32
+    first = int(ipaddress.IPv4Address(address))
+    size = 1 << (32 - prefix) if 0 <= prefix <= 32 else 0
+    if not size or first % size:
+        raise ValueError(f"{subnet} is not a valid IPv4 subnet")
+    return first, first + size - 1
+
+
+def host_span(subnet: Subnet) -> Span:
+    """First and last host address (a /31 or /32 has no network or broadcast address)"""
+    first, last = span(subnet)
+    if last - first < 2:
+        return first, last
+    return first + 1, last - 1
+
+
+def to_ip(address: int) -> str:
+    return str(ipaddress.IPv4Address(address))
+
+
+def merge(spans: Iterable[Span]) -> List[Span]:
+    """Sorted, non-overlapping spans covering the same addresses"""
+    merged: List[Span] = []
+    for first, last in sorted(spans):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_ranges(spec: str) -> List[Span]:
+    """
+    Address ranges from their text form
+
+    Args:
+        spec: Comma-separated subnets or first-last ranges, e.g. "172.20.0.0/24, 172.20.9.10-172.20.9.20"
+
+    Raises:
+        ValueError: If a range is malformed or reversed
+    """
+    spans = []
+    for part in (p.strip() for p in spec.split(",")):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (int(ipaddress.IPv4Address(a.strip())) for a in part.split("-", 1))
+            if last < first:
+                raise ValueError(f"Address range '{part}' is reversed")
+            spans.append((first, last))
+        else:
+            spans.append(span(ipaddress.IPv4Network(part, strict=False)))
+    return merge(spans)
+
+
+class AddressPlan:
+    """
+    Host addresses of a subnet, minus reserved ranges, addressed by position
+
+    Positions are computed from the free spans alone, so nothing is
+    materialized: the n-th address of a /8 costs the same as that of a
+    /30.
+    """
+
+    def __init__(self, subnet: Subnet, reserved: Iterable[Span] = ()):
+        self.subnet = str(subnet)
+        first, last = host_span(subnet)
+        self.free: List[Span] = []
+        for r_first, r_last in merge(reserved):
+            if r_last < first or r_first > last:
+                continue
+            if r_first > first:
+                self.free.append((first, r_first - 1))
+            first = max(first, r_last + 1)
+        if first <= last:
+            self.free.append((first, last))
+
+    def __len__(self) -> int:
+        return sum(last - first + 1 for first, last in self.free)
+
+    def position(self, n: int) -> int:
+        """
+        The n-th usable address as an integer (negative: from the end)
+
+        Raises:
+            IndexError: If the plan has fewer addresses
+        """
+        if n < 0:
+            n += len(self)
+        if n >= 0:
+            for first, last in self.free:
+                if n <= last - first:
+                    return first + n
+                n -= last - first + 1
+        raise IndexError(f"{self.subnet} has no usable address at this position")
+
+    def nth(self, n: int) -> str:
+        """The n-th usable address (negative: from the end)"""
+        return to_ip(self.position(n))
+
+    def first_free(self, taken: Set[int]) -> Optional[str]:
+        """The lowest usable address not in taken (walks at most len(taken) + 1 addresses)"""
+        for first, last in self.free:
+            address = first
+            while address <= last and address in taken:
+                address += 1
+            if address <= last:
+                return to_ip(address)
+        return None
+
+
+def container_plan(subnet: Subnet, reserved: Iterable[Span] = ()) -> AddressPlan:
+    """Addresses containers may get on a Docker network: the hosts minus the gateway (first host)"""
+    gateway = host_span(subnet)[0]
+    return AddressPlan(subnet, [(gateway, gateway), *reserved])
@@ -0,0 +1,221 @@
+import threading
+from typing import Dict, List, Optional
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from .docker_service import SERVICE_LABEL
+
+# Labels recording the limits a container was created with, read back by the ledger
+CPUS_LABEL = "docker-orchestrator.cpus"
+MEMORY_LABEL = "docker-orchestrator.memory_mb"
+
+RESTART_POLICIES = ("no", "on-failure", "always", "unless-stopped")
+
+
+class CapacityError(Exception):
+    """Admitting a container would overcommit the host"""
+
+
+def parse_cpuset(value: str) -> List[int]:
+    """
+    CPU numbers of a cpuset ("0-2,5" -> [0, 1, 2, 5])
+
+    Raises:
+        ValueError: If the cpuset is malformed
+    """
+    cpus = set()
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or not (last or first).isdigit():
+            raise ValueError(f"Invalid cpuset '{value}' (expected e.g. \"0-2,5\")")
+        start, end = int(first), int(last or first)
+        if end < start:
+            raise ValueError(f"Invalid CPU range '{part}'")
+        cpus.update(range(start, end + 1))
+    return sorted(cpus)
+
+
+def effective_limits(resources: Optional[Dict], restart_policy: Optional[str] = None) -> Dict:
+    """
+    Limits of a new container: the requested ones over the host defaults
+
+    Args:
+        resources: ResourceLimits of the creation request (as a dictionary)
+        restart_policy: Restart policy of the creation request
+
+    Returns:
+        cpus, memory_mb, pids_limit, cpuset_cpus (None when unlimited) and restart_policy
+    """
+    resources = resources or {}
+    return {
+        "cpus": resources.get("cpus") or settings.container_default_cpus or None,
+        "memory_mb": resources.get("memory_mb") or settings.container_default_memory_mb or None,
+        "pids_limit": resources.get("pids_limit") or settings.container_default_pids_limit or None,
+        "cpuset_cpus": resources.get("cpuset_cpus") or None,
+        "restart_policy": restart_policy or settings.container_restart_policy
+    }
+
+
+def limit_labels(limits: Dict) -> Dict[str, str]:
+    """Container labels recording the CPU and memory limits"""
+    labels = {}
+    if limits.get("cpus"):
+        labels[CPUS_LABEL] = str(limits["cpus"])
+    if limits.get("memory_mb"):
+        labels[MEMORY_LABEL] = str(limits["memory_mb"])
+    return labels
+
+
+class CapacityLedger:
+    """
+    Memory and CPU committed to the managed containers of this host
+
+    The ledger is built from the running containers carrying the service
+    label - their limits are read back from the labels set at creation, so
+    one container list call is enough - plus the reservations of containers
+    being created by this process. A container is admitted only if its
+    memory limit fits in what is left of the host memory (less what is kept
+    for NPM, the orchestrator and the OS, times the overcommit ratio).
+    Containers without a memory limit are counted but cannot be accounted.
+
+    Reservations are per process: with several workers, two creations can
+    still race for the last free memory.
+    """
+
+    def __init__(self, docker_service):
+        self.docker_service = docker_service
+        self._host: Optional[Dict] = None
+        self._reservations: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._admission_lock = threading.Lock()
+
+    def host(self) -> Dict:
+        """CPUs and memory of the host (settings, else as reported by Docker once)"""
+        if self._host is None:
+            info = {}
+            if not (settings.host_cpus and settings.host_memory_mb):
+                info = self.docker_service.host_info()
+            self._host = {
+                "cpus": settings.host_cpus or info.get("NCPU") or 0,
+                "memory_mb": settings.host_memory_mb or (info.get("MemTotal") or 0) // (1024 * 1024)
+            }
+        return dict(self._host)
+
+    def allocatable_memory_mb(self) -> int:
+        """Memory containers may be given in total"""
+        available = self.host()["memory_mb"] - settings.host_reserved_memory_mb
+        return max(int(available * settings.memory_overcommit_ratio), 0)
+
+    def usage(self) -> Dict:
+        """Committed CPU and memory of the running managed containers and pending reservations"""
+        services = []
+        for summary in self.docker_service.list_service_containers():
+            labels = summary.get("Labels") or {}
+            services.append({
+                "container": (summary.get("Names") or [""])[0].lstrip("/"),
+                "service": labels.get(SERVICE_LABEL),
+                "cpus": float(labels[CPUS_LABEL]) if CPUS_LABEL in labels else None,
+                "memory_mb": int(labels[MEMORY_LABEL]) if MEMORY_LABEL in labels else None
+            })
+        with self._lock:
+            reservations = [dict(r) for r in self._reservations.values()]
+
+        everything = services + reservations
+        return {
+            "containers": services,
+            "reservations": reservations,
+            "memory_mb": sum(s["memory_mb"] or 0 for s in everything),
+            "cpus": round(sum(s["cpus"] or 0 for s in everything), 3),
+            "unlimited_memory": sum(1 for s in services if s["memory_mb"] is None)
+        }
+
+    def validate(self, limits: Dict):
+        """
+        Check limits against the host itself
+
+        Raises:
+            ValueError: If a limit is malformed or exceeds the host
+        """
+        policy = (limits.get("restart_policy") or "").split(":")[0]
+        if policy not in RESTART_POLICIES:
+            raise ValueError(f"Restart policy must be one of: {', '.join(RESTART_POLICIES)}")
+        _, retries_given, retries = limits["restart_policy"].partition(":")
+        if retries_given and (policy != "on-failure" or not retries.isdigit()):
+            raise ValueError("Only on-failure takes a retry count (e.g. on-failure:5)")
+
+        host = self.host()
+        if limits.get("cpus") and host["cpus"] and limits["cpus"] > host["cpus"]:
+            raise ValueError(f"{limits['cpus']} CPUs requested, the host has {host['cpus']}")
+        if limits.get("cpuset_cpus"):
+            cpus = parse_cpuset(limits["cpuset_cpus"])
+            if host["cpus"] and cpus[-1] >= host["cpus"]:
+                raise ValueError(f"CPU {cpus[-1]} does not exist (the host has CPUs 0-{host['cpus'] - 1})")
+
+    def _check(self, name: str, limits: Dict, usage: Dict, count: int = 1):
+        if not limits.get("memory_mb"):
+            return
+        memory_mb = limits["memory_mb"] * count
+        allocatable = self.allocatable_memory_mb()
+        committed = usage["memory_mb"] - sum(r["memory_mb"] or 0 for r in usage["reservations"] if r["container"] == name)
+        if committed + memory_mb > allocatable:
+            raise CapacityError(
+                f"Not enough memory for {memory_mb} MiB: {committed} of {allocatable} MiB "
+                f"already committed to managed containers"
+            )
+
+    def check(self, name: str, limits: Dict, count: int = 1):
+        """
+        Check that count containers could be admitted now (without reserving)
+
+        Raises:
+            ValueError: If a limit is malformed or exceeds the host
+            CapacityError: If their memory limits do not fit
+        """
+        self.validate(limits)
+        self._check(name, limits, self.usage(), count)
+
+    def reserve(self, name: str, limits: Dict, service_name: Optional[str] = None):
+        """
+        Admit container name and hold its limits until release(name)
+
+        Raises:
+            ValueError: If a limit is malformed or exceeds the host
+            CapacityError: If its memory limit does not fit
+        """
+        self.validate(limits)
+        # The lock only makes check-and-write atomic and is released before the container is
+        # created; the reservation entry is what keeps later admissions from seeing this
+        # memory as free until release()
+        with self._admission_lock:
+            self._check(name, limits, self.usage())
+            with self._lock:
+                self._reservations[name] = {
+                    "container": name,
+                    "service": service_name or name,
+                    "cpus": limits.get("cpus"),
+                    "memory_mb": limits.get("memory_mb")
+                }
+
+    def release(self, name: str):
+        """Drop the reservation of a container (once created, it is counted from Docker)"""
+        with self._lock:
+            self._reservations.pop(name, None)
+
+    def snapshot(self) -> Dict:
+        """Host capacity, committed resources and what is left"""
+        host = self.host()
+        usage = self.usage()
+        allocatable = self.allocatable_memory_mb()
+        return {
+            "host": host,
+            "reserved_memory_mb": settings.host_reserved_memory_mb,
+            "memory_overcommit_ratio": settings.memory_overcommit_ratio,
+            "allocatable_memory_mb": allocatable,
+            "committed_memory_mb": usage["memory_mb"],
+            "available_memory_mb": max(allocatable - usage["memory_mb"], 0),
+            "committed_cpus": usage["cpus"],
+            "unlimited_memory_containers": usage["unlimited_memory"],
+            "containers": usage["containers"],
+            "reservations": usage["reservations"]
+        }
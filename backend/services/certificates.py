@@ -0,0 +1,340 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from database import CertificateRequest, SessionLocal
+from .rate_limiter import background_priority
+
+logger = logging.getLogger(__name__)
+
+
+def _request_to_dict(row: CertificateRequest) -> Dict:
+    return {
+        "proxy_host_id": row.proxy_host_id,
+        "domain_name": row.domain_name,
+        "status": row.status,
+        "certificate_id": row.certificate_id,
+        "attempts": row.attempts,
+        "error": row.error,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None
+    }
+
+
+def _parse_expiry(value) -> Optional[datetime]:
+    """Parse NPM's expires_on ("2025-01-31 12:00:00" or ISO 8601)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class CertificateIndex:
+    """
+    Index of the certificates NPM already holds, by covered domain
+
+    Exact names and wildcards ("*.example.com", covering exactly one label
+    below example.com) are indexed separately; when several certificates
+    cover a domain the one expiring last wins. The index is rebuilt from the
+    NPM API when older than ttl and updated as certificates are issued.
+    """
+
+    def __init__(self, get_npm_service: Callable, ttl: float = 300.0):
+        self.get_npm_service = get_npm_service
+        self.ttl = ttl
+        self._exact: Dict[str, tuple] = {}
+        self._wildcard: Dict[str, tuple] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _add(self, certificate_id: int, domain_names: List[str], expires: datetime):
+        for domain in domain_names:
+            domain = domain.lower().rstrip('.')
+            if domain.startswith("*."):
+                target, key = self._wildcard, domain[2:]
+            else:
+                target, key = self._exact, domain
+            if key not in target or target[key][1] < expires:
+                target[key] = (certificate_id, expires)
+
+    def refresh(self):
+        """Rebuild the index from the NPM API (expired certificates are skipped)"""
+        certificates = self.get_npm_service().get_certificates()
+        now = datetime.utcnow()
+        with self._lock:
+            self._exact = {}
+            self._wildcard = {}
+            for certificate in certificates:
+                expires = _parse_expiry(certificate.get("expires_on")) or datetime.max
+                if expires <= now:
+                    continue
+                self._add(certificate["id"], certificate.get("domain_names") or [], expires)
+            self._loaded_at = time.monotonic()
+
+    def add(self, certificate_id: int, domain_names: List[str]):
+        """Index a certificate issued by this process (valid for 90 days)"""
+        with self._lock:
+            self._add(certificate_id, domain_names, datetime.utcnow() + timedelta(days=90))
+
+    def snapshot(self) -> Dict[str, int]:
+        """Covered domain -> certificate ID (wildcards as "*.<parent>")"""
+        with self._lock:
+            indexed = {domain: entry[0] for domain, entry in self._exact.items()}
+            indexed.update({f"*.{parent}": entry[0] for parent, entry in self._wildcard.items()})
+        return indexed
+
+    def find(self, domain_name: str) -> Optional[int]:
+        """
+        Get a valid certificate covering domain_name
+
+        Args:
+            domain_name: Full domain name (e.g., app.example.com)
+
+        Returns:
+            NPM certificate ID or None
+        """
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+        domain_name = domain_name.lower().rstrip('.')
+        now = datetime.utcnow()
+        with self._lock:
+            candidates = [self._exact.get(domain_name)]
+            if "." in domain_name:
+                candidates.append(self._wildcard.get(domain_name.split(".", 1)[1]))
+        valid = [c for c in candidates if c and c[1] > now]
+        return max(valid, key=lambda c: c[1])[0] if valid else None
+
+
+class CertificateQueue:
+    """
+    Background Let's Encrypt issuance for proxy hosts
+
+    Proxy hosts are created without a certificate (unless an existing one
+    covers the domain, see CertificateIndex) and enqueued here. A
+    bounded number of issuances run at a time; once NPM returns the
+    certificate it is attached to the host. Status is stored per host in the
+    database (pending, issuing, issued, failed) so every worker sees it, and
+    failed issuances are retried with a growing delay.
+    """
+
+    def __init__(
+        self,
+        get_npm_service: Callable,
+        concurrency: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 60.0
+    ):
+        """
+        Initialize the queue
+
+        Args:
+            get_npm_service: Returns the current NPM client
+            concurrency: Issuances running at the same time
+            max_attempts: Attempts before a request is marked failed
+            retry_delay: Delay before the first retry (doubled on each retry)
+        """
+        self.get_npm_service = get_npm_service
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.index = CertificateIndex(get_npm_service)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    async def find_existing(self, domain_name: str) -> Optional[int]:
+        """Get an existing certificate covering domain_name (wildcards included)"""
+        try:
+            return await asyncio.to_thread(self.index.find, domain_name)
+        except Exception as e:
+            logger.error(
+                "Error looking up certificates: %s", e,
+                extra={"upstream": "npm", "method": "get_certificates", "domain": domain_name}
+            )
+            return None
+
+    def record_reused(self, proxy_host_id: int, domain_name: str, certificate_id: int) -> str:
+        """Track a proxy host created with an existing certificate as issued"""
+        db = SessionLocal()
+        try:
+            row = db.query(CertificateRequest).filter(
+                CertificateRequest.proxy_host_id == proxy_host_id
+            ).first()
+            if not row:
+                row = CertificateRequest(proxy_host_id=proxy_host_id, attempts=0)
+                db.add(row)
+            row.domain_name = domain_name
+            row.status = "issued"
+            row.certificate_id = certificate_id
+            row.error = None
+            db.commit()
+            return "issued"
+        finally:
+            db.close()
+
+    def _spawn(self, request_id: int, delay: float = 0.0):
+        task = asyncio.create_task(self._issue(request_id, delay))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def enqueue(self, proxy_host_id: int, domain_name: str) -> str:
+        """
+        Queue certificate issuance for a proxy host (no-op if already queued or issued)
+
+        Returns:
+            Current status of the host's certificate
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(CertificateRequest).filter(
+                CertificateRequest.proxy_host_id == proxy_host_id
+            ).first()
+            if row and row.status != "failed":
+                return row.status
+
+            if not row:
+                row = CertificateRequest(proxy_host_id=proxy_host_id)
+                db.add(row)
+            row.domain_name = domain_name
+            row.status = "pending"
+            row.attempts = 0
+            row.error = None
+            db.commit()
+            request_id = row.id
+        finally:
+            db.close()
+
+        self._spawn(request_id)
+        return "pending"
+
+    def status(self, proxy_host_id: int) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            row = db.query(CertificateRequest).filter(
+                CertificateRequest.proxy_host_id == proxy_host_id
+            ).first()
+            return _request_to_dict(row) if row else None
+        finally:
+            db.close()
+
+    def list_requests(self) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            rows = db.query(CertificateRequest).order_by(CertificateRequest.id).all()
+            return [_request_to_dict(row) for row in rows]
+        finally:
+            db.close()
+
+    def forget(self, proxy_host_id: int):
+        """Drop the request of a deleted proxy host"""
+        db = SessionLocal()
+        try:
+            db.query(CertificateRequest).filter(
+                CertificateRequest.proxy_host_id == proxy_host_id
+            ).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def resume(self):
+        """Restart pending requests and issuances abandoned by a stopped worker"""
+        stale = datetime.utcnow() - timedelta(seconds=2 * settings.certificate_timeout)
+        db = SessionLocal()
+        try:
+            db.query(CertificateRequest).filter(
+                CertificateRequest.status == "issuing",
+                CertificateRequest.updated_at < stale
+            ).update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+            request_ids = [
+                row.id for row in
+                db.query(CertificateRequest).filter(CertificateRequest.status == "pending").all()
+            ]
+        finally:
+            db.close()
+
+        for request_id in request_ids:
+            self._spawn(request_id)
+
+    def _claim(self, request_id: int) -> Optional[CertificateRequest]:
+        """Move a pending request to issuing; None if another worker took it"""
+        db = SessionLocal()
+        try:
+            claimed = db.query(CertificateRequest).filter(
+                CertificateRequest.id == request_id,
+                CertificateRequest.status == "pending"
+            ).update(
+                {"status": "issuing", "attempts": CertificateRequest.attempts + 1},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return None
+            row = db.query(CertificateRequest).filter(CertificateRequest.id == request_id).first()
+            db.expunge(row)
+            return row
+        finally:
+            db.close()
+
+    def _finish(self, request_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(CertificateRequest).filter(CertificateRequest.id == request_id).update(
+                fields, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _issue(self, request_id: int, delay: float = 0.0):
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            row = self._claim(request_id)
+            if not row:
+                return
+
+            npm_service = self.get_npm_service()
+            with background_priority():
+                # Reuse a certificate issued by an earlier attempt or covering the
+                # domain (e.g. a wildcard) before asking Let's Encrypt for a new one
+                certificate_id = row.certificate_id or await self.find_existing(row.domain_name)
+                if not certificate_id:
+                    certificate_id = await asyncio.to_thread(
+                        npm_service.request_certificate, row.domain_name
+                    )
+                    if certificate_id:
+                        self.index.add(certificate_id, [row.domain_name])
+                attached = bool(certificate_id) and await asyncio.to_thread(
+                    npm_service.attach_certificate, row.proxy_host_id, certificate_id
+                )
+
+        if attached:
+            self._finish(request_id, status="issued", certificate_id=certificate_id, error=None)
+            return
+
+        error = npm_service.last_error if not certificate_id else "Failed to attach certificate"
+        logger.warning(
+            "Certificate attempt %d/%d for %s failed: %s", row.attempts, self.max_attempts, row.domain_name, error,
+            extra={"upstream": "npm", "certificate_request_id": request_id, "proxy_host_id": row.proxy_host_id}
+        )
+        if row.attempts < self.max_attempts:
+            self._finish(request_id, status="pending", certificate_id=certificate_id, error=error)
+            self._spawn(request_id, self.retry_delay * 2 ** (row.attempts - 1))
+        else:
+            self._finish(request_id, status="failed", certificate_id=certificate_id, error=error)
@@ -1,19 +1,34 @@
-import requests
+import logging
 from typing import Optional, List, Dict
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from config import settings
+from tracing import trace_methods
+from .dns_provider import DNSProvider, DEFAULT_RECORD_TYPES, make_record
+from .upstream import UpstreamSession
 
+logger = logging.getLogger(__name__)
 
-class CloudflareService:
+
+@trace_methods(
+    "cloudflare",
+    include=("_fetch_page", "_create_record", "_delete_record", "_batch", "_batch_create", "_batch_delete"),
+    exclude=("get_zone_name", "zone_key")
+)
+class CloudflareService(DNSProvider):
     """Service for Cloudflare DNS API operations"""
 
+    provider_name = "cloudflare"
+    page_size = 100
+
     def __init__(self):
+        super().__init__()
         self.api_token = settings.cloudflare_api_token
         self.zone_id = settings.cloudflare_zone_id
-        self.base_url = "https://api.cloudflare.com/client/v4"
-        self.last_error: Optional[str] = None
+        self.base_url = settings.cloudflare_api_url.rstrip('/')
+        self._zone_info: Optional[Dict] = None
+        self.session = UpstreamSession("cloudflare")
 
     def _get_headers(self) -> Dict[str, str]:
         """Get headers with authentication"""
@@ -22,46 +37,85 @@ class CloudflareService:
             "Content-Type": "application/json"
         }
 
-    def create_a_record(
-        self,
-        subdomain: str,
-        target_ip: str,
-        ttl: int = 3600,
-        proxied: bool = False
-    ) -> Optional[str]:
-        """
-        Create an A record in Cloudflare DNS
+    def _records_url(self) -> str:
+        return f"{self.base_url}/zones/{self.zone_id}/dns_records"
 
-        Args:
-            subdomain: Subdomain name (without the main domain)
-            target_ip: Target IP address
-            ttl: Time to live in seconds (1 = automatic)
-            proxied: Whether to proxy through Cloudflare
+    def _get_zone_info(self) -> Optional[Dict]:
+        """Get zone information (cached for the lifetime of this client)"""
+        if self._zone_info is not None:
+            return self._zone_info
 
-        Returns:
-            Record ID or None if failed
-        """
         try:
-            # Get zone name first
-            zone_info = self._get_zone_info()
-            if not zone_info:
-                return None
+            response = self.session.get(
+                f"{self.base_url}/zones/{self.zone_id}",
+                headers=self._get_headers(),
+                timeout=10
+            )
+            response.raise_for_status()
+            data = response.json()
 
-            zone_name = zone_info.get('name')
-            full_name = f"{subdomain}.{zone_name}" if subdomain else zone_name
+            if data.get('success'):
+                self._zone_info = data['result']
+                return self._zone_info
+            return None
 
-            payload = {
-                "type": "A",
-                "name": full_name,
-                "content": target_ip,
-                "ttl": ttl,
-                "proxied": proxied
-            }
+        except Exception as e:
+            logger.error(
+                "Error getting zone info: %s", e,
+                extra={"upstream": "cloudflare", "method": "_get_zone_info", "zone": self.zone_id}
+            )
+            return None
+
+    def get_zone_name(self) -> Optional[str]:
+        zone_info = self._get_zone_info()
+        return zone_info.get('name') if zone_info else None
+
+    def zone_key(self) -> str:
+        if self._zone_info:
+            return self._zone_info.get('name') or self.zone_id
+        return self.zone_id
 
-            response = requests.post(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records",
+    def _full_name(self, subdomain: str, zone_name: str) -> str:
+        return f"{subdomain}.{zone_name}" if subdomain and subdomain != "@" else zone_name
+
+    def _record_payload(self, record: Dict, zone_name: str) -> Dict:
+        """Build the Cloudflare JSON body for a {type, subdomain, target, ttl} spec"""
+        target = record["target"]
+        if record["type"] == "CNAME":
+            # If target is "@", use the zone name
+            if target == "@":
+                target = zone_name
+            # Cloudflare doesn't require trailing dot for CNAME
+            target = target.rstrip('.')
+
+        return {
+            "type": record["type"],
+            "name": self._full_name(record["subdomain"], zone_name),
+            "content": target,
+            "ttl": record.get("ttl", 3600),
+            "proxied": record.get("proxied", False)
+        }
+
+    def _to_record(self, result: Dict, zone_name: str) -> Dict:
+        return make_record(
+            result.get('id'),
+            result.get('type'),
+            self.split_name(result.get('name', ''), zone_name),
+            result.get('content'),
+            result.get('ttl'),
+            zone_name
+        )
+
+    def _create_record(self, record: Dict) -> Optional[str]:
+        try:
+            zone_name = self.get_zone_name()
+            if not zone_name:
+                return None
+
+            response = self.session.post(
+                self._records_url(),
                 headers=self._get_headers(),
-                json=payload,
+                json=self._record_payload(record, zone_name),
                 timeout=10
             )
 
@@ -71,14 +125,47 @@ class CloudflareService:
             if data.get('success'):
                 return data['result'].get('id')
             else:
-                print(f"Cloudflare API error: {data.get('errors')}")
+                logger.error(
+                    "Cloudflare API error: %s", data.get('errors'),
+                    extra={"upstream": "cloudflare", "method": "_create_record", "zone": self.zone_id}
+                )
                 return None
 
         except Exception as e:
-            print(f"Error creating DNS record: {e}")
+            logger.error(
+                "Error creating %s record: %s", record.get('type'), e,
+                extra={"upstream": "cloudflare", "method": "_create_record", "zone": self.zone_id}
+            )
             self.last_error = str(e)
             return None
 
+    def create_a_record(
+        self,
+        subdomain: str,
+        target_ip: str,
+        ttl: int = 3600,
+        proxied: bool = False
+    ) -> Optional[str]:
+        """
+        Create an A record in Cloudflare DNS
+
+        Args:
+            subdomain: Subdomain name (without the main domain)
+            target_ip: Target IP address
+            ttl: Time to live in seconds (1 = automatic)
+            proxied: Whether to proxy through Cloudflare
+
+        Returns:
+            Record ID or None if failed
+        """
+        return self._create_record({
+            "type": "A",
+            "subdomain": subdomain,
+            "target": target_ip,
+            "ttl": ttl,
+            "proxied": proxied
+        })
+
     def create_cname_record(
         self,
         subdomain: str,
@@ -98,59 +185,101 @@ class CloudflareService:
         Returns:
             Record ID or None if failed
         """
-        try:
-            # Get zone name first
-            zone_info = self._get_zone_info()
-            if not zone_info:
-                return None
-
-            zone_name = zone_info.get('name')
-            full_name = f"{subdomain}.{zone_name}" if subdomain else zone_name
-
-            # If target is "@", use the zone name
-            if target == "@":
-                target = zone_name
+        return self._create_record({
+            "type": "CNAME",
+            "subdomain": subdomain,
+            "target": target,
+            "ttl": ttl,
+            "proxied": proxied
+        })
+
+    def _fetch_page(self, params: Dict, page: int) -> Dict:
+        response = self.session.get(
+            self._records_url(),
+            headers=self._get_headers(),
+            params={**params, "page": page, "per_page": self.page_size},
+            timeout=10
+        )
+        response.raise_for_status()
+        data = response.json()
+        if not data.get('success'):
+            raise Exception(f"Cloudflare API error: {data.get('errors')}")
+        return data
+
+    def _list_records(self, params: Dict) -> List[Dict]:
+        """Get Cloudflare records (all pages), raising on failure"""
+        data = self._fetch_page(params, 1)
+        results = list(data['result'])
+        total_pages = (data.get('result_info') or {}).get('total_pages', 1)
+        for page in range(2, total_pages + 1):
+            results.extend(self._fetch_page(params, page)['result'])
+        return results
+
+    def get_records(self, subdomain: Optional[str] = None, record_type: Optional[str] = 'A') -> List[Dict]:
+        """
+        Get DNS records (all pages)
 
-            # Cloudflare doesn't require trailing dot for CNAME
-            target = target.rstrip('.')
+        Args:
+            subdomain: Filter by subdomain (optional)
+            record_type: Filter by record type (None for every type)
 
-            payload = {
-                "type": "CNAME",
-                "name": full_name,
-                "content": target,
-                "ttl": ttl,
-                "proxied": proxied
-            }
+        Returns:
+            List of Cloudflare record dictionaries
+        """
+        try:
+            params = {}
+            if record_type:
+                params['type'] = record_type
+            if subdomain:
+                zone_name = self.get_zone_name()
+                if zone_name:
+                    params['name'] = self._full_name(subdomain, zone_name)
+            return self._list_records(params)
 
-            response = requests.post(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records",
-                headers=self._get_headers(),
-                json=payload,
-                timeout=10
+        except Exception as e:
+            logger.error(
+                "Error getting DNS records: %s", e,
+                extra={"upstream": "cloudflare", "method": "get_records", "zone": self.zone_id}
             )
+            return []
 
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get('success'):
-                return data['result'].get('id')
-            else:
-                print(f"Cloudflare API error: {data.get('errors')}")
-                return None
-
-        except Exception as e:
-            print(f"Error creating CNAME record: {e}")
-            self.last_error = str(e)
-            return None
+    def _fetch_records(self, record_type: str) -> List[Dict]:
+        zone_name = self.get_zone_name() or self.zone_id
+        return [self._to_record(r, zone_name) for r in self._list_records({'type': record_type})]
+
+    async def list_records(self, types=DEFAULT_RECORD_TYPES) -> List[Dict]:
+        """List records with one paginated listing, filtered by type locally (raises if listing fails)"""
+        types = set(types)
+        if len(types) == 1:
+            return await super().list_records(types)
+
+        zone_name = await self.resolve_zone_name() or self.zone_id
+        first_page = (await self._run_bounded([lambda: self._fetch_page({}, 1)]))[0]
+        pages = [first_page['result']]
+
+        total_pages = (first_page.get('result_info') or {}).get('total_pages', 1)
+        if total_pages > 1:
+            rest = await self._run_bounded([
+                (lambda page=page: self._fetch_page({}, page)['result'])
+                for page in range(2, total_pages + 1)
+            ])
+            pages.extend(rest)
+
+        return [
+            self._to_record(r, zone_name)
+            for page in pages for r in page
+            if r.get('type') in types
+        ]
 
-    def _get_zone_info(self) -> Optional[Dict]:
-        """Get zone information"""
+    def get_record_details(self, record_id: str) -> Optional[Dict]:
+        """Get details of a specific DNS record"""
         try:
-            response = requests.get(
-                f"{self.base_url}/zones/{self.zone_id}",
+            response = self.session.get(
+                f"{self._records_url()}/{record_id}",
                 headers=self._get_headers(),
                 timeout=10
             )
+
             response.raise_for_status()
             data = response.json()
 
@@ -159,64 +288,47 @@ class CloudflareService:
             return None
 
         except Exception as e:
-            print(f"Error getting zone info: {e}")
+            logger.error(
+                "Error getting record details: %s", e,
+                extra={"upstream": "cloudflare", "method": "get_record_details", "record_id": record_id}
+            )
             return None
 
-    def get_records(self, subdomain: Optional[str] = None) -> List[Dict]:
-        """
-        Get DNS records
-
-        Args:
-            subdomain: Filter by subdomain (optional)
-
-        Returns:
-            List of record dictionaries
-        """
+    def _delete_record(self, record_id: str) -> bool:
         try:
-            params = {'type': 'A'}
-            if subdomain:
-                zone_info = self._get_zone_info()
-                if zone_info:
-                    zone_name = zone_info.get('name')
-                    params['name'] = f"{subdomain}.{zone_name}"
-
-            response = requests.get(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records",
+            response = self.session.delete(
+                f"{self._records_url()}/{record_id}",
                 headers=self._get_headers(),
-                params=params,
                 timeout=10
             )
 
             response.raise_for_status()
             data = response.json()
 
-            if data.get('success'):
-                return data['result']
-            return []
+            return data.get('success', False)
 
         except Exception as e:
-            print(f"Error getting DNS records: {e}")
-            return []
+            logger.error(
+                "Error deleting DNS record: %s", e,
+                extra={"upstream": "cloudflare", "method": "_delete_record", "record_id": record_id}
+            )
+            self.last_error = str(e)
+            return False
 
-    def get_record_details(self, record_id: str) -> Optional[Dict]:
-        """Get details of a specific DNS record"""
+    def _record_missing(self, record_id: str) -> bool:
         try:
-            response = requests.get(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}",
+            response = self.session.get(
+                f"{self._records_url()}/{record_id}",
                 headers=self._get_headers(),
                 timeout=10
             )
-
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get('success'):
-                return data['result']
-            return None
-
+            return response.status_code == 404
         except Exception as e:
-            print(f"Error getting record details: {e}")
-            return None
+            logger.error(
+                "Error getting record details: %s", e,
+                extra={"upstream": "cloudflare", "method": "_record_missing", "record_id": record_id}
+            )
+            return False
 
     def delete_record(self, record_id: str) -> bool:
         """
@@ -228,27 +340,62 @@ class CloudflareService:
         Returns:
             True if successful, False otherwise
         """
+        return self._delete_record(str(record_id))
+
+    def _batch(self, payload: Dict) -> Optional[Dict]:
+        """Call the native batch endpoint; None means fall back to per-record calls"""
         try:
-            response = requests.delete(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}",
+            response = self.session.post(
+                f"{self._records_url()}/batch",
                 headers=self._get_headers(),
-                timeout=10
+                json=payload,
+                timeout=30
             )
-
             response.raise_for_status()
             data = response.json()
-
-            return data.get('success', False)
-
+            if data.get('success'):
+                return data['result']
+            logger.warning(
+                "Cloudflare batch API error: %s", data.get('errors'),
+                extra={"upstream": "cloudflare", "method": "_batch", "zone": self.zone_id}
+            )
         except Exception as e:
-            print(f"Error deleting DNS record: {e}")
-            self.last_error = str(e)
-            return False
+            logger.warning(
+                "Error calling Cloudflare batch API: %s", e,
+                extra={"upstream": "cloudflare", "method": "_batch", "zone": self.zone_id}
+            )
+        return None
+
+    async def _batch_create(self, records: List[Dict]) -> List[Optional[str]]:
+        """Create records with a single batch request, one by one if it fails"""
+        if len(records) <= 1:
+            return await super()._batch_create(records)
+
+        zone_name = await self.resolve_zone_name()
+        if not zone_name:
+            return [None] * len(records)
+
+        posts = [self._record_payload(record, zone_name) for record in records]
+        result = (await self._run_bounded([lambda: self._batch({"posts": posts})]))[0]
+        if result is None:
+            return await super()._batch_create(records)
+        return [r.get('id') for r in result.get('posts', [])]
+
+    async def _batch_delete(self, record_ids: List[str]) -> List[bool]:
+        """Delete records with a single batch request, one by one if it fails"""
+        if len(record_ids) <= 1:
+            return await super()._batch_delete(record_ids)
+
+        deletes = [{"id": str(record_id)} for record_id in record_ids]
+        result = (await self._run_bounded([lambda: self._batch({"deletes": deletes})]))[0]
+        if result is None:
+            return await super()._batch_delete(record_ids)
+        return [True] * len(record_ids)
 
     def health_check(self) -> bool:
         """Check if Cloudflare API is accessible"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/zones/{self.zone_id}",
                 headers=self._get_headers(),
                 timeout=5
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import JobLock, SessionLocal
+
+
+class JobLockManager:
+    """Database-backed named locks shared by every worker and replica"""
+
+    def __init__(self, default_ttl: int = 300):
+        """
+        Initialize the lock manager
+
+        Args:
+            default_ttl: Seconds after which an unreleased lock may be taken over
+        """
+        self.default_ttl = default_ttl
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self, name: str, ttl: Optional[int] = None, wait: float = 0.0) -> Optional[str]:
+        """
+        Acquire a named lock
+
+        Args:
+            name: Lock name (e.g. "service:my-app")
+            ttl: Lock lifetime in seconds (defaults to default_ttl)
+            wait: Seconds to keep retrying while the lock is held elsewhere
+
+        Returns:
+            Ownership token to pass to release(), or None if the lock is held
+        """
+        token = f"{self.instance_id}:{uuid.uuid4().hex[:12]}"
+        deadline = time.monotonic() + wait
+
+        while True:
+            if self._try_acquire(name, token, ttl or self.default_ttl):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    async def acquire_async(self, name: str, ttl: Optional[int] = None, wait: float = 0.0) -> Optional[str]:
+        """
+        Acquire a named lock from async code without blocking the event loop
+
+        Same contract as acquire(), but each attempt runs in a worker thread
+        and retries wait with asyncio.sleep.
+        """
+        token = f"{self.instance_id}:{uuid.uuid4().hex[:12]}"
+        deadline = time.monotonic() + wait
+
+        while True:
+            if await asyncio.to_thread(self._try_acquire, name, token, ttl or self.default_ttl):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.05)
+
+    def _try_acquire(self, name: str, token: str, ttl: int) -> bool:
+        """Insert the lock row, or take it over if the previous holder expired"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        db = SessionLocal()
+        try:
+            db.add(JobLock(name=name, owner=token, acquired_at=now, expires_at=expires_at))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+
+            taken = db.query(JobLock).filter(
+                JobLock.name == name,
+                JobLock.expires_at < now
+            ).update(
+                {"owner": token, "acquired_at": now, "expires_at": expires_at},
+                synchronize_session=False
+            )
+            db.commit()
+            return taken == 1
+        finally:
+            db.close()
+
+    def refresh(self, name: str, token: str, ttl: Optional[int] = None) -> bool:
+        """Extend a held lock; returns False if it is no longer owned by token"""
+        db = SessionLocal()
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=ttl or self.default_ttl)
+            updated = db.query(JobLock).filter(
+                JobLock.name == name,
+                JobLock.owner == token
+            ).update({"expires_at": expires_at}, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+
+    def release(self, name: str, token: str) -> bool:
+        """Release a lock previously returned by acquire()"""
+        db = SessionLocal()
+        try:
+            deleted = db.query(JobLock).filter(
+                JobLock.name == name,
+                JobLock.owner == token
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted == 1
+        finally:
+            db.close()
+
+    async def release_async(self, name: str, token: str) -> bool:
+        """Release a lock from async code without blocking the event loop"""
+        return await asyncio.to_thread(self.release, name, token)
+
+
+class InvalidationBus:
+    """
+    File-based pub/sub used to broadcast cache invalidations between workers
+
+    Each topic is a file in a shared directory. Publishing atomically replaces
+    the file, and subscribers detect the change with a single stat() call, so
+    polling on every request is cheap. Point the directory at a shared volume
+    to fan out across replicas.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._seen: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, topic: str) -> str:
+        return os.path.join(self.directory, topic)
+
+    def _stamp(self, topic: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._path(topic))
+            return (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def subscribe(self, topic: str, callback: Callable[[], None]):
+        """Register a callback run when another worker publishes on topic"""
+        with self._lock:
+            self._callbacks.setdefault(topic, []).append(callback)
+            self._seen.setdefault(topic, self._stamp(topic))
+
+    def publish(self, topic: str):
+        """Notify every worker (including this one) that topic changed"""
+        tmp_path = f"{self._path(topic)}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        with open(tmp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self._path(topic))
+
+    def poll(self):
+        """Run callbacks for every topic that changed since the last poll"""
+        changed = []
+        with self._lock:
+            for topic, last_seen in self._seen.items():
+                stamp = self._stamp(topic)
+                if stamp != last_seen:
+                    self._seen[topic] = stamp
+                    changed.append(topic)
+
+        for topic in changed:
+            for callback in self._callbacks.get(topic, []):
+                callback()
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class DNSRecordIndex:
+    """
+    In-memory index of the DNS records of every managed zone, by name
+
+    Filled zone by zone from full listings (ZoneRegistry.list_records) and
+    written through by DNSProvider.batch_create/batch_delete, so lookups
+    never call a provider API. Names are fully qualified and lowercase.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, Dict[Tuple[str, str], Dict]] = {}
+        self._by_key: Dict[Tuple[str, str], Dict] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(record: Dict) -> Tuple[str, str]:
+        return (record["zone"], str(record["id"]))
+
+    def _insert(self, record: Dict):
+        key = self._key(record)
+        self._by_key[key] = record
+        self._by_name.setdefault(record["name"].lower(), {})[key] = record
+
+    def _discard(self, key: Tuple[str, str]):
+        record = self._by_key.pop(key, None)
+        if record:
+            records = self._by_name.get(record["name"].lower(), {})
+            records.pop(key, None)
+            if not records:
+                self._by_name.pop(record["name"].lower(), None)
+
+    def replace_zone(self, zone_name: str, records: List[Dict]):
+        """Replace every indexed record of a zone with a fresh listing"""
+        with self._lock:
+            for key in [key for key in self._by_key if key[0] == zone_name]:
+                self._discard(key)
+            for record in records:
+                self._insert(record)
+            self._loaded_at[zone_name] = time.monotonic()
+
+    def add(self, record: Dict):
+        with self._lock:
+            self._insert(record)
+
+    def remove(self, zone_name: Optional[str], record_id: str):
+        with self._lock:
+            self._discard((zone_name, str(record_id)))
+
+    def lookup(self, name: str) -> List[Dict]:
+        """Records whose fully qualified name is name"""
+        with self._lock:
+            return list(self._by_name.get(name.lower().rstrip('.'), {}).values())
+
+    def age(self, zone_name: str) -> Optional[float]:
+        """Seconds since the zone was last listed (None if never)"""
+        with self._lock:
+            loaded_at = self._loaded_at.get(zone_name)
+        return time.monotonic() - loaded_at if loaded_at is not None else None
@@ -0,0 +1,193 @@
+import asyncio
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_RECORD_TYPES = ("A", "CNAME")
+
+
+def make_record(
+    record_id,
+    record_type: str,
+    subdomain: str,
+    target: str,
+    ttl: Optional[int],
+    zone: str
+) -> Dict:
+    """Build a provider-agnostic DNS record dictionary"""
+    subdomain = subdomain or "@"
+    return {
+        "id": str(record_id),
+        "type": record_type,
+        "subdomain": subdomain,
+        "name": zone if subdomain == "@" else f"{subdomain}.{zone}",
+        "target": target,
+        "ttl": ttl,
+        "zone": zone
+    }
+
+
+class DNSProvider:
+    """
+    Common async interface implemented by every DNS provider
+
+    Providers implement the synchronous primitives (get_zone_name,
+    _fetch_records, _create_record, _delete_record). The async methods run
+    them in worker threads with at most max_concurrency calls in flight;
+    providers with native batch endpoints override _batch_create/_batch_delete.
+    Created and deleted records are written through to record_index when set.
+
+    Record IDs are always strings, and records are dictionaries built by
+    make_record().
+    """
+
+    provider_name = ""
+    max_concurrency = 8
+
+    def __init__(self):
+        self.last_error: Optional[str] = None
+        # Optional DNSRecordIndex kept up to date with our own changes
+        self.record_index = None
+
+    def get_zone_name(self) -> Optional[str]:
+        """Return the zone (domain) name managed by this provider"""
+        raise NotImplementedError
+
+    def zone_key(self) -> str:
+        """Identify the zone without any API call (for logs and error reports)"""
+        raise NotImplementedError
+
+    def _fetch_records(self, record_type: str) -> List[Dict]:
+        """Return all records of one type as make_record() dictionaries, raising if listing fails"""
+        raise NotImplementedError
+
+    def _create_record(self, record: Dict) -> Optional[str]:
+        """Create one record from a {type, subdomain, target, ttl} spec"""
+        raise NotImplementedError
+
+    def _delete_record(self, record_id: str) -> bool:
+        """Delete one record by ID"""
+        raise NotImplementedError
+
+    def _record_missing(self, record_id: str) -> bool:
+        """Whether the provider answers that the record does not exist (an error is not an answer)"""
+        return False
+
+    def health_check(self) -> bool:
+        raise NotImplementedError
+
+    def split_name(self, full_name: str, zone_name: str) -> str:
+        """Turn a fully qualified name into a subdomain relative to zone_name"""
+        full_name = full_name.rstrip('.')
+        if full_name == zone_name:
+            return "@"
+        if full_name.endswith(f".{zone_name}"):
+            return full_name[:-len(f".{zone_name}")]
+        return full_name
+
+    async def _run_bounded(self, calls: Sequence[Callable]) -> List:
+        """Run blocking calls in threads, at most max_concurrency at a time"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(call):
+            async with semaphore:
+                return await asyncio.to_thread(call)
+
+        return await asyncio.gather(*(run(call) for call in calls))
+
+    async def resolve_zone_name(self) -> Optional[str]:
+        """Async wrapper around get_zone_name()"""
+        return await asyncio.to_thread(self.get_zone_name)
+
+    async def list_records(self, types: Iterable[str] = DEFAULT_RECORD_TYPES) -> List[Dict]:
+        """
+        List records of the given types
+
+        Args:
+            types: Record types to include (e.g. ("A", "CNAME"))
+
+        Returns:
+            List of record dictionaries
+
+        Raises:
+            Exception: If the records cannot be listed (an empty list means the zone has none)
+        """
+        results = await self._run_bounded([
+            (lambda record_type=record_type: self._fetch_records(record_type))
+            for record_type in types
+        ])
+        return [record for records in results for record in records]
+
+    async def create_record(
+        self,
+        record_type: str,
+        subdomain: str,
+        target: str,
+        ttl: int = 3600
+    ) -> Optional[str]:
+        """Create a single record and return its ID (None if it failed)"""
+        record_ids = await self.batch_create([{
+            "type": record_type,
+            "subdomain": subdomain,
+            "target": target,
+            "ttl": ttl
+        }])
+        return record_ids[0]
+
+    async def batch_create(self, records: List[Dict]) -> List[Optional[str]]:
+        """
+        Create several records
+
+        Args:
+            records: List of {type, subdomain, target, ttl} dictionaries
+
+        Returns:
+            Record IDs in the same order (None for records that failed)
+        """
+        record_ids = await self._batch_create(records)
+        if self.record_index and any(record_ids):
+            zone_name = await self.resolve_zone_name()
+            for record, record_id in zip(records, record_ids):
+                if record_id and zone_name:
+                    self.record_index.add(make_record(
+                        record_id, record["type"], record["subdomain"],
+                        record["target"], record.get("ttl"), zone_name
+                    ))
+        return record_ids
+
+    async def batch_delete(self, record_ids: List[str], missing_ok: bool = False) -> List[bool]:
+        """
+        Delete several records
+
+        Args:
+            record_ids: IDs of the records to delete
+            missing_ok: Count a record that no longer exists as deleted
+
+        Returns:
+            Success flag for each record, in the same order
+        """
+        results = list(await self._batch_delete(record_ids))
+        if missing_ok and not all(results):
+            failed = [i for i, deleted in enumerate(results) if not deleted]
+            missing = await self._run_bounded([
+                (lambda record_id=record_ids[i]: self._record_missing(str(record_id)))
+                for i in failed
+            ])
+            for i, gone in zip(failed, missing):
+                results[i] = gone
+        if self.record_index and any(results):
+            zone_name = await self.resolve_zone_name()
+            for record_id, deleted in zip(record_ids, results):
+                if deleted:
+                    self.record_index.remove(zone_name, str(record_id))
+        return results
+
+    async def _batch_create(self, records: List[Dict]) -> List[Optional[str]]:
+        return await self._run_bounded([
+            (lambda record=record: self._create_record(record))
+            for record in records
+        ])
+
+    async def _batch_delete(self, record_ids: List[str]) -> List[bool]:
+        return await self._run_bounded([
+            (lambda record_id=record_id: self._delete_record(str(record_id)))
+            for record_id in record_ids
+        ])
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from request_cache import memoized, memoized_async
+from .dns_provider import DNSProvider, DEFAULT_RECORD_TYPES
+
+
+class ZoneRegistry:
+    """
+    Pool of DNS provider clients, one per managed zone
+
+    Each zone keeps its own client (and therefore its own cached zone
+    metadata and HTTP/auth state) until invalidate() is called after a
+    configuration change. Within a request, the clients and resolved zone
+    names are looked up once (see request_cache).
+    """
+
+    def __init__(
+        self,
+        load_zones: Callable[[], List[Dict]],
+        build_provider: Callable[[Dict], DNSProvider],
+        record_index=None
+    ):
+        """
+        Initialize the registry
+
+        Args:
+            load_zones: Returns zone dictionaries (see database.get_dns_zones)
+            build_provider: Builds a provider client for one zone dictionary
+            record_index: Optional DNSRecordIndex refreshed by list_records()
+        """
+        self.load_zones = load_zones
+        self.build_provider = build_provider
+        self.record_index = record_index
+        self._providers: Optional[List[DNSProvider]] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop pooled clients so they are rebuilt from the current config"""
+        with self._lock:
+            self._providers = None
+
+    def providers(self) -> List[DNSProvider]:
+        """Get one client per managed zone, the default zone first"""
+        return list(memoized(f"dns_zones:{id(self)}:providers", self._providers_now))
+
+    def _providers_now(self) -> List[DNSProvider]:
+        with self._lock:
+            if self._providers is None:
+                self._providers = [self.build_provider(zone) for zone in self.load_zones()]
+                for provider in self._providers:
+                    provider.record_index = self.record_index
+            return list(self._providers)
+
+    def default(self) -> DNSProvider:
+        """Get the client of the primary zone"""
+        return self.providers()[0]
+
+    async def zone_names(self) -> List[Tuple[str, DNSProvider]]:
+        """Resolve every zone name concurrently (cached by each client)"""
+        return list(await memoized_async(f"dns_zones:{id(self)}:names", self._resolve_zone_names))
+
+    async def _resolve_zone_names(self) -> List[Tuple[str, DNSProvider]]:
+        providers = self.providers()
+        names = await asyncio.gather(*(p.resolve_zone_name() for p in providers))
+        return [(name, provider) for name, provider in zip(names, providers) if name]
+
+    async def get(self, zone_name: Optional[str]) -> DNSProvider:
+        """
+        Get the client of a zone
+
+        Args:
+            zone_name: Zone name (None for the default zone)
+
+        Returns:
+            DNS provider client
+
+        Raises:
+            KeyError: If the zone is not managed
+        """
+        if not zone_name:
+            return self.default()
+        for name, provider in await self.zone_names():
+            if name == zone_name.rstrip('.'):
+                return provider
+        raise KeyError(f"DNS zone '{zone_name}' is not managed")
+
+    async def resolve(self, name: str, zone_name: Optional[str] = None) -> Tuple[DNSProvider, str, str]:
+        """
+        Pick the zone for a record name by longest suffix match
+
+        A bare label ("my-app") goes to the default zone (or zone_name when
+        given); a dotted name ("my-app.example.org") goes to the most
+        specific managed zone it ends with.
+
+        Args:
+            name: Subdomain label or fully qualified name
+            zone_name: Explicit zone to use instead of suffix matching
+
+        Returns:
+            (provider, subdomain relative to the zone, zone name)
+
+        Raises:
+            KeyError: If no managed zone matches
+        """
+        name = name.rstrip('.')
+        if zone_name or '.' not in name:
+            provider = await self.get(zone_name)
+            resolved = await provider.resolve_zone_name()
+            if not resolved:
+                raise KeyError("Could not resolve DNS zone name")
+            return provider, provider.split_name(name, resolved) if '.' in name else name, resolved
+
+        best = None
+        for candidate, provider in await self.zone_names():
+            if name == candidate or name.endswith(f".{candidate}"):
+                if best is None or len(candidate) > len(best[0]):
+                    best = (candidate, provider)
+
+        if best is None:
+            raise KeyError(f"No managed DNS zone matches '{name}'")
+
+        zone, provider = best
+        return provider, provider.split_name(name, zone), zone
+
+    async def list_records(
+        self,
+        types: Iterable[str] = DEFAULT_RECORD_TYPES
+    ) -> Tuple[List[Dict], Dict[str, str]]:
+        """
+        List records of every zone concurrently and merge them
+
+        Returns:
+            (records, errors keyed by zone) - a failing zone does not hide the others
+        """
+        providers = self.providers()
+        types = tuple(types)
+        results = await asyncio.gather(
+            *(p.list_records(types=types) for p in providers),
+            return_exceptions=True
+        )
+
+        records = []
+        errors = {}
+        for provider, result in zip(providers, results):
+            if isinstance(result, Exception):
+                errors[provider.zone_key()] = str(result)
+            else:
+                records.extend(result)
+                if self.record_index and set(types) >= set(DEFAULT_RECORD_TYPES):
+                    zone_name = await provider.resolve_zone_name()
+                    if zone_name:
+                        self.record_index.replace_zone(
+                            zone_name, [r for r in result if r["type"] in DEFAULT_RECORD_TYPES]
+                        )
+        return records, errors
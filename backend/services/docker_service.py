@@ -1,40 +1,109 @@
-import docker
-from docker.types import IPAMConfig, IPAMPool
-from typing import Optional, Dict, List
+import logging
+import threading
+from typing import TYPE_CHECKING, Optional, Dict, List
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from config import settings
+from tracing import trace_methods
 
+if TYPE_CHECKING:
+    import docker
 
+logger = logging.getLogger(__name__)
+
+
+# Label put on every network and container created for a service
+SERVICE_LABEL = "docker-orchestrator.service"
+
+
+def restart_policy_config(policy: str) -> Dict:
+    """Docker restart policy from its CLI form ("unless-stopped", "on-failure:5", ...)"""
+    name, _, retries = policy.partition(":")
+    config = {"Name": name}
+    if name == "on-failure" and retries:
+        config["MaximumRetryCount"] = int(retries)
+    return config
+
+
+def _sdk():
+    """The Docker SDK, imported on first use rather than at startup"""
+    import docker
+    return docker
+
+
+@trace_methods("docker")
 class DockerService:
-    """Service for Docker operations"""
+    """
+    Service for Docker operations
 
-    def __init__(self):
-        self.client = docker.DockerClient(base_url=settings.docker_host)
+    The Docker client connects on first use (not at construction), so the
+    API starts even when the Docker socket is slow or not there yet.
+    """
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url or settings.docker_host
         self.last_error: Optional[str] = None
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Docker client, connected on first use (a failed connection is retried on the next call)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = _sdk().DockerClient(base_url=self.base_url)
+        return self._client
 
-    def create_network(self, network_name: str, subnet: str) -> docker.models.networks.Network:
+    @property
+    def connected(self) -> bool:
+        """Whether the client has connected (never triggers a connection)"""
+        return self._client is not None
+
+    def create_network(
+        self,
+        network_name: str,
+        subnet: str,
+        labels: Optional[Dict[str, str]] = None
+    ) -> "docker.models.networks.Network":
         """
         Create a Docker network with a specific subnet
 
         Args:
             network_name: Name of the network
             subnet: Subnet in CIDR notation
+            labels: Labels to attach to the network
 
         Returns:
             Docker network object
         """
-        ipam_pool = IPAMPool(subnet=subnet)
-        ipam_config = IPAMConfig(pool_configs=[ipam_pool])
+        types = _sdk().types
+        ipam_pool = types.IPAMPool(subnet=subnet)
+        ipam_config = types.IPAMConfig(pool_configs=[ipam_pool])
 
         network = self.client.networks.create(
             name=network_name,
             driver="bridge",
-            ipam=ipam_config
+            ipam=ipam_config,
+            labels=labels or {}
         )
         return network
 
+    def get_network(self, network_name: str) -> Optional["docker.models.networks.Network"]:
+        """Get a network by name, or None if it does not exist"""
+        try:
+            return self.client.networks.get(network_name)
+        except _sdk().errors.NotFound:
+            return None
+
+    def get_container(self, name: str) -> Optional["docker.models.containers.Container"]:
+        """Get a container by name or ID, or None if it does not exist"""
+        try:
+            return self.client.containers.get(name)
+        except _sdk().errors.NotFound:
+            return None
+
     def create_container(
         self,
         name: str,
@@ -42,8 +111,15 @@ class DockerService:
         network: str,
         internal_port: int,
         environment: Optional[Dict[str, str]] = None,
-        volumes: Optional[List[str]] = None
-    ) -> docker.models.containers.Container:
+        volumes: Optional[List[str]] = None,
+        labels: Optional[Dict[str, str]] = None,
+        cpus: Optional[float] = None,
+        memory_mb: Optional[int] = None,
+        pids_limit: Optional[int] = None,
+        cpuset_cpus: Optional[str] = None,
+        restart_policy: str = "unless-stopped",
+        ipv4_address: Optional[str] = None
+    ) -> "docker.models.containers.Container":
         """
         Create and start a Docker container
 
@@ -54,6 +130,13 @@ class DockerService:
             internal_port: Internal port of the application
             environment: Environment variables
             volumes: Volume mounts
+            labels: Labels to attach to the container
+            cpus: CPU quota in cores (None: unlimited)
+            memory_mb: Memory limit in MiB, swap included (None: unlimited)
+            pids_limit: Maximum number of processes (None: unlimited)
+            cpuset_cpus: CPUs the container may run on (e.g. "0-1,3")
+            restart_policy: Docker restart policy, e.g. "on-failure:5"
+            ipv4_address: Static IP on the network (None: assigned by Docker)
 
         Returns:
             Docker container object
@@ -61,9 +144,8 @@ class DockerService:
         # Pull image if not present
         try:
             self.client.images.get(image)
-        except docker.errors.ImageNotFound:
-            print(f"Pulling image {image}...")
-            self.client.images.pull(image)
+        except _sdk().errors.ImageNotFound:
+            self.pull_image(image)
 
         # Prepare volumes
         volume_dict = {}
@@ -73,6 +155,19 @@ class DockerService:
                 if len(parts) == 2:
                     volume_dict[parts[0]] = {"bind": parts[1], "mode": "rw"}
 
+        limits = {}
+        if cpus:
+            limits["nano_cpus"] = int(cpus * 1e9)
+        if memory_mb:
+            limits["mem_limit"] = f"{memory_mb}m"
+            limits["memswap_limit"] = f"{memory_mb}m"
+        if pids_limit:
+            limits["pids_limit"] = pids_limit
+        if cpuset_cpus:
+            limits["cpuset_cpus"] = cpuset_cpus
+        if ipv4_address:
+            limits["networking_config"] = {network: self.client.api.create_endpoint_config(ipv4_address=ipv4_address)}
+
         # Create container
         container = self.client.containers.run(
             image=image,
@@ -81,11 +176,54 @@ class DockerService:
             network=network,
             environment=environment or {},
             volumes=volume_dict if volume_dict else None,
-            restart_policy={"Name": "unless-stopped"}
+            labels=labels or {},
+            restart_policy=restart_policy_config(restart_policy),
+            **limits
         )
 
         return container
 
+    def pull_image(self, image: str):
+        """Pull an image (again, so a moving tag such as latest is brought up to date)"""
+        logger.info("Pulling image %s", image, extra={"upstream": "docker", "method": "pull_image", "image": image})
+        self.client.images.pull(image)
+
+    def rename_container(self, container_id: str, name: str) -> bool:
+        """Rename a container (running or not)"""
+        try:
+            self.client.api.rename(container_id, name)
+            return True
+        except Exception as e:
+            logger.error(
+                "Error renaming container: %s", e,
+                extra={"upstream": "docker", "method": "rename_container", "container": container_id}
+            )
+            return False
+
+    def list_service_containers(self, include_stopped: bool = False) -> List[Dict]:
+        """
+        Summaries of the running (or, with include_stopped, all) containers created for services
+
+        Uses the container list endpoint only (one call, no per-container
+        inspect): each summary has Id, Names, Image, Labels and State.
+        """
+        return self.client.api.containers(all=include_stopped, filters={"label": SERVICE_LABEL})
+
+    def list_networks(self) -> List[Dict]:
+        """Summaries of every network (Id, Name, Labels, IPAM, ...), from one list call"""
+        return self.client.api.networks()
+
+    def host_info(self) -> Dict:
+        """Docker host information (NCPU, MemTotal, ...)"""
+        return self.client.info()
+
+    def container_state(self, container_id: str) -> Optional[Dict]:
+        """State of a container (Status, Running, ExitCode, Health, ...), or None if it does not exist"""
+        try:
+            return self.client.api.inspect_container(container_id)["State"]
+        except _sdk().errors.NotFound:
+            return None
+
     def get_container_ip(self, container_id: str, network_name: str) -> Optional[str]:
         """Get the IP address of a container on a specific network"""
         try:
@@ -94,7 +232,10 @@ class DockerService:
             if network_name in networks:
                 return networks[network_name]['IPAddress']
         except Exception as e:
-            print(f"Error getting container IP: {e}")
+            logger.error(
+                "Error getting container IP: %s", e,
+                extra={"upstream": "docker", "method": "get_container_ip", "container": container_id}
+            )
         return None
 
     def stop_and_remove_container(self, container_id: str) -> bool:
@@ -105,7 +246,10 @@ class DockerService:
             container.remove()
             return True
         except Exception as e:
-            print(f"Error removing container: {e}")
+            logger.error(
+                "Error removing container: %s", e,
+                extra={"upstream": "docker", "method": "stop_and_remove_container", "container": container_id}
+            )
             return False
 
     def remove_network(self, network_name: str) -> bool:
@@ -115,7 +259,10 @@ class DockerService:
             network.remove()
             return True
         except Exception as e:
-            print(f"Error removing network: {e}")
+            logger.error(
+                "Error removing network: %s", e,
+                extra={"upstream": "docker", "method": "remove_network", "network": network_name}
+            )
             return False
 
     def health_check(self) -> bool:
@@ -0,0 +1,546 @@
+import asyncio
+import ipaddress
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import (
+    NetworkAddress,
+    OrphanedResource,
+    Service,
+    ServiceReplica,
+    SessionLocal,
+    SharedNetwork,
+    Subnet,
+    TeardownStep
+)
+from .docker_service import SERVICE_LABEL
+from .network_pool import SHARED_NETWORK_LABEL
+from .rate_limiter import background_priority
+
+logger = logging.getLogger(__name__)
+
+# Removal order: containers before the networks they are attached to, networks before their subnets
+KINDS = ("container", "address", "network", "subnet", "npm_host", "dns_record")
+
+# Networks created before they were labeled are recognized by name ("<service>-network")
+LEGACY_NETWORK_SUFFIX = "-network"
+
+
+def _text(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _mark_to_dict(row: OrphanedResource) -> Dict:
+    return {
+        "first_seen_at": row.first_seen_at.isoformat() if row.first_seen_at else None,
+        "attempts": row.attempts,
+        "error": row.error
+    }
+
+
+class GarbageCollector:
+    """
+    Removes orchestrator resources that no service owns anymore
+
+    A failed creation or deletion can leave containers, networks, subnets,
+    static IPs, NPM proxy hosts or DNS records behind. The collector lists
+    what the orchestrator could have created - containers and networks
+    with its label (or legacy "<service>-network" networks inside the
+    subnet pools), NPM hosts forwarding into the pools, A records pointing
+    at the server - and subtracts what a service, a provisioning job or a
+    pending teardown still owns.
+
+    Deletion is soft first: an orphan is only recorded, with the time it was
+    first seen. It is removed once it has stayed orphaned for grace_period
+    (a service being provisioned owns its network before its row exists),
+    and forgotten if it gets an owner again. Removals run in batches of
+    batch_size, batch_interval apart, at background priority. report() is a
+    dry run: it lists what a collection would do and changes nothing.
+
+    An A record pointing at the server carries no mark of the orchestrator:
+    it may be the zone apex, www or any other record made by hand. Unowned
+    records are therefore only reported, unless collect_dns is set.
+    """
+
+    LOCK_NAME = "garbage-collector"
+
+    def __init__(
+        self,
+        docker_service,
+        subnet_manager,
+        get_npm_service: Callable,
+        zone_registry,
+        journal,
+        server_public_ip: str,
+        lock_manager=None,
+        certificate_queue=None,
+        network_pool=None,
+        grace_period: float = 3600.0,
+        batch_size: int = 20,
+        batch_interval: float = 1.0,
+        collect_dns: bool = False
+    ):
+        """
+        Initialize the collector
+
+        Args:
+            docker_service: Docker client
+            subnet_manager: Subnet pools and allocations
+            get_npm_service: Returns the current NPM client
+            zone_registry: DNS clients by zone
+            journal: Provisioning journal (jobs own their resources until they finish)
+            server_public_ip: Target of the A records created for services
+            lock_manager: Keeps collections from running on several workers at once
+            certificate_queue: Forgets the certificate request of a removed proxy host
+            network_pool: Releases the static IPs of removed services
+            grace_period: Seconds a resource stays orphaned before it is removed
+            batch_size: Removals running at the same time
+            batch_interval: Seconds between batches
+            collect_dns: Remove unowned A records too, instead of only reporting them
+        """
+        self.docker_service = docker_service
+        self.subnet_manager = subnet_manager
+        self.get_npm_service = get_npm_service
+        self.zone_registry = zone_registry
+        self.journal = journal
+        self.server_public_ip = server_public_ip
+        self.lock_manager = lock_manager
+        self.certificate_queue = certificate_queue
+        self.network_pool = network_pool
+        self.grace_period = grace_period
+        self.batch_size = max(batch_size, 1)
+        self.batch_interval = batch_interval
+        self.collect_dns = collect_dns
+
+    # Ownership
+
+    def _owned(self) -> Dict[str, Set]:
+        """Names, IDs and addresses that a service, a provisioning job or a teardown owns"""
+        owned = {key: set() for key in (
+            "names", "subdomains", "container_ids", "networks", "subnets", "npm_ids", "dns_ids", "ips"
+        )}
+        db = SessionLocal()
+        try:
+            for service in db.query(Service).all():
+                owned["names"].add(service.service_name)
+                owned["subdomains"].add((service.subdomain or "").lower())
+                owned["container_ids"].add(service.container_id)
+                owned["networks"].add(service.network_name)
+                owned["subnets"].add(service.subnet)
+                owned["npm_ids"].add(service.npm_proxy_host_id)
+                owned["dns_ids"].add(_text(service.dns_record_id))
+            for replica in db.query(ServiceReplica).all():
+                owned["container_ids"].add(replica.container_id)
+                owned["ips"].add(replica.container_ip)
+            for network in db.query(SharedNetwork).all():
+                owned["networks"].add(network.network_name)
+                owned["subnets"].add(network.subnet)
+            for step in db.query(TeardownStep).all():
+                owned["names"].add(step.service_name)
+                target = json.loads(step.target or "{}")
+                owned["networks"].add(target.get("network_name"))
+                owned["subnets"].add(target.get("subnet"))
+                owned["npm_ids"].add(target.get("proxy_host_id"))
+                owned["dns_ids"].add(_text(target.get("record_id")))
+        finally:
+            db.close()
+
+        for job in self.journal.list_jobs():
+            owned["names"].add(job["service_name"])
+            owned["subdomains"].add((job["subdomain"] or "").lower())
+            results = {name: step["result"] or {} for name, step in self.journal.steps(job["id"]).items()}
+            owned["subnets"].add(results.get("subnet", {}).get("subnet"))
+            owned["networks"].add(results.get("network", {}).get("network_name"))
+            for replica in results.get("container", {}).get("replicas") or []:
+                owned["container_ids"].add(replica.get("container_id"))
+                owned["ips"].add(replica.get("container_ip"))
+            owned["container_ids"].add(results.get("container", {}).get("container_id"))
+            owned["npm_ids"].add(results.get("npm", {}).get("proxy_host_id"))
+            owned["dns_ids"].add(_text(results.get("dns", {}).get("record_id")))
+
+        for values in owned.values():
+            values.discard(None)
+        return owned
+
+    def _in_pools(self, address: Optional[str]) -> bool:
+        try:
+            network = ipaddress.ip_network(address or "", strict=False)
+        except ValueError:
+            return False
+        return any(network.version == pool.version and network.subnet_of(pool) for pool in self.subnet_manager.pools)
+
+    # Scanning
+
+    def _docker_orphans(self, owned: Dict[str, Set]) -> List[Dict]:
+        orphans = []
+        for container in self.docker_service.list_service_containers(include_stopped=True):
+            service_name = (container.get("Labels") or {}).get(SERVICE_LABEL)
+            if service_name in owned["names"] or container["Id"] in owned["container_ids"]:
+                continue
+            orphans.append({
+                "kind": "container",
+                "resource_id": container["Id"],
+                "name": (container.get("Names") or [""])[0].lstrip("/"),
+                "detail": {"service_name": service_name, "image": container.get("Image")}
+            })
+
+        for network in self.docker_service.list_networks():
+            labels = network.get("Labels") or {}
+            name = network.get("Name")
+            subnets = [config.get("Subnet") for config in (network.get("IPAM") or {}).get("Config") or []]
+            if SHARED_NETWORK_LABEL in labels or name in owned["networks"]:
+                continue
+            if SERVICE_LABEL in labels:
+                service_name = labels[SERVICE_LABEL]
+            elif name.endswith(LEGACY_NETWORK_SUFFIX) and subnets and all(self._in_pools(s) for s in subnets):
+                service_name = name[:-len(LEGACY_NETWORK_SUFFIX)]
+            else:
+                continue
+            if service_name in owned["names"]:
+                continue
+            orphans.append({
+                "kind": "network",
+                "resource_id": name,
+                "name": name,
+                "detail": {"service_name": service_name, "subnets": subnets}
+            })
+        return orphans
+
+    def _database_orphans(self, owned: Dict[str, Set]) -> List[Dict]:
+        orphans = []
+        db = SessionLocal()
+        try:
+            for row in db.query(Subnet).filter(Subnet.in_use == True).all():  # noqa: E712
+                if row.subnet in owned["subnets"] or row.service_name in owned["names"]:
+                    continue
+                orphans.append({
+                    "kind": "subnet",
+                    "resource_id": row.subnet,
+                    "name": row.service_name,
+                    "detail": {"service_name": row.service_name}
+                })
+
+            addresses: Dict[str, List[str]] = {}
+            for row in db.query(NetworkAddress).all():
+                if row.service_name not in owned["names"]:
+                    addresses.setdefault(row.service_name, []).append(row.ip)
+            for service_name, ips in addresses.items():
+                orphans.append({
+                    "kind": "address",
+                    "resource_id": service_name,
+                    "name": service_name,
+                    "detail": {"service_name": service_name, "ips": sorted(ips)}
+                })
+        finally:
+            db.close()
+        return orphans
+
+    def _npm_orphans(self, owned: Dict[str, Set], hosts: List[Dict]) -> List[Dict]:
+        orphans = []
+        for host in hosts:
+            domains = [d.lower() for d in host.get("domain_names") or []]
+            forward_host = host.get("forward_host")
+            if not self._in_pools(forward_host):
+                continue
+            if (
+                host["id"] in owned["npm_ids"]
+                or forward_host in owned["ips"]
+                or any(domain in owned["subdomains"] for domain in domains)
+            ):
+                continue
+            orphans.append({
+                "kind": "npm_host",
+                "resource_id": str(host["id"]),
+                "name": domains[0] if domains else None,
+                "detail": {"domain_names": domains, "forward_host": forward_host}
+            })
+        return orphans
+
+    def _dns_orphans(self, owned: Dict[str, Set], records: List[Dict], served: Set[str]) -> List[Dict]:
+        orphans = []
+        for record in records:
+            name = (record.get("name") or "").lower()
+            if record.get("type") != "A" or record.get("target") != self.server_public_ip:
+                continue
+            if str(record["id"]) in owned["dns_ids"] or name in owned["subdomains"] or name in served:
+                continue
+            orphans.append({
+                "kind": "dns_record",
+                "resource_id": str(record["id"]),
+                "name": name,
+                "detail": {"zone": record.get("zone"), "target": record.get("target")}
+            })
+        return orphans
+
+    async def scan(self) -> Dict:
+        """
+        Find orphaned resources
+
+        A source that cannot be listed is reported in errors and contributes
+        no orphan (DNS records are skipped too when NPM cannot be listed,
+        since a record NPM serves is not an orphan).
+
+        Returns:
+            orphans and errors keyed by source
+        """
+        owned = await asyncio.to_thread(self._owned)
+        orphans, errors = [], {}
+
+        try:
+            orphans.extend(await asyncio.to_thread(self._docker_orphans, owned))
+        except Exception as e:
+            errors["docker"] = str(e)
+        orphans.extend(await asyncio.to_thread(self._database_orphans, owned))
+
+        with background_priority():
+            try:
+                hosts = await asyncio.to_thread(self.get_npm_service().list_proxy_hosts)
+            except Exception as e:
+                errors["npm"] = str(e)
+                hosts = None
+            if hosts is not None:
+                npm_orphans = self._npm_orphans(owned, hosts)
+                orphans.extend(npm_orphans)
+                orphaned_ids = {o["resource_id"] for o in npm_orphans}
+                served = {
+                    domain.lower()
+                    for host in hosts if str(host["id"]) not in orphaned_ids
+                    for domain in host.get("domain_names") or []
+                }
+                records, zone_errors = await self.zone_registry.list_records(types=("A",))
+                errors.update({f"dns:{zone}": error for zone, error in zone_errors.items()})
+                orphans.extend(self._dns_orphans(owned, records, served))
+
+        return {"orphans": orphans, "errors": errors}
+
+    # Marks
+
+    def _marks(self) -> Dict[str, OrphanedResource]:
+        db = SessionLocal()
+        try:
+            rows = db.query(OrphanedResource).all()
+            for row in rows:
+                db.expunge(row)
+            return {row.resource_key: row for row in rows}
+        finally:
+            db.close()
+
+    def _update_marks(self, orphans: List[Dict], scanned_kinds: Set[str]):
+        """Record new orphans, and forget the ones that are gone or owned again"""
+        now = datetime.utcnow()
+        keys = {f"{o['kind']}:{o['resource_id']}": o for o in orphans}
+        db = SessionLocal()
+        try:
+            for row in db.query(OrphanedResource).all():
+                if row.resource_key in keys:
+                    row.last_seen_at = now
+                elif row.kind in scanned_kinds:
+                    db.delete(row)
+            existing = {key for (key,) in db.query(OrphanedResource.resource_key).all()}
+            for key, orphan in keys.items():
+                if key not in existing:
+                    db.add(OrphanedResource(
+                        resource_key=key,
+                        kind=orphan["kind"],
+                        resource_id=orphan["resource_id"],
+                        name=orphan["name"],
+                        detail=json.dumps(orphan["detail"]),
+                        first_seen_at=now,
+                        last_seen_at=now,
+                        attempts=0
+                    ))
+            db.commit()
+        finally:
+            db.close()
+
+    def _collectable(self, orphan: Dict) -> bool:
+        return orphan["kind"] != "dns_record" or self.collect_dns
+
+    def _plan(self, orphans: List[Dict], marks: Dict[str, OrphanedResource]) -> List[Dict]:
+        """Orphans with their mark and what a collection does with them: report, mark, wait or remove"""
+        now = datetime.utcnow()
+        grace = timedelta(seconds=self.grace_period)
+        planned = []
+        for orphan in sorted(orphans, key=lambda o: (KINDS.index(o["kind"]), o["resource_id"])):
+            mark = marks.get(f"{orphan['kind']}:{orphan['resource_id']}")
+            if not self._collectable(orphan):
+                action, eligible_at = "report", None
+            elif not mark:
+                action, eligible_at = "mark", now + grace
+            else:
+                eligible_at = mark.first_seen_at + grace
+                action = "remove" if eligible_at <= now else "wait"
+            planned.append({
+                **orphan,
+                **(_mark_to_dict(mark) if mark else {"first_seen_at": None, "attempts": 0, "error": None}),
+                "eligible_at": eligible_at.isoformat() if eligible_at else None,
+                "action": action
+            })
+        return planned
+
+    @staticmethod
+    def _scanned_kinds(errors: Dict[str, str]) -> Set[str]:
+        kinds = {"subnet", "address"}
+        if "docker" not in errors:
+            kinds |= {"container", "network"}
+        if "npm" not in errors:
+            kinds.add("npm_host")
+            if not any(source.startswith("dns:") for source in errors):
+                kinds.add("dns_record")
+        return kinds
+
+    # Reports and collections
+
+    async def report(self) -> Dict:
+        """Dry run: what a collection would mark, keep waiting on and remove"""
+        scan = await self.scan()
+        marks = await asyncio.to_thread(self._marks)
+        orphans = self._plan(scan["orphans"], marks)
+        return {
+            "dry_run": True,
+            "grace_period": self.grace_period,
+            "counts": {kind: sum(1 for o in orphans if o["kind"] == kind) for kind in KINDS},
+            "orphans": orphans,
+            "errors": scan["errors"] or None
+        }
+
+    async def collect(self) -> Optional[Dict]:
+        """
+        Mark new orphans and remove the ones orphaned for longer than the grace period
+
+        Returns:
+            What was done with every orphan, or None if another worker is collecting
+        """
+        token = None
+        if self.lock_manager:
+            token = await self.lock_manager.acquire_async(self.LOCK_NAME, ttl=3600)
+            if not token:
+                return None
+        try:
+            scan = await self.scan()
+            # Reported-only orphans get no mark (stale ones are dropped), so they never come due
+            await asyncio.to_thread(
+                self._update_marks,
+                [o for o in scan["orphans"] if self._collectable(o)],
+                self._scanned_kinds(scan["errors"])
+            )
+            marks = await asyncio.to_thread(self._marks)
+            orphans = self._plan(scan["orphans"], marks)
+
+            due = [o for o in orphans if o["action"] == "remove"]
+            for start in range(0, len(due), self.batch_size):
+                if start:
+                    await asyncio.sleep(self.batch_interval)
+                batch = due[start:start + self.batch_size]
+                with background_priority():
+                    errors = await self._remove_batch(batch)
+                for orphan, error in zip(batch, errors):
+                    orphan["action"] = "removed" if not error else "failed"
+                    orphan["error"] = error
+                    await asyncio.to_thread(self._settle, orphan, error)
+
+            removed = [o for o in orphans if o["action"] == "removed"]
+            if removed or due:
+                logger.info(
+                    "Garbage collection removed %d of %d due orphans", len(removed), len(due),
+                    extra={"orphans": len(orphans), "removed": len(removed)}
+                )
+            return {
+                "dry_run": False,
+                "grace_period": self.grace_period,
+                "counts": {kind: sum(1 for o in orphans if o["kind"] == kind) for kind in KINDS},
+                "removed": len(removed),
+                "failed": sum(1 for o in orphans if o["action"] == "failed"),
+                "orphans": orphans,
+                "errors": scan["errors"] or None
+            }
+        finally:
+            if token:
+                await self.lock_manager.release_async(self.LOCK_NAME, token)
+
+    def _settle(self, orphan: Dict, error: Optional[str]):
+        db = SessionLocal()
+        try:
+            query = db.query(OrphanedResource).filter(
+                OrphanedResource.resource_key == f"{orphan['kind']}:{orphan['resource_id']}"
+            )
+            if error:
+                query.update(
+                    {"attempts": OrphanedResource.attempts + 1, "error": error},
+                    synchronize_session=False
+                )
+            else:
+                query.delete()
+            db.commit()
+        finally:
+            db.close()
+
+    async def _remove_batch(self, batch: List[Dict]) -> List[Optional[str]]:
+        """Remove a batch concurrently (DNS records with one batch call per zone); an error per orphan"""
+        errors: List[Optional[str]] = [None] * len(batch)
+        records: Dict[Optional[str], List[int]] = {}
+        others = []
+        for i, orphan in enumerate(batch):
+            if orphan["kind"] == "dns_record":
+                records.setdefault(orphan["detail"].get("zone"), []).append(i)
+            else:
+                others.append(i)
+
+        async def remove_records(zone: Optional[str], indexes: List[int]):
+            try:
+                dns_service = await self.zone_registry.get(zone)
+                deleted = await dns_service.batch_delete([batch[i]["resource_id"] for i in indexes], missing_ok=True)
+            except Exception as e:
+                deleted, error = [False] * len(indexes), str(e).strip("'\"")
+            else:
+                error = dns_service.last_error or "Failed to remove DNS record"
+            for i, ok in zip(indexes, deleted):
+                errors[i] = None if ok else error
+
+        outcomes = await asyncio.gather(
+            *(self._remove(batch[i]) for i in others),
+            *(remove_records(zone, indexes) for zone, indexes in records.items()),
+            return_exceptions=True
+        )
+        for i, outcome in zip(others, outcomes):
+            if isinstance(outcome, BaseException):
+                errors[i] = str(outcome) or "Removal failed"
+        return errors
+
+    async def _remove(self, orphan: Dict):
+        """Remove one orphan other than a DNS record; raises on failure"""
+        kind, resource_id = orphan["kind"], orphan["resource_id"]
+        if kind == "container":
+            if not await asyncio.to_thread(self.docker_service.stop_and_remove_container, resource_id):
+                raise Exception("Failed to remove Docker container")
+            if self.network_pool and orphan["name"]:
+                await asyncio.to_thread(self.network_pool.release_ip, orphan["name"])
+
+        elif kind == "address":
+            if self.network_pool:
+                await asyncio.to_thread(self.network_pool.release_service, resource_id)
+
+        elif kind == "network":
+            if not await asyncio.to_thread(self.docker_service.remove_network, resource_id):
+                raise Exception("Failed to remove Docker network (containers still attached?)")
+
+        elif kind == "subnet":
+            await asyncio.to_thread(self._release_subnet, resource_id)
+
+        elif kind == "npm_host":
+            npm_service = self.get_npm_service()
+            if not await asyncio.to_thread(npm_service.delete_proxy_host, int(resource_id), True):
+                raise Exception("Failed to remove NPM proxy host")
+            if self.certificate_queue:
+                await asyncio.to_thread(self.certificate_queue.forget, int(resource_id))
+
+    def _release_subnet(self, subnet: str):
+        db = SessionLocal()
+        try:
+            self.subnet_manager.release_subnet(db, subnet)
+        finally:
+            db.close()
@@ -0,0 +1,388 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import ImportItem, Service, SessionLocal, Subnet
+from .npm_index import project_host
+from .provisioning import IdempotencyConflict, ProvisioningError
+
+EXPORT_VERSION = 1
+
+# Proxy host flags exported with a host and passed back as they were when it is recreated
+NPM_HOST_OPTIONS = (
+    "caching_enabled", "block_exploits", "allow_websocket_upgrade",
+    "http2_support", "hsts_enabled", "hsts_subdomains"
+)
+
+
+def _line(kind: str, data: Dict) -> bytes:
+    return (json.dumps({"kind": kind, "data": data}) + "\n").encode()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without buffering more than one line"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+class Inventory:
+    """
+    Streaming NDJSON export and import of the orchestrator inventory
+
+    An export is one JSON object per line: a "meta" line, then subnets,
+    services, DNS records and NPM proxy hosts. Rows are read from the
+    database in batches and records one zone at a time, so memory does not
+    grow with the size of the inventory.
+
+    An import recreates the items with at most `concurrency` in flight.
+    Every item outcome is stored under the import ID; running the same
+    import again skips the items that already succeeded, so a failed or
+    interrupted import resumes where it stopped. Items that already exist
+    are skipped, and DNS records and proxy hosts belonging to a service are
+    left to that service's provisioning.
+    """
+
+    def __init__(
+        self,
+        zone_registry,
+        npm_host_index,
+        get_npm_service: Callable,
+        subnet_manager,
+        provisioning_journal,
+        provisioner,
+        lock_manager,
+        certificate_queue=None,
+        concurrency: int = 4
+    ):
+        self.zone_registry = zone_registry
+        self.npm_host_index = npm_host_index
+        self.get_npm_service = get_npm_service
+        self.subnet_manager = subnet_manager
+        self.provisioning_journal = provisioning_journal
+        self.provisioner = provisioner
+        self.lock_manager = lock_manager
+        self.certificate_queue = certificate_queue
+        self.concurrency = concurrency
+
+    def _service_domains(self) -> Dict[str, str]:
+        """Subdomain -> service name, to tag records owned by services"""
+        db = SessionLocal()
+        try:
+            return {
+                subdomain.lower(): name
+                for name, subdomain in db.query(Service.service_name, Service.subdomain)
+                if subdomain
+            }
+        finally:
+            db.close()
+
+    async def export(self) -> AsyncIterator[bytes]:
+        """Yield the inventory as NDJSON lines"""
+        yield _line("meta", {"version": EXPORT_VERSION, "exported_at": datetime.utcnow().isoformat()})
+
+        db = SessionLocal()
+        try:
+            for row in db.query(Subnet).filter(Subnet.in_use == True).yield_per(200):
+                yield _line("subnet", {"subnet": row.subnet, "service_name": row.service_name})
+
+            for row in db.query(Service).yield_per(200):
+                yield _line("service", {
+                    "service_name": row.service_name,
+                    "subdomain": row.subdomain,
+                    "dns_zone": row.dns_zone,
+                    "docker_image": row.docker_image,
+                    "internal_port": row.internal_port,
+                    "subnet": row.subnet,
+                    "replicas": row.replicas or 1,
+                    "request": await asyncio.to_thread(self.provisioning_journal.service_request, row.service_name)
+                })
+        finally:
+            db.close()
+
+        service_domains = self._service_domains()
+
+        for zone_name, provider in await self.zone_registry.zone_names():
+            for record in await provider.list_records():
+                yield _line("dns_record", {
+                    **record,
+                    "service": service_domains.get(record["name"].lower())
+                })
+
+        # The full hosts, not the index projections: their settings are exported too
+        for host in await asyncio.to_thread(self.get_npm_service().list_proxy_hosts):
+            owner = next(
+                (service_domains[d.lower()] for d in host["domain_names"] if d.lower() in service_domains),
+                None
+            )
+            yield _line("npm_host", {
+                **project_host(host),
+                **{field: host[field] for field in NPM_HOST_OPTIONS if field in host},
+                "advanced_config": host.get("advanced_config") or "",
+                "access_list_id": host.get("access_list_id") or 0,
+                "service": owner
+            })
+
+    # Import
+
+    @staticmethod
+    def _natural_key(kind: str, data: Dict) -> str:
+        if kind == "subnet":
+            return data["subnet"]
+        if kind == "service":
+            return data["service_name"]
+        if kind == "dns_record":
+            return f"{data['type']}:{data['name']}"
+        if kind == "npm_host":
+            return ",".join(sorted(data["domain_names"]))
+        raise ValueError(f"Unknown inventory item kind '{kind}'")
+
+    def _is_done(self, item_key: str) -> bool:
+        """Whether an earlier run of the import already handled this item"""
+        db = SessionLocal()
+        try:
+            return db.query(ImportItem.id).filter(
+                ImportItem.item_key == item_key,
+                ImportItem.status != "failed"
+            ).first() is not None
+        finally:
+            db.close()
+
+    def _record(self, import_id: str, item_key: str, kind: str, status: str, error: Optional[str] = None):
+        db = SessionLocal()
+        try:
+            row = db.query(ImportItem).filter(ImportItem.item_key == item_key).first()
+            if not row:
+                row = ImportItem(import_id=import_id, item_key=item_key, kind=kind)
+                db.add(row)
+            row.status = status
+            row.error = error
+            db.commit()
+        finally:
+            db.close()
+
+    def status(self, import_id: str) -> Dict:
+        """Counts per status, the failed items of an import and the created items with warnings"""
+        db = SessionLocal()
+        try:
+            counts = {}
+            failed = []
+            warnings = []
+            for row in db.query(ImportItem).filter(ImportItem.import_id == import_id).yield_per(500):
+                counts[row.status] = counts.get(row.status, 0) + 1
+                item = {"kind": row.kind, "key": row.item_key[len(import_id) + len(row.kind) + 2:], "error": row.error}
+                if row.status == "failed" and len(failed) < 100:
+                    failed.append(item)
+                elif row.error and len(warnings) < 100:
+                    warnings.append(item)
+            return {"import_id": import_id, "counts": counts, "failed": failed, "warnings": warnings}
+        finally:
+            db.close()
+
+    async def import_lines(self, lines: AsyncIterator[bytes], import_id: str) -> Dict:
+        """
+        Recreate the items of an NDJSON stream
+
+        Args:
+            lines: NDJSON lines (see iter_lines)
+            import_id: Identifies the import run; reuse it to resume
+
+        Returns:
+            Status of the import (see status())
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+        current_kind = None
+
+        # DNS existence checks read the record index, so make sure it is loaded
+        await self.zone_registry.list_records()
+
+        async def run(kind: str, data: Dict, item_key: str):
+            try:
+                try:
+                    status, error = await self._import_item(kind, data, import_id)
+                except Exception as e:
+                    status, error = "failed", str(e)
+                await asyncio.to_thread(self._record, import_id, item_key, kind, status, error)
+            finally:
+                semaphore.release()
+
+        async for line in lines:
+            try:
+                item = json.loads(line)
+                kind, data = item["kind"], item["data"]
+                if kind == "meta":
+                    continue
+                item_key = f"{import_id}:{kind}:{self._natural_key(kind, data)}"
+            except (ValueError, KeyError, TypeError) as e:
+                await asyncio.to_thread(
+                    self._record, import_id, f"{import_id}:invalid:{line[:80]!r}", "invalid", "failed", str(e)
+                )
+                continue
+
+            if await asyncio.to_thread(self._is_done, item_key):
+                continue
+
+            # Finish a section before the next one starts, so subnets are
+            # reserved before their services are provisioned
+            if kind != current_kind:
+                if in_flight:
+                    await asyncio.gather(*in_flight)
+                current_kind = kind
+
+            await semaphore.acquire()
+            task = asyncio.create_task(run(kind, data, item_key))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        return await asyncio.to_thread(self.status, import_id)
+
+    async def _import_item(self, kind: str, data: Dict, import_id: str) -> Tuple[str, Optional[str]]:
+        """Recreate one item; returns (created|skipped|failed, error)"""
+        if kind == "subnet":
+            return await asyncio.to_thread(self._import_subnet, data)
+        if kind == "service":
+            return await self._import_service(data, import_id)
+        if kind == "dns_record":
+            return await self._import_dns_record(data)
+        if kind == "npm_host":
+            return await self._import_npm_host(data)
+        raise ValueError(f"Unknown inventory item kind '{kind}'")
+
+    def _import_subnet(self, data: Dict) -> Tuple[str, Optional[str]]:
+        if not data.get("service_name"):
+            return "skipped", None
+        db = SessionLocal()
+        try:
+            if self.subnet_manager.get_service_subnet(db, data["service_name"]) == data["subnet"]:
+                return "skipped", None
+            if self.subnet_manager.reserve_subnet(db, data["subnet"], data["service_name"]):
+                return "created", None
+            return "failed", f"Subnet {data['subnet']} is outside the pool or already in use"
+        finally:
+            db.close()
+
+    async def _import_service(self, data: Dict, import_id: str) -> Tuple[str, Optional[str]]:
+        name = data["service_name"]
+        db = SessionLocal()
+        try:
+            if db.query(Service).filter(Service.service_name == name).first():
+                return "skipped", None
+        finally:
+            db.close()
+
+        # Services created before journaling have no stored request
+        request = data.get("request") or {
+            "service_name": name,
+            "docker_image": data["docker_image"],
+            "internal_port": data["internal_port"],
+            "environment_vars": None,
+            "volumes": None,
+            "enable_ssl": True,
+            "domain": None
+        }
+        # The service may have been scaled or updated since it was created
+        request = {
+            **request,
+            "docker_image": data["docker_image"],
+            "replicas": data.get("replicas") or request.get("replicas") or 1
+        }
+        try:
+            job, _ = self.provisioning_journal.start_job(
+                f"import:{import_id}:{name}", name, request, data["subdomain"], data["dns_zone"]
+            )
+        except IdempotencyConflict as e:
+            return "failed", str(e)
+
+        lock_name = f"service:{name}"
+        token = await self.lock_manager.acquire_async(lock_name)
+        if not token:
+            return "failed", f"Service '{name}' is being modified by another request"
+        try:
+            outcome = await self.provisioner.run(
+                job["id"],
+                heartbeat=lambda: self.lock_manager.refresh(lock_name, token)
+            )
+        except ProvisioningError as e:
+            return "failed", f"{e} (provisioning job {e.job_id})"
+        finally:
+            await self.lock_manager.release_async(lock_name, token)
+
+        if outcome["errors"]:
+            return "failed", "; ".join(outcome["errors"])
+        return "created", None
+
+    async def _import_dns_record(self, data: Dict) -> Tuple[str, Optional[str]]:
+        if data.get("service"):
+            return "skipped", None
+
+        record_index = self.zone_registry.record_index
+        if record_index and any(r["type"] == data["type"] for r in record_index.lookup(data["name"])):
+            return "skipped", None
+
+        try:
+            provider = await self.zone_registry.get(data["zone"])
+        except KeyError as e:
+            return "failed", str(e).strip("'\"")
+
+        record_id = await provider.create_record(
+            data["type"],
+            subdomain=data["subdomain"],
+            target=data["target"],
+            ttl=data.get("ttl") or 3600
+        )
+        if not record_id:
+            return "failed", provider.last_error or "DNS record creation returned no ID"
+        return "created", None
+
+    async def _import_npm_host(self, data: Dict) -> Tuple[str, Optional[str]]:
+        if data.get("service") or not data["domain_names"]:
+            return "skipped", None
+
+        domain_names = data["domain_names"]
+        domain = domain_names[0]
+        for name in domain_names:
+            if await asyncio.to_thread(self.npm_host_index.find, name):
+                return "skipped", None
+
+        enable_ssl = bool(data.get("certificate_id"))
+        certificate_id = None
+        if enable_ssl and self.certificate_queue:
+            certificate_id = await self.certificate_queue.find_existing(domain)
+
+        npm_service = self.get_npm_service()
+        proxy_host_id = await asyncio.to_thread(
+            npm_service.create_proxy_host,
+            domain_name=domain,
+            forward_host=data["forward_host"],
+            forward_port=data["forward_port"],
+            enable_ssl=enable_ssl,
+            certificate_id=certificate_id,
+            advanced_config=data.get("advanced_config") or "",
+            domain_names=domain_names,
+            forward_scheme=data.get("forward_scheme") or "http",
+            options={field: data[field] for field in NPM_HOST_OPTIONS if field in data}
+        )
+        if not proxy_host_id:
+            return "failed", "NPM proxy host creation returned no ID"
+
+        if enable_ssl and self.certificate_queue:
+            if certificate_id:
+                self.certificate_queue.record_reused(proxy_host_id, domain, certificate_id)
+            else:
+                self.certificate_queue.enqueue(proxy_host_id, domain)
+        # Access list IDs are local to the NPM instance they were exported from
+        if data.get("access_list_id"):
+            return "created", f"Access list {data['access_list_id']} not restored: attach it again in NPM"
+        return "created", None
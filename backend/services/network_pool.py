@@ -0,0 +1,281 @@
+import ipaddress
+import logging
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from database import NetworkAddress, SessionLocal, SharedNetwork
+from .addressing import container_plan
+
+logger = logging.getLogger(__name__)
+
+NETWORK_MODES = ("dedicated", "shared")
+
+# Label put on the pooled networks
+SHARED_NETWORK_LABEL = "docker-orchestrator.shared-network"
+
+
+def _capacity(subnet: str) -> int:
+    return len(container_plan(subnet))
+
+
+class NetworkPool:
+    """
+    Docker networks shared by many services, with static container IPs
+
+    In shared-network mode a service does not get a bridge network and a
+    subnet of its own: its containers join a pooled network, packed onto
+    the fullest one with room left, and a new pooled network (with a subnet
+    from the subnet manager) is only created when none has. Containers get
+    a static IP, taken from the network_addresses table - the per-network
+    IP index - rather than from Docker, so an address is known before the
+    container exists and is released with it. The addresses of a new
+    service are reserved when its network is picked, so two services
+    provisioned at once cannot both count on the last free addresses.
+    Pooled networks are kept when they empty, for the next services.
+
+    Services on the same pooled network can reach each other.
+    """
+
+    LOCK_NAME = "network-pool"
+
+    def __init__(self, docker_service, subnet_manager, lock_manager=None, name_prefix: str = "shared-network"):
+        self.docker_service = docker_service
+        self.subnet_manager = subnet_manager
+        self.lock_manager = lock_manager
+        self.name_prefix = name_prefix
+        if settings.network_mode not in NETWORK_MODES:
+            raise ValueError(f"NETWORK_MODE must be one of: {', '.join(NETWORK_MODES)}")
+
+    def _lock(self) -> Optional[str]:
+        if not self.lock_manager:
+            return None
+        token = self.lock_manager.acquire(self.LOCK_NAME, ttl=30, wait=10.0)
+        if not token:
+            raise Exception("Network pool is busy, retry")
+        return token
+
+    def _unlock(self, token: Optional[str]):
+        if token:
+            self.lock_manager.release(self.LOCK_NAME, token)
+
+    # Networks
+
+    def is_shared(self, network_name: Optional[str]) -> bool:
+        """Whether a network is a pooled one (and must outlive its services)"""
+        if not network_name:
+            return False
+        db = SessionLocal()
+        try:
+            return db.query(SharedNetwork.id).filter(SharedNetwork.network_name == network_name).first() is not None
+        finally:
+            db.close()
+
+    def _reserve(self, db, network_name: str, subnet: str, service_name: str, container_names: List[str]):
+        """Add the address rows of containers to the session (the caller commits)"""
+        plan = container_plan(subnet)
+        taken = {
+            int(ipaddress.IPv4Address(ip))
+            for (ip,) in db.query(NetworkAddress.ip).filter(NetworkAddress.network_name == network_name)
+        }
+        for container_name in container_names:
+            ip = plan.first_free(taken)
+            if ip is None:
+                raise Exception(f"No free address on {network_name}")
+            taken.add(int(ipaddress.IPv4Address(ip)))
+            db.add(NetworkAddress(
+                address_key=f"{network_name}/{ip}",
+                network_name=network_name,
+                ip=ip,
+                service_name=service_name,
+                container_name=container_name
+            ))
+
+    def acquire(self, service_name: str, container_names: List[str]) -> Dict:
+        """
+        Pick the pooled network for a new service and reserve its container addresses
+
+        The network (its record, if none has room) and the addresses are
+        written in one transaction under the pool lock; allocate_ip() then
+        returns the reserved address of each container. A service that
+        already holds addresses (a resumed job) keeps its network.
+
+        Args:
+            service_name: Service joining the network
+            container_names: Containers the service starts (its replicas)
+
+        Returns:
+            network_name and subnet of the pooled network
+
+        Raises:
+            Exception: If no subnet is left for a new pooled network
+        """
+        count = len(container_names)
+        token = self._lock()
+        db = SessionLocal()
+        try:
+            held = (
+                db.query(SharedNetwork)
+                .join(NetworkAddress, NetworkAddress.network_name == SharedNetwork.network_name)
+                .filter(NetworkAddress.service_name == service_name)
+                .first()
+            )
+            if held:
+                return {"network_name": held.network_name, "subnet": held.subnet}
+
+            used = dict(
+                db.query(NetworkAddress.network_name, func.count(NetworkAddress.id))
+                .group_by(NetworkAddress.network_name).all()
+            )
+            networks = db.query(SharedNetwork).order_by(SharedNetwork.id).all()
+            with_room = [
+                n for n in networks
+                if _capacity(n.subnet) - used.get(n.network_name, 0) >= count
+            ]
+            if with_room:
+                best = max(with_room, key=lambda n: used.get(n.network_name, 0))
+                self._reserve(db, best.network_name, best.subnet, service_name, container_names)
+                db.commit()
+                return {"network_name": best.network_name, "subnet": best.subnet}
+
+            names = {n.network_name for n in networks}
+            network_name = next(
+                f"{self.name_prefix}-{i}" for i in range(len(names) + 1)
+                if f"{self.name_prefix}-{i}" not in names
+            )
+            # Reuse a subnet reserved for the network by an import
+            subnet = self.subnet_manager.get_service_subnet(db, network_name)
+            if not subnet:
+                subnet = self.subnet_manager.allocate_subnet(db, network_name, settings.shared_network_size)
+            if not subnet:
+                raise Exception("No available subnets")
+            if _capacity(subnet) < count:
+                raise Exception(f"A {subnet} network cannot hold {count} containers")
+
+            db.add(SharedNetwork(network_name=network_name, subnet=subnet))
+            self._reserve(db, network_name, subnet, service_name, container_names)
+            db.commit()
+            logger.info(
+                "Pooled network %s created", network_name,
+                extra={"network": network_name, "subnet": subnet, "service": service_name}
+            )
+            return {"network_name": network_name, "subnet": subnet}
+        finally:
+            db.close()
+            self._unlock(token)
+
+    def ensure(self, network_name: str, subnet: str):
+        """Create the Docker network of a pooled network unless it exists"""
+        if self.docker_service.get_network(network_name):
+            return
+        try:
+            self.docker_service.create_network(network_name, subnet, {SHARED_NETWORK_LABEL: network_name})
+        except Exception:
+            # Created concurrently by another service joining it
+            if not self.docker_service.get_network(network_name):
+                raise
+
+    # Addresses
+
+    def allocate_ip(self, network_name: str, service_name: str, container_name: str) -> str:
+        """
+        Claim the lowest free IP of a pooled network for a container
+
+        A container that already has an address on the network keeps it.
+
+        Raises:
+            Exception: If the network is full
+        """
+        db = SessionLocal()
+        try:
+            existing = db.query(NetworkAddress).filter(
+                NetworkAddress.container_name == container_name,
+                NetworkAddress.network_name == network_name
+            ).first()
+            if existing:
+                return existing.ip
+
+            shared = db.query(SharedNetwork).filter(SharedNetwork.network_name == network_name).first()
+            if not shared:
+                raise Exception(f"{network_name} is not a pooled network")
+            plan = container_plan(shared.subnet)
+
+            # Another worker may claim the same address between the read and the insert
+            for _ in range(5):
+                taken = {
+                    int(ipaddress.IPv4Address(ip))
+                    for (ip,) in db.query(NetworkAddress.ip).filter(NetworkAddress.network_name == network_name)
+                }
+                ip = plan.first_free(taken)
+                if ip is None:
+                    raise Exception(f"No free address on {network_name}")
+                try:
+                    db.add(NetworkAddress(
+                        address_key=f"{network_name}/{ip}",
+                        network_name=network_name,
+                        ip=ip,
+                        service_name=service_name,
+                        container_name=container_name
+                    ))
+                    db.commit()
+                    return ip
+                except IntegrityError:
+                    db.rollback()
+            raise Exception(f"Could not claim an address on {network_name}, retry")
+        finally:
+            db.close()
+
+    def release_ip(self, container_name: str) -> bool:
+        """Free the address of a container (once it is removed)"""
+        db = SessionLocal()
+        try:
+            released = db.query(NetworkAddress).filter(NetworkAddress.container_name == container_name).delete()
+            db.commit()
+            return released > 0
+        finally:
+            db.close()
+
+    def rename(self, container_name: str, new_name: str):
+        """Follow a container rename"""
+        db = SessionLocal()
+        try:
+            db.query(NetworkAddress).filter(NetworkAddress.container_name == container_name).update(
+                {"container_name": new_name}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def release_service(self, service_name: str) -> int:
+        """Free every address left to a service"""
+        db = SessionLocal()
+        try:
+            released = db.query(NetworkAddress).filter(NetworkAddress.service_name == service_name).delete()
+            db.commit()
+            return released
+        finally:
+            db.close()
+
+    def stats(self) -> List[Dict]:
+        """Pooled networks with their address usage and services"""
+        db = SessionLocal()
+        try:
+            addresses: Dict[str, List[NetworkAddress]] = {}
+            for row in db.query(NetworkAddress).all():
+                addresses.setdefault(row.network_name, []).append(row)
+            return [
+                {
+                    "network_name": n.network_name,
+                    "subnet": n.subnet,
+                    "capacity": _capacity(n.subnet),
+                    "used": len(addresses.get(n.network_name, [])),
+                    "services": sorted({a.service_name for a in addresses.get(n.network_name, [])}),
+                    "created_at": n.created_at.isoformat() if n.created_at else None
+                }
+                for n in db.query(SharedNetwork).order_by(SharedNetwork.id).all()
+            ]
+        finally:
+            db.close()
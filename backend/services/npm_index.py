@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def project_host(host: Dict) -> Dict:
+    """Reduce an NPM proxy host to the fields the API and frontend use"""
+    return {
+        "id": host.get("id"),
+        "domain_names": list(host.get("domain_names") or []),
+        "forward_scheme": host.get("forward_scheme", "http"),
+        "forward_host": host.get("forward_host"),
+        "forward_port": host.get("forward_port"),
+        "certificate_id": host.get("certificate_id") or 0,
+        "ssl_forced": bool(host.get("ssl_forced")),
+        "enabled": bool(host.get("enabled", True)),
+        "created_on": host.get("created_on")
+    }
+
+
+class NPMHostIndex:
+    """
+    In-memory index of NPM proxy hosts, by host ID and by domain name
+
+    Holds projections (see project_host) rather than the full NPM objects.
+    The index is reloaded from the NPM API once older than ttl - concurrent
+    readers of a stale index wait for a single reload - and our own
+    create/update/delete calls are written through so they show up at once.
+    Changes made directly in NPM, or by another worker, appear after ttl.
+    """
+
+    def __init__(self, get_npm_service: Callable, ttl: float = 30.0):
+        self.get_npm_service = get_npm_service
+        self.ttl = ttl
+        self._by_id: Dict[int, Dict] = {}
+        self._by_domain: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        with self._reload_lock:
+            if self._is_fresh():
+                return
+            try:
+                hosts = self.get_npm_service().list_proxy_hosts()
+            except Exception as e:
+                if self._loaded_at is None:
+                    raise
+                # Keep serving the last known hosts while NPM is unreachable
+                logger.warning(
+                    "Error reloading NPM proxy hosts, serving cached list: %s", e,
+                    extra={"upstream": "npm", "method": "list_proxy_hosts"}
+                )
+                with self._lock:
+                    self._loaded_at = time.monotonic()
+                return
+            by_id = {host["id"]: project_host(host) for host in hosts}
+            by_domain = {
+                domain.lower(): host_id
+                for host_id, host in by_id.items()
+                for domain in host["domain_names"]
+            }
+            with self._lock:
+                self._by_id = by_id
+                self._by_domain = by_domain
+                self._loaded_at = time.monotonic()
+
+    def hosts(self) -> List[Dict]:
+        """All proxy host projections, ordered by ID"""
+        self._ensure_loaded()
+        with self._lock:
+            return [self._by_id[host_id] for host_id in sorted(self._by_id)]
+
+    def get(self, proxy_host_id: int) -> Optional[Dict]:
+        self._ensure_loaded()
+        with self._lock:
+            return self._by_id.get(proxy_host_id)
+
+    def find(self, domain_name: str, reload: bool = True) -> Optional[Dict]:
+        """Get the proxy host serving domain_name, or None (reload=False never calls NPM)"""
+        if reload:
+            self._ensure_loaded()
+        with self._lock:
+            host_id = self._by_domain.get(domain_name.lower())
+            return self._by_id.get(host_id) if host_id is not None else None
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last reload (None if never loaded)"""
+        with self._lock:
+            loaded_at = self._loaded_at
+        return time.monotonic() - loaded_at if loaded_at is not None else None
+
+    def put(self, host: Dict):
+        """Write a created or updated host through to the index"""
+        projection = project_host(host)
+        with self._lock:
+            previous = self._by_id.get(projection["id"])
+            if previous:
+                for domain in previous["domain_names"]:
+                    self._by_domain.pop(domain.lower(), None)
+            self._by_id[projection["id"]] = projection
+            for domain in projection["domain_names"]:
+                self._by_domain[domain.lower()] = projection["id"]
+
+    def update(self, proxy_host_id: int, **fields):
+        """Apply a partial update (e.g. certificate attached) to an indexed host"""
+        with self._lock:
+            current = self._by_id.get(proxy_host_id)
+        if current:
+            self.put({**current, **fields})
+
+    def remove(self, proxy_host_id: int):
+        with self._lock:
+            host = self._by_id.pop(proxy_host_id, None)
+            if host:
+                for domain in host["domain_names"]:
+                    if self._by_domain.get(domain.lower()) == proxy_host_id:
+                        del self._by_domain[domain.lower()]
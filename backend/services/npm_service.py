@@ -1,11 +1,17 @@
+import logging
 import requests
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from config import settings
+from tracing import trace_methods
+from .upstream import UpstreamSession
 
+logger = logging.getLogger(__name__)
 
+
+@trace_methods("npm")
 class NPMService:
     """Service for Nginx Proxy Manager API operations"""
 
@@ -15,11 +21,14 @@ class NPMService:
         self.password = settings.npm_password
         self.token: Optional[str] = None
         self.last_error: Optional[str] = None
+        self.session = UpstreamSession("npm")
+        # Optional NPMHostIndex kept up to date with our own changes
+        self.host_index = None
 
     def authenticate(self) -> bool:
         """Authenticate with NPM and get access token"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/tokens",
                 json={
                     "identity": self.email,
@@ -35,11 +44,17 @@ class NPMService:
         except requests.exceptions.HTTPError as e:
             error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
             self.last_error = f"Auth failed - {error_msg}"
-            print(f"NPM authentication error: {self.last_error}")
+            logger.error(
+                "NPM authentication error: %s", self.last_error,
+                extra={"upstream": "npm", "method": "authenticate"}
+            )
             return False
         except Exception as e:
             self.last_error = f"Auth error: {str(e)}"
-            print(f"NPM authentication error: {self.last_error}")
+            logger.error(
+                "NPM authentication error: %s", self.last_error,
+                extra={"upstream": "npm", "method": "authenticate"}
+            )
             return False
 
     def _get_headers(self) -> Dict[str, str]:
@@ -51,37 +66,62 @@ class NPMService:
             "Content-Type": "application/json"
         }
 
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send an authenticated request, re-authenticating once if the token expired"""
+        response = self.session.request(
+            method, f"{self.base_url}{path}", headers=self._get_headers(), **kwargs
+        )
+        if response.status_code == 401:
+            self.token = None
+            response = self.session.request(
+                method, f"{self.base_url}{path}", headers=self._get_headers(), **kwargs
+            )
+        return response
+
     def create_proxy_host(
         self,
         domain_name: str,
         forward_host: str,
         forward_port: int,
-        enable_ssl: bool = True
+        enable_ssl: bool = True,
+        certificate_id: Optional[int] = None,
+        advanced_config: str = "",
+        domain_names: Optional[List[str]] = None,
+        forward_scheme: str = "http",
+        options: Optional[Dict] = None
     ) -> Optional[int]:
         """
         Create a proxy host in NPM
 
+        No certificate is requested here: Let's Encrypt issuance is slow, so
+        callers queue it (see services.certificates) and attach it when ready.
+
         Args:
             domain_name: Full domain name (e.g., app.example.com)
             forward_host: IP address of the container
             forward_port: Port of the container
-            enable_ssl: Whether to enable SSL with Let's Encrypt
+            enable_ssl: Whether to force SSL with the given certificate
+            certificate_id: Existing NPM certificate to attach right away
+            advanced_config: Custom nginx directives of the server block
+            domain_names: Every domain the host serves, when more than domain_name
+            forward_scheme: Scheme of the container (http or https)
+            options: Other proxy host fields overriding the defaults (e.g. allow_websocket_upgrade)
 
         Returns:
             Proxy host ID or None if failed
         """
         try:
             payload = {
-                "domain_names": [domain_name],
+                "domain_names": list(domain_names or [domain_name]),
                 "forward_host": forward_host,
                 "forward_port": forward_port,
-                "forward_scheme": "http",
+                "forward_scheme": forward_scheme,
                 "access_list_id": 0,
                 "certificate_id": 0,
                 "ssl_forced": False,
                 "caching_enabled": False,
                 "block_exploits": True,
-                "advanced_config": "",
+                "advanced_config": advanced_config,
                 "meta": {
                     "letsencrypt_agree": False,
                     "dns_challenge": False
@@ -89,62 +129,178 @@ class NPMService:
                 "allow_websocket_upgrade": True,
                 "http2_support": True,
                 "hsts_enabled": False,
-                "hsts_subdomains": False
+                "hsts_subdomains": False,
+                **(options or {})
             }
 
-            # If SSL is enabled, configure Let's Encrypt
-            if enable_ssl:
+            # Attach an already issued certificate
+            if enable_ssl and certificate_id:
+                payload["certificate_id"] = certificate_id
                 payload["ssl_forced"] = True
-                payload["meta"]["letsencrypt_agree"] = True
-                payload["meta"]["letsencrypt_email"] = self.email
-                payload["certificate_id"] = "new"
-
-            response = requests.post(
-                f"{self.base_url}/api/nginx/proxy-hosts",
-                headers=self._get_headers(),
-                json=payload
-            )
+
+            response = self._request("POST", "/api/nginx/proxy-hosts", json=payload)
             response.raise_for_status()
             data = response.json()
+            if self.host_index and data.get("id"):
+                self.host_index.put({**payload, **data})
             return data.get("id")
 
         except Exception as e:
-            print(f"Error creating proxy host: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response: {e.response.text}")
+            logger.error("Error creating proxy host: %s", e, extra={
+                "upstream": "npm",
+                "method": "create_proxy_host",
+                "domain": domain_name,
+                "response": e.response.text if getattr(e, 'response', None) is not None else None
+            })
             return None
 
-    def get_proxy_hosts(self) -> list:
-        """Get all proxy hosts"""
+    def request_certificate(self, domain_name: str) -> Optional[int]:
+        """
+        Request a Let's Encrypt certificate (blocks while NPM runs the ACME challenge)
+
+        Args:
+            domain_name: Domain the certificate is issued for
+
+        Returns:
+            Certificate ID or None if failed
+        """
         try:
-            response = requests.get(
-                f"{self.base_url}/api/nginx/proxy-hosts",
-                headers=self._get_headers()
+            response = self._request(
+                "POST",
+                "/api/nginx/certificates",
+                json={
+                    "provider": "letsencrypt",
+                    "nice_name": domain_name,
+                    "domain_names": [domain_name],
+                    "meta": {
+                        "letsencrypt_email": self.email,
+                        "letsencrypt_agree": True,
+                        "dns_challenge": False
+                    }
+                },
+                timeout=settings.certificate_timeout
             )
             response.raise_for_status()
+            return response.json().get("id")
+
+        except Exception as e:
+            self.last_error = f"Certificate request failed: {str(e)}"
+            logger.error("Error requesting certificate: %s", e, extra={
+                "upstream": "npm",
+                "method": "request_certificate",
+                "domain": domain_name,
+                "response": e.response.text if getattr(e, 'response', None) is not None else None
+            })
+            return None
+
+    def get_certificates(self) -> list:
+        """Get all certificates known to NPM"""
+        try:
+            response = self._request("GET", "/api/nginx/certificates")
+            response.raise_for_status()
             return response.json()
         except Exception as e:
-            print(f"Error getting proxy hosts: {e}")
+            logger.error("Error getting certificates: %s", e, extra={"upstream": "npm", "method": "get_certificates"})
             return []
 
-    def delete_proxy_host(self, proxy_host_id: int) -> bool:
-        """Delete a proxy host"""
+    def attach_certificate(self, proxy_host_id: int, certificate_id: int) -> bool:
+        """Switch a proxy host to HTTPS with an issued certificate"""
         try:
-            response = requests.delete(
-                f"{self.base_url}/api/nginx/proxy-hosts/{proxy_host_id}",
-                headers=self._get_headers()
+            response = self._request(
+                "PUT",
+                f"/api/nginx/proxy-hosts/{proxy_host_id}",
+                json={
+                    "certificate_id": certificate_id,
+                    "ssl_forced": True,
+                    "http2_support": True
+                }
             )
             response.raise_for_status()
+            if self.host_index:
+                self.host_index.update(proxy_host_id, certificate_id=certificate_id, ssl_forced=True)
+            return True
+        except Exception as e:
+            logger.error("Error attaching certificate: %s", e, extra={
+                "upstream": "npm",
+                "method": "attach_certificate",
+                "proxy_host_id": proxy_host_id
+            })
+            return False
+
+    def get_proxy_host(self, proxy_host_id: int) -> Optional[Dict]:
+        """Get a proxy host with all its fields (advanced_config included), or None"""
+        try:
+            response = self._request("GET", f"/api/nginx/proxy-hosts/{proxy_host_id}")
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error("Error getting proxy host: %s", e, extra={
+                "upstream": "npm",
+                "method": "get_proxy_host",
+                "proxy_host_id": proxy_host_id
+            })
+            return None
+
+    def update_proxy_host(self, proxy_host_id: int, **fields) -> bool:
+        """Update fields of a proxy host (e.g. forward_host, advanced_config)"""
+        try:
+            response = self._request("PUT", f"/api/nginx/proxy-hosts/{proxy_host_id}", json=fields)
+            response.raise_for_status()
+            if self.host_index:
+                self.host_index.update(proxy_host_id, **fields)
+            return True
+        except Exception as e:
+            logger.error("Error updating proxy host: %s", e, extra={
+                "upstream": "npm",
+                "method": "update_proxy_host",
+                "proxy_host_id": proxy_host_id,
+                "response": e.response.text if getattr(e, 'response', None) is not None else None
+            })
+            return False
+
+    def list_proxy_hosts(self) -> list:
+        """Get all proxy hosts, raising on failure"""
+        response = self._request("GET", "/api/nginx/proxy-hosts")
+        response.raise_for_status()
+        return response.json()
+
+    def get_proxy_hosts(self) -> list:
+        """Get all proxy hosts"""
+        try:
+            return self.list_proxy_hosts()
+        except Exception as e:
+            logger.error("Error getting proxy hosts: %s", e, extra={"upstream": "npm", "method": "get_proxy_hosts"})
+            return []
+
+    def find_proxy_host(self, domain_name: str) -> Optional[Dict]:
+        """Get the proxy host serving domain_name, or None"""
+        for host in self.get_proxy_hosts():
+            if domain_name in (host.get("domain_names") or []):
+                return host
+        return None
+
+    def delete_proxy_host(self, proxy_host_id: int, missing_ok: bool = False) -> bool:
+        """Delete a proxy host (missing_ok: a host that no longer exists counts as deleted)"""
+        try:
+            response = self._request("DELETE", f"/api/nginx/proxy-hosts/{proxy_host_id}")
+            if not (missing_ok and response.status_code == 404):
+                response.raise_for_status()
+            if self.host_index:
+                self.host_index.remove(proxy_host_id)
             return True
         except Exception as e:
-            print(f"Error deleting proxy host: {e}")
+            logger.error("Error deleting proxy host: %s", e, extra={
+                "upstream": "npm",
+                "method": "delete_proxy_host",
+                "proxy_host_id": proxy_host_id
+            })
             return False
 
     def health_check(self) -> bool:
         """Check if NPM is accessible and can authenticate"""
         try:
             # First check if NPM is responding
-            response = requests.get(f"{self.base_url}/api/schema", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/schema", timeout=5)
             if response.status_code != 200:
                 self.last_error = f"NPM not responding (status {response.status_code})"
                 return False
@@ -1,30 +1,106 @@
-import ovh
-from typing import Optional
+import logging
+from typing import Optional, List, Dict
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from config import settings
+from tracing import trace_methods
+from .dns_provider import DNSProvider, DEFAULT_RECORD_TYPES, make_record
+from .upstream import UpstreamSession
 
+logger = logging.getLogger(__name__)
 
-class OVHService:
+
+@trace_methods(
+    "ovh",
+    include=("_create_record", "_delete_record", "_fetch_records", "_list_record_ids"),
+    exclude=("get_zone_name", "zone_key")
+)
+class OVHService(DNSProvider):
     """Service for OVH DNS API operations"""
 
+    provider_name = "ovh"
+
     def __init__(self):
-        self.client = ovh.Client(
+        super().__init__()
+        self.connect(
             endpoint=settings.ovh_endpoint,
             application_key=settings.ovh_application_key,
             application_secret=settings.ovh_application_secret,
             consumer_key=settings.ovh_consumer_key
         )
         self.zone_name = settings.ovh_zone_name
-        self.last_error: Optional[str] = None
+
+    def connect(
+        self,
+        endpoint: str,
+        application_key: str,
+        application_secret: str,
+        consumer_key: str
+    ):
+        """Create the OVH client, routing its HTTP calls through the OVH scheduler"""
+        import ovh  # Imported on first use: only OVH deployments pay for it
+
+        self.client = ovh.Client(
+            endpoint=endpoint,
+            application_key=application_key,
+            application_secret=application_secret,
+            consumer_key=consumer_key,
+            timeout=settings.upstream_timeout
+        )
+        self.client._session = UpstreamSession("ovh")
+        if settings.ovh_api_url:
+            self.client._endpoint = settings.ovh_api_url.rstrip('/')
+
+    def get_zone_name(self) -> Optional[str]:
+        return self.zone_name
+
+    def zone_key(self) -> str:
+        return self.zone_name
+
+    def refresh_zone(self):
+        """Refresh the zone to apply pending changes"""
+        self.client.post(f'/domain/zone/{self.zone_name}/refresh')
+
+    def _create_record(self, record: Dict, refresh: bool = True) -> Optional[str]:
+        try:
+            target = record["target"]
+            if record["type"] == "CNAME":
+                # If target is "@", use the zone name
+                if target == "@":
+                    target = f"{self.zone_name}."
+                # Ensure target ends with a dot for CNAME
+                elif not target.endswith('.'):
+                    target = f"{target}."
+
+            subdomain = record["subdomain"]
+            result = self.client.post(
+                f'/domain/zone/{self.zone_name}/record',
+                fieldType=record["type"],
+                subDomain="" if subdomain == "@" else subdomain,
+                target=target,
+                ttl=record.get("ttl", 3600)
+            )
+
+            if refresh:
+                self.refresh_zone()
+
+            return str(result.get('id'))
+
+        except Exception as e:
+            logger.error(
+                "Error creating %s record: %s", record.get('type'), e,
+                extra={"upstream": "ovh", "method": "_create_record", "zone": self.zone_name}
+            )
+            self.last_error = str(e)
+            return None
 
     def create_a_record(
         self,
         subdomain: str,
         target_ip: str,
         ttl: int = 3600
-    ) -> Optional[int]:
+    ) -> Optional[str]:
         """
         Create an A record in OVH DNS
 
@@ -36,31 +112,16 @@ class OVHService:
         Returns:
             Record ID or None if failed
         """
-        try:
-            # Create the DNS record
-            result = self.client.post(
-                f'/domain/zone/{self.zone_name}/record',
-                fieldType='A',
-                subDomain=subdomain,
-                target=target_ip,
-                ttl=ttl
-            )
-
-            # Refresh the zone to apply changes
-            self.client.post(f'/domain/zone/{self.zone_name}/refresh')
-
-            return result.get('id')
-
-        except Exception as e:
-            print(f"Error creating DNS record: {e}")
-            return None
+        return self._create_record(
+            {"type": "A", "subdomain": subdomain, "target": target_ip, "ttl": ttl}
+        )
 
     def create_cname_record(
         self,
         subdomain: str,
         target: str,
         ttl: int = 3600
-    ) -> Optional[int]:
+    ) -> Optional[str]:
         """
         Create a CNAME record in OVH DNS
 
@@ -72,68 +133,131 @@ class OVHService:
         Returns:
             Record ID or None if failed
         """
-        try:
-            # If target is "@", use the zone name
-            if target == "@":
-                target = f"{self.zone_name}."
-            # Ensure target ends with a dot for CNAME
-            elif not target.endswith('.'):
-                target = f"{target}."
-
-            # Create the CNAME record
-            result = self.client.post(
-                f'/domain/zone/{self.zone_name}/record',
-                fieldType='CNAME',
-                subDomain=subdomain,
-                target=target,
-                ttl=ttl
-            )
-
-            # Refresh the zone to apply changes
-            self.client.post(f'/domain/zone/{self.zone_name}/refresh')
+        return self._create_record(
+            {"type": "CNAME", "subdomain": subdomain, "target": target, "ttl": ttl}
+        )
 
-            return result.get('id')
+    def _list_record_ids(self, subdomain: Optional[str] = None, record_type: str = 'A') -> list:
+        """Get DNS record IDs, raising on failure"""
+        params = {'fieldType': record_type}
+        if subdomain:
+            params['subDomain'] = subdomain
 
-        except Exception as e:
-            print(f"Error creating CNAME record: {e}")
-            return None
+        return self.client.get(
+            f'/domain/zone/{self.zone_name}/record',
+            **params
+        )
 
-    def get_records(self, subdomain: Optional[str] = None) -> list:
+    def get_records(self, subdomain: Optional[str] = None, record_type: str = 'A') -> list:
         """
-        Get DNS records
+        Get DNS record IDs
 
         Args:
             subdomain: Filter by subdomain (optional)
+            record_type: Record type to list
 
         Returns:
             List of record IDs
         """
         try:
-            params = {'fieldType': 'A'}
-            if subdomain:
-                params['subDomain'] = subdomain
-
-            record_ids = self.client.get(
-                f'/domain/zone/{self.zone_name}/record',
-                **params
-            )
-            return record_ids
+            return self._list_record_ids(subdomain, record_type)
 
         except Exception as e:
-            print(f"Error getting DNS records: {e}")
+            logger.error(
+                "Error getting DNS records: %s", e,
+                extra={"upstream": "ovh", "method": "get_records", "zone": self.zone_name}
+            )
             return []
 
-    def get_record_details(self, record_id: int) -> Optional[dict]:
-        """Get details of a specific DNS record"""
+    def _record_details(self, record_id) -> Optional[dict]:
+        """Get details of a DNS record, None if it no longer exists, raising on any other failure"""
+        import ovh
+
         try:
             return self.client.get(
                 f'/domain/zone/{self.zone_name}/record/{record_id}'
             )
+        except ovh.exceptions.ResourceNotFoundError:
+            # Deleted between listing its ID and reading it
+            return None
+
+    def get_record_details(self, record_id) -> Optional[dict]:
+        """Get details of a specific DNS record"""
+        try:
+            return self._record_details(record_id)
         except Exception as e:
-            print(f"Error getting record details: {e}")
+            logger.error(
+                "Error getting record details: %s", e,
+                extra={"upstream": "ovh", "method": "get_record_details", "record_id": record_id}
+            )
             return None
 
-    def delete_record(self, record_id: int) -> bool:
+    def _to_record(self, details: Dict) -> Dict:
+        return make_record(
+            details.get("id"),
+            details.get("fieldType"),
+            details.get("subDomain"),
+            details.get("target"),
+            details.get("ttl"),
+            details.get("zone") or self.zone_name
+        )
+
+    def _fetch_records(self, record_type: str) -> List[Dict]:
+        records = []
+        for record_id in self._list_record_ids(record_type=record_type):
+            details = self._record_details(record_id)
+            if details:
+                records.append(self._to_record(details))
+        return records
+
+    async def list_records(self, types=DEFAULT_RECORD_TYPES) -> List[Dict]:
+        """List records, fetching the per-record details concurrently (raises if listing fails)"""
+        id_lists = await self._run_bounded([
+            (lambda record_type=record_type: self._list_record_ids(record_type=record_type))
+            for record_type in types
+        ])
+        record_ids = [record_id for ids in id_lists for record_id in ids]
+
+        details = await self._run_bounded([
+            (lambda record_id=record_id: self._record_details(record_id))
+            for record_id in record_ids
+        ])
+        return [self._to_record(d) for d in details if d]
+
+    def _delete_record(self, record_id: str, refresh: bool = True) -> bool:
+        try:
+            self.client.delete(
+                f'/domain/zone/{self.zone_name}/record/{int(record_id)}'
+            )
+
+            if refresh:
+                self.refresh_zone()
+
+            return True
+
+        except Exception as e:
+            logger.error(
+                "Error deleting DNS record: %s", e,
+                extra={"upstream": "ovh", "method": "_delete_record", "record_id": record_id}
+            )
+            self.last_error = str(e)
+            return False
+
+    def _record_missing(self, record_id: str) -> bool:
+        import ovh
+
+        try:
+            self.client.get(f'/domain/zone/{self.zone_name}/record/{int(record_id)}')
+        except ovh.exceptions.ResourceNotFoundError:
+            return True
+        except Exception as e:
+            logger.error(
+                "Error getting record details: %s", e,
+                extra={"upstream": "ovh", "method": "_record_missing", "record_id": record_id}
+            )
+        return False
+
+    def delete_record(self, record_id) -> bool:
         """
         Delete a DNS record
 
@@ -143,19 +267,36 @@ class OVHService:
         Returns:
             True if successful, False otherwise
         """
-        try:
-            self.client.delete(
-                f'/domain/zone/{self.zone_name}/record/{record_id}'
-            )
+        return self._delete_record(str(record_id))
 
-            # Refresh the zone to apply changes
-            self.client.post(f'/domain/zone/{self.zone_name}/refresh')
+    async def _refresh_after(self, results: List) -> List:
+        """Apply a whole batch with a single zone refresh"""
+        if any(results):
+            try:
+                await self._run_bounded([self.refresh_zone])
+            except Exception as e:
+                logger.error(
+                    "Error refreshing DNS zone: %s", e,
+                    extra={"upstream": "ovh", "method": "refresh_zone", "zone": self.zone_name}
+                )
+                self.last_error = str(e)
+        return results
 
-            return True
+    async def _batch_create(self, records: List[Dict]) -> List[Optional[str]]:
+        """Create records concurrently, refreshing the zone once at the end"""
+        results = await self._run_bounded([
+            (lambda record=record: self._create_record(record, refresh=False))
+            for record in records
+        ])
+        return await self._refresh_after(results)
 
-        except Exception as e:
-            print(f"Error deleting DNS record: {e}")
-            return False
+    async def _batch_delete(self, record_ids: List[str]) -> List[bool]:
+        """Delete records concurrently, refreshing the zone once at the end"""
+        results = await self._run_bounded([
+            (lambda record_id=record_id: self._delete_record(str(record_id), refresh=False))
+            for record_id in record_ids
+        ])
+        return await self._refresh_after(results)
 
     def health_check(self) -> bool:
         """Check if OVH API is accessible"""
@@ -0,0 +1,555 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from database import ProvisioningJob, ProvisioningStep, Service, SessionLocal
+from logs import log_context
+from tracing import traced, tracer
+from .capacity import effective_limits
+from .docker_service import SERVICE_LABEL
+from .readiness import NotReadyError
+from .replicas import load_balancing_config, replica_name
+
+logger = logging.getLogger(__name__)
+
+# Provisioning steps, in order. The "db" step (saving the Service row) always runs last.
+# DNS is created before waiting for readiness so it propagates while the app starts.
+STEPS = ("subnet", "network", "container", "dns", "ready", "npm")
+
+# Steps whose failure aborts the job; DNS, readiness and NPM failures leave a partial service
+FATAL_STEPS = ("subnet", "network", "container")
+
+STEP_LABELS = {
+    "subnet": "Subnet allocation",
+    "network": "Docker network creation",
+    "container": "Docker container creation",
+    "dns": "DNS record creation",
+    "ready": "Container readiness",
+    "npm": "NPM proxy host creation",
+    "db": "Saving service"
+}
+
+
+class ProvisioningError(Exception):
+    """A fatal provisioning step failed; the job can be resumed or rolled back"""
+
+    def __init__(self, job_id: int, step: str, error: str):
+        super().__init__(f"{STEP_LABELS[step]} failed: {error}")
+        self.job_id = job_id
+        self.step = step
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key or service name is already used by a different job"""
+
+
+def _job_to_dict(job: ProvisioningJob) -> Dict:
+    return {
+        "id": job.id,
+        "idempotency_key": job.idempotency_key,
+        "service_name": job.service_name,
+        "subdomain": job.subdomain,
+        "dns_zone": job.dns_zone,
+        "request": json.loads(job.request),
+        "status": job.status,
+        "current_step": job.current_step,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+
+def _replicas(job: Dict, results: Dict) -> List[Dict]:
+    """Replicas started by the container step (jobs journaled before replicas had one container)"""
+    container = results["container"]
+    return container.get("replicas") or [{
+        "index": 0,
+        "container_id": container["container_id"],
+        "container_name": job["service_name"],
+        "container_ip": container["container_ip"]
+    }]
+
+
+class ProvisioningJournal:
+    """Database journal of provisioning jobs and their steps"""
+
+    def start_job(
+        self,
+        idempotency_key: str,
+        service_name: str,
+        request: Dict,
+        subdomain: str,
+        dns_zone: str
+    ) -> Tuple[Dict, bool]:
+        """
+        Create a job, or return the existing job for this idempotency key
+
+        Returns:
+            (job dictionary, True if the job was just created)
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different request, or
+                another unfinished job exists for the same service
+        """
+        request_json = json.dumps(request, sort_keys=True)
+        db = SessionLocal()
+        try:
+            job = db.query(ProvisioningJob).filter(
+                ProvisioningJob.idempotency_key == idempotency_key
+            ).first()
+            if job:
+                if job.request != request_json:
+                    raise IdempotencyConflict(
+                        f"Idempotency key '{idempotency_key}' was used for a different request "
+                        f"(job {job.id})"
+                    )
+                return _job_to_dict(job), False
+
+            other = db.query(ProvisioningJob).filter(
+                ProvisioningJob.service_name == service_name,
+                ProvisioningJob.status.in_(("running", "failed"))
+            ).first()
+            if other:
+                raise IdempotencyConflict(
+                    f"Unfinished provisioning job {other.id} exists for '{service_name}'; "
+                    f"resume or cancel it first"
+                )
+
+            job = ProvisioningJob(
+                idempotency_key=idempotency_key,
+                service_name=service_name,
+                subdomain=subdomain,
+                dns_zone=dns_zone,
+                request=request_json,
+                status="running"
+            )
+            db.add(job)
+            db.commit()
+            return _job_to_dict(job), True
+        finally:
+            db.close()
+
+    def find_job(self, idempotency_key: str) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            job = db.query(ProvisioningJob).filter(
+                ProvisioningJob.idempotency_key == idempotency_key
+            ).first()
+            return _job_to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            job = db.query(ProvisioningJob).filter(ProvisioningJob.id == job_id).first()
+            return _job_to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            query = db.query(ProvisioningJob)
+            if status:
+                query = query.filter(ProvisioningJob.status == status)
+            return [_job_to_dict(job) for job in query.order_by(ProvisioningJob.id).all()]
+        finally:
+            db.close()
+
+    def service_request(self, service_name: str) -> Optional[Dict]:
+        """The creation request of a service, from its latest finished job"""
+        db = SessionLocal()
+        try:
+            job = db.query(ProvisioningJob).filter(
+                ProvisioningJob.service_name == service_name,
+                ProvisioningJob.status.in_(("completed", "partial"))
+            ).order_by(ProvisioningJob.id.desc()).first()
+            return json.loads(job.request) if job else None
+        finally:
+            db.close()
+
+    def update_job(self, job_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(ProvisioningJob).filter(ProvisioningJob.id == job_id).update(
+                fields, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def steps(self, job_id: int) -> Dict[str, Dict]:
+        """Get the journaled steps of a job, keyed by step name"""
+        db = SessionLocal()
+        try:
+            rows = db.query(ProvisioningStep).filter(ProvisioningStep.job_id == job_id).all()
+            return {
+                row.step: {
+                    "status": row.status,
+                    "attempts": row.attempts,
+                    "result": json.loads(row.result) if row.result else None,
+                    "error": row.error
+                }
+                for row in rows
+            }
+        finally:
+            db.close()
+
+    def mark_step(
+        self,
+        job: Dict,
+        step: str,
+        status: str,
+        result: Optional[Dict] = None,
+        error: Optional[str] = None
+    ):
+        """Record the status of a step (one row per step, keyed by "<job key>:<step>")"""
+        key = f"{job['idempotency_key']}:{step}"
+        db = SessionLocal()
+        try:
+            row = db.query(ProvisioningStep).filter(ProvisioningStep.idempotency_key == key).first()
+            if not row:
+                row = ProvisioningStep(job_id=job["id"], step=step, idempotency_key=key, attempts=0)
+                db.add(row)
+            row.status = status
+            row.error = error
+            if status == "started":
+                row.attempts = (row.attempts or 0) + 1
+            if result is not None:
+                row.result = json.dumps(result)
+            db.query(ProvisioningJob).filter(ProvisioningJob.id == job["id"]).update(
+                {"current_step": step}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def delete_job(self, job_id: int):
+        db = SessionLocal()
+        try:
+            db.query(ProvisioningStep).filter(ProvisioningStep.job_id == job_id).delete()
+            db.query(ProvisioningJob).filter(ProvisioningJob.id == job_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def forget_service(self, service_name: str):
+        """Drop the journal of a service once it has been deleted"""
+        for job in self.list_jobs():
+            if job["service_name"] == service_name:
+                self.delete_job(job["id"])
+
+
+class Provisioner:
+    """
+    Runs provisioning jobs step by step against the journal
+
+    Completed steps are never re-run. A step that was started before (crash
+    or earlier failure) first looks for the resource it would create - the
+    subnet allocated to the service, the network and container by name, the
+    DNS record and NPM proxy host by domain - so resuming does not pull the
+    image or issue a certificate again. Containers - one per replica - are
+    started by the replica manager, which admits their limits with the
+    capacity ledger and probes their readiness: the NPM proxy host is only
+    created once every replica is ready. If one is not, the service is left
+    partial and resuming the job probes again. In shared-network mode the
+    subnet and network steps join a pooled network (see NetworkPool)
+    instead of creating a network for the service.
+    """
+
+    def __init__(
+        self,
+        journal: ProvisioningJournal,
+        docker_service,
+        subnet_manager,
+        get_npm_service: Callable,
+        zone_registry,
+        server_public_ip: str,
+        replica_manager,
+        certificate_queue=None,
+        network_pool=None
+    ):
+        self.journal = journal
+        self.docker_service = docker_service
+        self.subnet_manager = subnet_manager
+        self.get_npm_service = get_npm_service
+        self.zone_registry = zone_registry
+        self.server_public_ip = server_public_ip
+        self.replica_manager = replica_manager
+        self.certificate_queue = certificate_queue
+        self.network_pool = network_pool
+
+    @traced("provisioning.run")
+    async def run(self, job_id: int, heartbeat: Optional[Callable[[], None]] = None) -> Dict:
+        """
+        Run (or resume) a job
+
+        Args:
+            job_id: Job to run
+            heartbeat: Called before each step (e.g. to extend the service lock)
+
+        Returns:
+            {"job": job, "results": results by step, "errors": non-fatal errors}
+
+        Raises:
+            ProvisioningError: If a fatal step failed
+        """
+        with log_context(job_id=job_id):
+            return await self._run(job_id, heartbeat)
+
+    async def _run(self, job_id: int, heartbeat: Optional[Callable[[], None]]) -> Dict:
+        job = self.journal.get_job(job_id)
+        steps = self.journal.steps(job_id)
+        results = {name: s["result"] for name, s in steps.items() if s["status"] == "completed"}
+        errors = []
+
+        self.journal.update_job(job_id, status="running", error=None)
+
+        for step in STEPS:
+            if step in results:
+                continue
+            if heartbeat:
+                await asyncio.to_thread(heartbeat)
+
+            resume = step in steps
+            self.journal.mark_step(job, step, "started")
+            try:
+                with tracer.span(f"provisioning.{step}", job_id=job_id, service=job["service_name"], resume=resume):
+                    result = await getattr(self, f"_step_{step}")(job, results, resume)
+            except Exception as e:
+                logger.warning(
+                    "Provisioning step %s failed: %s", step, e,
+                    extra={"service": job["service_name"], "step": step}
+                )
+                self.journal.mark_step(job, step, "failed", error=str(e))
+                if step in FATAL_STEPS:
+                    self.journal.update_job(job_id, status="failed", error=str(e))
+                    raise ProvisioningError(job_id, step, str(e))
+                errors.append(f"{STEP_LABELS[step]} failed: {str(e)}")
+                continue
+
+            self.journal.mark_step(job, step, "completed", result=result)
+            results[step] = result
+
+        self.journal.mark_step(job, "db", "started")
+        results["db"] = await asyncio.to_thread(self._save_service, job, results, errors)
+        self.journal.mark_step(job, "db", "completed", result=results["db"])
+
+        self.journal.update_job(
+            job_id,
+            status="completed" if not errors else "partial",
+            current_step=None,
+            error="; ".join(errors) or None
+        )
+        return {"job": self.journal.get_job(job_id), "results": results, "errors": errors}
+
+    def _shared(self, job: Dict) -> bool:
+        return bool(self.network_pool) and (job["request"].get("network_mode") or settings.network_mode) == "shared"
+
+    async def _step_subnet(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        if self._shared(job):
+            count = job["request"].get("replicas") or 1
+            network = await asyncio.to_thread(
+                self.network_pool.acquire,
+                job["service_name"],
+                [replica_name(job["service_name"], index) for index in range(count)]
+            )
+            return {"subnet": network["subnet"], "shared_network": network["network_name"]}
+
+        db = SessionLocal()
+        try:
+            # Reuse a subnet left by an interrupted run or reserved by an import
+            subnet = self.subnet_manager.get_service_subnet(db, job["service_name"])
+            if not subnet:
+                subnet = await asyncio.to_thread(
+                    self.subnet_manager.allocate_subnet, db, job["service_name"], job["request"].get("subnet_prefix")
+                )
+            if not subnet:
+                raise Exception("No available subnets")
+            return {"subnet": subnet}
+        finally:
+            db.close()
+
+    async def _step_network(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        shared_network = results["subnet"].get("shared_network")
+        if shared_network:
+            await asyncio.to_thread(self.network_pool.ensure, shared_network, results["subnet"]["subnet"])
+            return {"network_name": shared_network, "shared": True}
+
+        network_name = f"{job['service_name']}-network"
+        if not (resume and await asyncio.to_thread(self.docker_service.get_network, network_name)):
+            await asyncio.to_thread(
+                self.docker_service.create_network,
+                network_name,
+                results["subnet"]["subnet"],
+                {SERVICE_LABEL: job["service_name"]}
+            )
+        return {"network_name": network_name}
+
+    async def _step_container(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        request = job["request"]
+        replicas = await self.replica_manager.start_all(
+            job["service_name"],
+            request,
+            results["network"]["network_name"],
+            range(request.get("replicas") or 1)
+        )
+        return {
+            "container_id": replicas[0]["container_id"],
+            "container_ip": replicas[0]["container_ip"],
+            "limits": effective_limits(request.get("resources"), request.get("restart_policy")),
+            "replicas": replicas
+        }
+
+    async def _step_dns(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        dns_service = await self.zone_registry.get(job["dns_zone"])
+        record_name = dns_service.split_name(job["subdomain"], job["dns_zone"])
+
+        if resume:
+            for record in await dns_service.list_records(types=("A",)):
+                if record["subdomain"] == record_name and record["target"] == self.server_public_ip:
+                    return {"record_id": record["id"]}
+
+        record_id = await dns_service.create_record(
+            "A",
+            subdomain=record_name,
+            target=self.server_public_ip
+        )
+        if not record_id:
+            raise Exception("DNS record creation returned no ID")
+        return {"record_id": record_id}
+
+    async def _step_ready(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        not_ready = await self.replica_manager.wait_ready(_replicas(job, results), job["request"]["internal_port"])
+        errors = [f"replica {index}: {error}" if len(not_ready) > 1 else error for index, error in not_ready.items() if error]
+        if errors:
+            raise NotReadyError("; ".join(errors))
+        return {"replicas": len(not_ready)}
+
+    async def _step_npm(self, job: Dict, results: Dict, resume: bool) -> Dict:
+        if "ready" not in results:
+            raise Exception("Container not ready, proxy host not created (resume the job to retry)")
+        npm_service = self.get_npm_service()
+        enable_ssl = job["request"].get("enable_ssl", True)
+
+        replicas = _replicas(job, results)
+
+        proxy_host_id = None
+        if resume:
+            existing = await asyncio.to_thread(npm_service.find_proxy_host, job["subdomain"])
+            if existing:
+                proxy_host_id = existing["id"]
+                enable_ssl = enable_ssl and not existing.get("certificate_id")
+                await self.replica_manager.publish(proxy_host_id, replicas)
+
+        certificate_id = None
+        if not proxy_host_id:
+            if enable_ssl and self.certificate_queue:
+                certificate_id = await self.certificate_queue.find_existing(job["subdomain"])
+            proxy_host_id = await asyncio.to_thread(
+                npm_service.create_proxy_host,
+                domain_name=job["subdomain"],
+                forward_host=replicas[0]["container_ip"],
+                forward_port=job["request"]["internal_port"],
+                enable_ssl=enable_ssl,
+                certificate_id=certificate_id,
+                advanced_config=load_balancing_config([replica["container_ip"] for replica in replicas])
+            )
+        if not proxy_host_id:
+            raise Exception("NPM proxy host creation returned no ID")
+
+        # Without a reusable certificate, one is issued in the background
+        if enable_ssl and self.certificate_queue:
+            if certificate_id:
+                self.certificate_queue.record_reused(proxy_host_id, job["subdomain"], certificate_id)
+            else:
+                self.certificate_queue.enqueue(proxy_host_id, job["subdomain"])
+        return {"proxy_host_id": proxy_host_id}
+
+    def _save_service(self, job: Dict, results: Dict, errors: List[str]) -> Dict:
+        """Insert or update the Service row from the step results"""
+        request = job["request"]
+        db = SessionLocal()
+        try:
+            service = db.query(Service).filter(Service.service_name == job["service_name"]).first()
+            if not service:
+                service = Service(service_name=job["service_name"])
+                db.add(service)
+
+            service.subdomain = job["subdomain"]
+            service.docker_image = request["docker_image"]
+            service.container_id = results["container"]["container_id"]
+            service.network_name = results["network"]["network_name"]
+            service.subnet = results["subnet"]["subnet"]
+            service.internal_port = request["internal_port"]
+            service.npm_proxy_host_id = (results.get("npm") or {}).get("proxy_host_id")
+            service.dns_record_id = (results.get("dns") or {}).get("record_id")
+            service.dns_zone = job["dns_zone"]
+            service.resources = json.dumps(results["container"].get("limits"))
+            service.replicas = len(_replicas(job, results))
+            service.status = "active" if not errors else "partial"
+            db.commit()
+            return {"service_id": service.id}
+        finally:
+            db.close()
+
+    @traced("provisioning.rollback")
+    async def rollback(self, job_id: int) -> List[str]:
+        """
+        Undo the resources created by an unfinished job and drop its journal
+
+        Returns:
+            Errors of the undo steps (empty if everything was removed)
+        """
+        job = self.journal.get_job(job_id)
+        steps = self.journal.steps(job_id)
+        results = {name: s["result"] or {} for name, s in steps.items()}
+        errors = []
+
+        if results.get("npm", {}).get("proxy_host_id"):
+            npm_service = self.get_npm_service()
+            if not await asyncio.to_thread(npm_service.delete_proxy_host, results["npm"]["proxy_host_id"]):
+                errors.append("Failed to remove NPM proxy host")
+            elif self.certificate_queue:
+                self.certificate_queue.forget(results["npm"]["proxy_host_id"])
+
+        if results.get("dns", {}).get("record_id"):
+            try:
+                dns_service = await self.zone_registry.get(job["dns_zone"])
+                if not (await dns_service.batch_delete([results["dns"]["record_id"]]))[0]:
+                    errors.append("Failed to remove DNS record")
+            except KeyError as e:
+                errors.append(str(e))
+
+        container_errors = []
+        if "container" in steps:
+            container_errors = await self.replica_manager.remove_all(job["service_name"])
+            errors.extend(container_errors)
+        # Pooled-network addresses are reserved with the network (subnet step):
+        # free them once no container uses them, whatever failed above
+        if self.network_pool and not container_errors:
+            await asyncio.to_thread(self.network_pool.release_service, job["service_name"])
+
+        if "network" in steps:
+            network_name = f"{job['service_name']}-network"
+            if await asyncio.to_thread(self.docker_service.get_network, network_name):
+                if not await asyncio.to_thread(self.docker_service.remove_network, network_name):
+                    errors.append("Failed to remove Docker network")
+
+        if "subnet" in steps:
+            db = SessionLocal()
+            try:
+                subnet = self.subnet_manager.get_service_subnet(db, job["service_name"])
+                if subnet:
+                    self.subnet_manager.release_subnet(db, subnet)
+            finally:
+                db.close()
+
+        if not errors:
+            self.journal.delete_job(job_id)
+        return errors
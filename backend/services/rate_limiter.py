@@ -0,0 +1,209 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+
+# Lower value = served first
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 10
+
+_priority = contextvars.ContextVar("upstream_priority", default=PRIORITY_USER)
+
+
+@contextmanager
+def background_priority():
+    """Queue upstream calls made in this context behind user-facing ones"""
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delay in seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate_limit(headers: Mapping[str, str]) -> Optional[tuple]:
+    """
+    Read (remaining, reset_seconds) from rate-limit headers
+
+    Understands X-RateLimit-Remaining/X-RateLimit-Reset (reset given either
+    as seconds or as an epoch timestamp) and the IETF "RateLimit" header used
+    by Cloudflare ('"default";r=50;t=30').
+    """
+    remaining = headers.get("X-RateLimit-Remaining")
+    reset = headers.get("X-RateLimit-Reset")
+    if remaining is not None:
+        try:
+            reset_seconds = float(reset) if reset else 0.0
+            if reset_seconds > 1e9:
+                reset_seconds -= time.time()
+            return int(float(remaining)), max(0.0, reset_seconds)
+        except ValueError:
+            return None
+
+    header = headers.get("RateLimit")
+    if header:
+        params = dict(
+            part.strip().split("=", 1) for part in header.split(";") if "=" in part
+        )
+        try:
+            return int(params["r"]), float(params.get("t", 0))
+        except (KeyError, ValueError):
+            return None
+    return None
+
+
+class UpstreamScheduler:
+    """
+    Token-bucket scheduler for one upstream API
+
+    Callers block in acquire() until a token is available; waiting callers
+    are served by priority, then in arrival order. The refill rate halves on
+    every 429 and recovers additively on success, and Retry-After or an
+    exhausted rate-limit header pauses the whole queue until the reset.
+    """
+
+    def __init__(self, name: str, rate: float, burst: Optional[float] = None):
+        """
+        Initialize the scheduler
+
+        Args:
+            name: Upstream name (e.g. "cloudflare")
+            rate: Sustained requests per second
+            burst: Bucket size (defaults to one second worth of requests)
+        """
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 10
+        self.burst = burst or max(1.0, rate)
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: Optional[int] = None):
+        """Block until this caller may send one request"""
+        entry = (current_priority() if priority is None else priority, next(self._sequence))
+        started = time.monotonic()
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiters[0] == entry:
+                    if now >= self._blocked_until and self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        self._cond.notify_all()
+                        break
+                    wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.001)
+                else:
+                    wait = 0.5
+                self._cond.wait(wait)
+
+            self.requests += 1
+            self.total_wait += time.monotonic() - started
+
+    def observe(self, status_code: int, headers: Mapping[str, str]):
+        """Adapt the rate to an upstream response"""
+        retry_after = _parse_retry_after(headers.get("Retry-After"))
+        rate_limit = _parse_rate_limit(headers)
+
+        with self._cond:
+            now = time.monotonic()
+            if status_code == 429:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = 0
+                delay = retry_after if retry_after is not None else 1 / self.rate
+                self._blocked_until = max(self._blocked_until, now + delay)
+            else:
+                if rate_limit and rate_limit[0] <= 0:
+                    self._blocked_until = max(self._blocked_until, now + rate_limit[1])
+                if status_code < 500:
+                    self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+            self._cond.notify_all()
+
+    def record_retry(self):
+        with self._cond:
+            self.retries += 1
+
+    def stats(self) -> Dict:
+        """Queue depth, current rate and throttle counters"""
+        with self._cond:
+            return {
+                "rate": round(self.rate, 3),
+                "base_rate": self.base_rate,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+                "avg_wait_ms": round(1000 * self.total_wait / self.requests, 2) if self.requests else 0.0
+            }
+
+
+_schedulers: Dict[str, UpstreamScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> UpstreamScheduler:
+    """Get the process-wide scheduler of an upstream"""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            rates = {
+                "npm": settings.npm_rate_limit,
+                "ovh": settings.ovh_rate_limit,
+                "cloudflare": settings.cloudflare_rate_limit
+            }
+            _schedulers[name] = UpstreamScheduler(name, rates.get(name, 10.0))
+        return _schedulers[name]
+
+
+def scheduler_stats() -> Dict[str, Dict]:
+    """Stats of every scheduler created so far"""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.name: scheduler.stats() for scheduler in schedulers}
@@ -0,0 +1,137 @@
+import asyncio
+import errno
+import logging
+import random
+import time
+from typing import Dict, Optional
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PROBE_MODES = ("auto", "healthcheck", "tcp", "none")
+
+# Connection errors meaning the orchestrator cannot reach the container network at all
+# (as opposed to "connection refused": reachable, but nothing listening yet)
+UNREACHABLE_ERRNOS = (errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+
+class NotReadyError(Exception):
+    """A container did not become ready before the deadline (or stopped)"""
+
+
+class ReadinessProbe:
+    """
+    Waits until a container can serve traffic
+
+    Containers whose image defines a HEALTHCHECK are ready once Docker
+    reports them healthy. Other containers are ready once a TCP connection
+    to their internal port succeeds (mode "auto"), or as soon as they run
+    (mode "healthcheck"). Mode "tcp" always probes the port, and "none"
+    skips probing. Probes are retried with exponential backoff (with
+    jitter) until the deadline. A container that exits fails at once.
+
+    Waiting is asynchronous: each deployment's probe is a coroutine that
+    holds no thread between attempts, so many deployments can wait at once.
+    TCP probing requires the orchestrator to reach the container networks:
+    when a connection times out or the network is unreachable, probing is
+    skipped rather than waiting for the deadline.
+    """
+
+    def __init__(
+        self,
+        docker_service,
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        initial_delay: Optional[float] = None,
+        max_delay: Optional[float] = None
+    ):
+        self.docker_service = docker_service
+        self.mode = mode or settings.readiness_probe
+        self.timeout = timeout if timeout is not None else settings.readiness_timeout
+        self.initial_delay = initial_delay if initial_delay is not None else settings.readiness_initial_delay
+        self.max_delay = max_delay if max_delay is not None else settings.readiness_max_delay
+        if self.mode not in PROBE_MODES:
+            raise ValueError(f"READINESS_PROBE must be one of: {', '.join(PROBE_MODES)}")
+
+    async def _port_open(self, host: str, port: int, timeout: float) -> Optional[bool]:
+        """Whether the port accepts connections (None: the container network cannot be reached)"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except OSError as e:
+            return None if e.errno in UNREACHABLE_ERRNOS else False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _attempt(self, container_id: str, host: str, port: int, remaining: float) -> Optional[str]:
+        """How the container was found ready, or None if it is not ready yet"""
+        state = await asyncio.to_thread(self.docker_service.container_state, container_id)
+        if state is None:
+            raise NotReadyError("Container no longer exists")
+        if state.get("Status") in ("exited", "dead"):
+            raise NotReadyError(f"Container stopped (exit code {state.get('ExitCode')})")
+
+        health = (state.get("Health") or {}).get("Status")
+        if health and self.mode != "tcp":
+            return "healthcheck" if health == "healthy" else None
+        if not state.get("Running"):
+            return None
+        if self.mode == "healthcheck":
+            return "running"
+        port_open = await self._port_open(host, port, min(2.0, remaining))
+        if port_open is None:
+            logger.warning(
+                "Cannot reach %s:%d, skipping the readiness probe", host, port,
+                extra={"container": container_id[:12]}
+            )
+            return "skipped"
+        return "tcp" if port_open else None
+
+    async def wait(self, container_id: str, host: str, port: int) -> Dict:
+        """
+        Wait until a container is ready
+
+        Args:
+            container_id: Container to probe
+            host: Container IP (for TCP probes)
+            port: Internal port of the application
+
+        Returns:
+            {"probe": how readiness was established, "attempts": n, "waited_ms": time waited}
+
+        Raises:
+            NotReadyError: If the container stopped or was not ready within the timeout
+        """
+        if self.mode == "none":
+            return {"probe": "none", "attempts": 0, "waited_ms": 0}
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        delay = self.initial_delay
+        attempts = 0
+        while True:
+            attempts += 1
+            probe = await self._attempt(container_id, host, port, max(deadline - time.monotonic(), 0.1))
+            if probe:
+                waited_ms = round((time.monotonic() - started) * 1000)
+                logger.info(
+                    "Container ready after %d ms", waited_ms,
+                    extra={"container": container_id[:12], "probe": probe, "attempts": attempts}
+                )
+                return {"probe": probe, "attempts": attempts, "waited_ms": waited_ms}
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise NotReadyError(
+                    f"Container not ready after {self.timeout:g}s ({attempts} probes)"
+                )
+            await asyncio.sleep(min(delay * random.uniform(0.8, 1.2), remaining))
+            delay = min(delay * 2, self.max_delay)
@@ -0,0 +1,92 @@
+import importlib
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# DNS provider name -> (module, class), imported on first use
+PROVIDER_CLASSES = {
+    "ovh": ("ovh_service", "OVHService"),
+    "cloudflare": ("cloudflare_service", "CloudflareService"),
+}
+
+_provider_classes: Dict[str, type] = {}
+
+
+def provider_class(name: str) -> type:
+    """
+    Get the DNS provider class for a provider name, importing its module once
+
+    Raises:
+        KeyError: If the provider is unknown
+    """
+    cls = _provider_classes.get(name)
+    if cls is None:
+        module_name, class_name = PROVIDER_CLASSES[name]
+        module = importlib.import_module(f".{module_name}", __package__)
+        cls = _provider_classes[name] = getattr(module, class_name)
+    return cls
+
+
+class ClientRegistry:
+    """
+    Named clients built lazily from registered factories
+
+    A client is built on its first get() - once, even when several threads
+    ask for it at the same time - and reused until invalidate(). Nothing is
+    built at registration, so startup never waits on an upstream.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable] = {}
+        self._clients: Dict[str, object] = {}
+        self._build_ms: Dict[str, float] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable):
+        """Register the factory building client `name` (replaces any built client)"""
+        with self._lock:
+            self._factories[name] = factory
+            self._build_locks.setdefault(name, threading.Lock())
+            self._clients.pop(name, None)
+
+    def get(self, name: str):
+        """
+        Get a client, building it on first use
+
+        Raises:
+            KeyError: If no factory is registered under name
+            Exception: Whatever the factory raises (the next get() retries)
+        """
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._build_locks[name]:
+            client = self._clients.get(name)
+            if client is None:
+                started = time.monotonic()
+                client = self._factories[name]()
+                with self._lock:
+                    self._clients[name] = client
+                    self._build_ms[name] = round((time.monotonic() - started) * 1000, 1)
+        return client
+
+    def peek(self, name: str) -> Optional[object]:
+        """The client if it was already built, without building it"""
+        return self._clients.get(name)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop one client (or all) so it is rebuilt on next use"""
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: {"built": name in self._clients, "build_ms": self._build_ms.get(name)}
+                for name in self._factories
+            }
@@ -0,0 +1,492 @@
+import asyncio
+import logging
+import re
+from typing import Callable, Dict, List, Optional
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from database import Service, ServiceReplica, SessionLocal
+from .capacity import effective_limits, limit_labels
+from .docker_service import SERVICE_LABEL
+
+logger = logging.getLogger(__name__)
+
+# Label carrying the replica index of a service container
+REPLICA_LABEL = "docker-orchestrator.replica"
+
+# Delimit the load-balancing directives written into a proxy host's advanced_config
+BLOCK_START = "# docker-orchestrator replicas: begin (managed, do not edit)"
+BLOCK_END = "# docker-orchestrator replicas: end"
+_BLOCK = re.compile(rf"{re.escape(BLOCK_START)}.*?{re.escape(BLOCK_END)}\n?", re.S)
+
+HEX_DIGITS = "0123456789abcdef"
+
+
+# Suffix of the containers started by an image update, until they replace the old ones
+NEXT_SUFFIX = "-next"
+
+
+def replica_name(service_name: str, index: int) -> str:
+    """Container name of a replica (replica 0 keeps the service name)"""
+    return service_name if index == 0 else f"{service_name}_{index}"
+
+
+def load_balancing_config(ips: List[str]) -> str:
+    """
+    nginx directives spreading the requests of a proxy host over replica IPs
+
+    NPM includes advanced_config inside the server block, where an upstream
+    block is not allowed, so $server - the address NPM's template proxies
+    to, set to forward_host just before - is overridden per request
+    instead: the leading hex digits of the random $request_id pick the
+    replica, the possible prefixes being dealt round-robin. One digit is
+    used up to 16 replicas, two up to 256, and so on, so that every replica
+    gets at least one prefix. forward_host stays on the first replica,
+    which gets the prefixes no rule matches.
+    """
+    if len(ips) < 2:
+        return ""
+    width = 1
+    while len(HEX_DIGITS) ** width < len(ips):
+        width += 1
+    prefixes = [format(n, f"0{width}x") for n in range(len(HEX_DIGITS) ** width)]
+    lines = [BLOCK_START]
+    for index, ip in enumerate(ips[1:], start=1):
+        dealt = prefixes[index::len(ips)]
+        pattern = f"[{''.join(dealt)}]" if width == 1 else f"(?:{'|'.join(dealt)})"
+        lines.append(f'if ($request_id ~ "^{pattern}") {{ set $server "{ip}"; }}')
+    lines.append(BLOCK_END)
+    return "\n".join(lines)
+
+
+def merge_advanced_config(existing: Optional[str], block: str) -> str:
+    """Replace the managed block of an advanced_config, keeping any other directives"""
+    rest = _BLOCK.sub("", existing or "").strip()
+    return "\n".join(part for part in (rest, block) if part)
+
+
+def _replica_to_dict(row: ServiceReplica) -> Dict:
+    return {
+        "index": row.replica_index,
+        "container_id": row.container_id,
+        "container_name": row.container_name,
+        "container_ip": row.container_ip,
+        "created_at": row.created_at.isoformat() if row.created_at else None
+    }
+
+
+class ReplicaManager:
+    """
+    Starts, stops and publishes the container replicas of services
+
+    Replica i of a service runs in container <service>_<i> (replica 0 in
+    <service>) on the service network and is tracked in the
+    service_replicas table. On a pooled network (see NetworkPool), each
+    container gets a static IP from the pool. Replicas are started and stopped concurrently;
+    each new container is admitted by the capacity ledger first. NPM
+    forwards to the first replica and advanced_config spreads requests over
+    the others (see load_balancing_config). Containers NPM stops routing to
+    are given REPLICA_DRAIN_SECONDS to finish their requests.
+    """
+
+    def __init__(
+        self,
+        docker_service,
+        get_npm_service: Callable,
+        capacity_ledger=None,
+        readiness_probe=None,
+        network_pool=None
+    ):
+        self.docker_service = docker_service
+        self.get_npm_service = get_npm_service
+        self.capacity_ledger = capacity_ledger
+        self.readiness_probe = readiness_probe
+        self.network_pool = network_pool
+
+    # Table
+
+    def list_replicas(self, service_name: str) -> List[Dict]:
+        """Tracked replicas of a service, by index"""
+        db = SessionLocal()
+        try:
+            rows = db.query(ServiceReplica).filter(
+                ServiceReplica.service_name == service_name
+            ).order_by(ServiceReplica.replica_index).all()
+            return [_replica_to_dict(row) for row in rows]
+        finally:
+            db.close()
+
+    def _save(self, service_name: str, replica: Dict):
+        key = f"{service_name}:{replica['index']}"
+        db = SessionLocal()
+        try:
+            row = db.query(ServiceReplica).filter(ServiceReplica.replica_key == key).first()
+            if not row:
+                row = ServiceReplica(replica_key=key, service_name=service_name, replica_index=replica["index"])
+                db.add(row)
+            row.container_id = replica["container_id"]
+            row.container_name = replica["container_name"]
+            row.container_ip = replica["container_ip"]
+            db.commit()
+        finally:
+            db.close()
+
+    def _forget(self, service_name: str, index: Optional[int] = None):
+        db = SessionLocal()
+        try:
+            query = db.query(ServiceReplica).filter(ServiceReplica.service_name == service_name)
+            if index is not None:
+                query = query.filter(ServiceReplica.replica_index == index)
+            query.delete()
+            db.commit()
+        finally:
+            db.close()
+
+    # Containers
+
+    async def start(self, service_name: str, request: Dict, network_name: str, index: int) -> Dict:
+        """
+        Start replica index of a service, reusing its container if it already exists
+
+        Args:
+            service_name: Service name
+            request: Creation request of the service (image, port, environment, limits, ...)
+            network_name: Service network
+            index: Replica index
+
+        Returns:
+            The replica: index, container_id, container_name, container_ip
+
+        Raises:
+            ValueError, CapacityError: If the capacity ledger rejects the container
+            Exception: If the container could not be created or has no IP
+        """
+        name = replica_name(service_name, index)
+        container = await asyncio.to_thread(self.docker_service.get_container, name)
+        if container and container.status != "running":
+            await asyncio.to_thread(container.start)
+
+        if container:
+            replica = await self._describe(container.id, name, index, network_name)
+        else:
+            replica = await self._create(service_name, request, network_name, index, name)
+        await asyncio.to_thread(self._save, service_name, replica)
+        return replica
+
+    async def _create(self, service_name: str, request: Dict, network_name: str, index: int, name: str) -> Dict:
+        limits = effective_limits(request.get("resources"), request.get("restart_policy"))
+        ipv4_address = None
+        if self.network_pool and await asyncio.to_thread(self.network_pool.is_shared, network_name):
+            ipv4_address = await asyncio.to_thread(self.network_pool.allocate_ip, network_name, service_name, name)
+        if self.capacity_ledger:
+            try:
+                await asyncio.to_thread(self.capacity_ledger.reserve, name, limits, service_name)
+            except Exception:
+                await self._release_ip(name)
+                raise
+        try:
+            container = await asyncio.to_thread(
+                self.docker_service.create_container,
+                name=name,
+                image=request["docker_image"],
+                network=network_name,
+                internal_port=request["internal_port"],
+                environment=request.get("environment_vars"),
+                volumes=request.get("volumes"),
+                labels={SERVICE_LABEL: service_name, REPLICA_LABEL: str(index), **limit_labels(limits)},
+                cpus=limits["cpus"],
+                memory_mb=limits["memory_mb"],
+                pids_limit=limits["pids_limit"],
+                cpuset_cpus=limits["cpuset_cpus"],
+                restart_policy=limits["restart_policy"],
+                ipv4_address=ipv4_address
+            )
+        except Exception:
+            await self._release_ip(name)
+            raise
+        finally:
+            if self.capacity_ledger:
+                self.capacity_ledger.release(name)
+        return await self._describe(container.id, name, index, network_name)
+
+    async def _remove(self, container_id: str, name: str) -> bool:
+        """Stop and remove a container and free its pooled address"""
+        if not await asyncio.to_thread(self.docker_service.stop_and_remove_container, container_id):
+            return False
+        await self._release_ip(name)
+        return True
+
+    async def _release_ip(self, name: str):
+        if self.network_pool:
+            await asyncio.to_thread(self.network_pool.release_ip, name)
+
+    async def _describe(self, container_id: str, name: str, index: int, network_name: str) -> Dict:
+        container_ip = await asyncio.to_thread(self.docker_service.get_container_ip, container_id, network_name)
+        if not container_ip:
+            raise Exception(f"Could not retrieve the IP of container {name}")
+        return {"index": index, "container_id": container_id, "container_name": name, "container_ip": container_ip}
+
+    async def start_all(self, service_name: str, request: Dict, network_name: str, indexes) -> List[Dict]:
+        """
+        Start replicas concurrently
+
+        Raises:
+            Exception: The first failure, once every start has finished
+                (started replicas are tracked, so a retry reuses them)
+        """
+        outcomes = await asyncio.gather(
+            *(self.start(service_name, request, network_name, index) for index in indexes),
+            return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return list(outcomes)
+
+    async def wait_ready(self, replicas: List[Dict], port: int) -> Dict[int, Optional[str]]:
+        """
+        Wait for replicas concurrently
+
+        Returns:
+            Replica index -> None if ready, else why it is not
+        """
+        if not self.readiness_probe:
+            return {replica["index"]: None for replica in replicas}
+
+        async def wait(replica: Dict) -> Optional[str]:
+            try:
+                await self.readiness_probe.wait(replica["container_id"], replica["container_ip"], port)
+                return None
+            except Exception as e:
+                return str(e)
+
+        errors = await asyncio.gather(*(wait(replica) for replica in replicas))
+        return {replica["index"]: error for replica, error in zip(replicas, errors)}
+
+    async def stop(self, service_name: str, replica: Dict) -> bool:
+        """Remove the container of a replica and stop tracking it"""
+        container = await asyncio.to_thread(
+            self.docker_service.get_container, replica.get("container_id") or replica["container_name"]
+        )
+        if container and not await self._remove(container.id, container.name):
+            return False
+        await asyncio.to_thread(self._forget, service_name, replica["index"])
+        return True
+
+    async def remove_all(self, service_name: str, container_id: Optional[str] = None) -> List[str]:
+        """
+        Remove every replica container of a service
+
+        Args:
+            service_name: Service name
+            container_id: Container of a service created before replicas were tracked
+
+        Returns:
+            Errors (empty if every container was removed)
+        """
+        replicas = await asyncio.to_thread(self.list_replicas, service_name)
+        if not any(replica["index"] == 0 for replica in replicas):
+            replicas.append({"index": 0, "container_id": container_id, "container_name": service_name})
+        stopped = await asyncio.gather(*(self.stop(service_name, replica) for replica in replicas))
+        return [
+            f"Failed to remove Docker container {replica['container_name']}"
+            for replica, ok in zip(replicas, stopped) if not ok
+        ]
+
+    # NPM
+
+    async def publish(self, proxy_host_id: int, replicas: List[Dict]) -> bool:
+        """Point a proxy host at the replicas (forward_host and load-balancing block)"""
+        npm_service = self.get_npm_service()
+        ips = [replica["container_ip"] for replica in sorted(replicas, key=lambda r: r["index"])]
+        host = await asyncio.to_thread(npm_service.get_proxy_host, proxy_host_id)
+        if host is None:
+            return False
+        advanced_config = merge_advanced_config(host.get("advanced_config"), load_balancing_config(ips))
+        if host.get("forward_host") == ips[0] and (host.get("advanced_config") or "") == advanced_config:
+            return True
+        return await asyncio.to_thread(
+            npm_service.update_proxy_host,
+            proxy_host_id,
+            forward_host=ips[0],
+            advanced_config=advanced_config
+        )
+
+    # Scaling
+
+    def _set_count(self, service_name: str, count: int):
+        db = SessionLocal()
+        try:
+            db.query(Service).filter(Service.service_name == service_name).update(
+                {"replicas": count}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _running(self, replica: Dict) -> bool:
+        container = await asyncio.to_thread(self.docker_service.get_container, replica["container_id"])
+        return container is not None and container.status == "running"
+
+    async def scale(self, service: Dict, request: Dict, count: int) -> Dict:
+        """
+        Reconcile a service to count replicas
+
+        Missing replicas (below count, or whose container is gone or
+        stopped) are started and waited for concurrently. NPM is then
+        pointed at the ready replicas, and only after that are the surplus
+        ones removed, so no request is routed to a container being removed.
+        New replicas that do not become ready are removed again.
+
+        Args:
+            service: service_name, network_name, internal_port and npm_proxy_host_id
+            request: Creation request of the service
+            count: Target number of replicas
+
+        Returns:
+            {"replicas": replicas serving, "started": indexes, "stopped": indexes, "errors": [...]}
+        """
+        name = service["service_name"]
+        current = {replica["index"]: replica for replica in await asyncio.to_thread(self.list_replicas, name)}
+        running = await asyncio.gather(*(self._running(replica) for replica in current.values()))
+        healthy = {index for index, ok in zip(current, running) if ok}
+        errors = []
+
+        missing = [index for index in range(count) if index not in healthy]
+        outcomes = await asyncio.gather(
+            *(self.start(name, request, service["network_name"], index) for index in missing),
+            return_exceptions=True
+        )
+        started = []
+        for index, outcome in zip(missing, outcomes):
+            if isinstance(outcome, BaseException):
+                errors.append(f"Replica {index}: {outcome}")
+            else:
+                started.append(outcome)
+
+        not_ready = await self.wait_ready(started, service["internal_port"])
+        for replica in started:
+            if not_ready[replica["index"]]:
+                errors.append(f"Replica {replica['index']}: {not_ready[replica['index']]}")
+                await self.stop(name, replica)
+        started = [replica for replica in started if not not_ready[replica["index"]]]
+
+        serving = sorted(
+            [current[index] for index in healthy if index < count] + started,
+            key=lambda replica: replica["index"]
+        )
+        surplus = [current[index] for index in current if index >= count]
+
+        published = True
+        if service.get("npm_proxy_host_id") and serving:
+            published = await self.publish(service["npm_proxy_host_id"], serving)
+        if not published:
+            errors.append("Failed to update the NPM proxy host; surplus replicas kept")
+            surplus = []
+        if surplus:
+            await asyncio.sleep(settings.replica_drain_seconds)
+
+        stopped = await asyncio.gather(*(self.stop(name, replica) for replica in surplus))
+        for replica, ok in zip(surplus, stopped):
+            if not ok:
+                errors.append(f"Failed to remove Docker container {replica['container_name']}")
+
+        await asyncio.to_thread(self._set_count, name, count)
+        return {
+            "replicas": serving,
+            "started": [replica["index"] for replica in started],
+            "stopped": [replica["index"] for replica, ok in zip(surplus, stopped) if ok],
+            "errors": errors
+        }
+
+    # Image updates
+
+    async def update_image(self, service: Dict, request: Dict, image: str) -> Dict:
+        """
+        Move every replica of a service to a new image without downtime
+
+        The image must have been pulled already. A new container per
+        replica is started next to the old one (as <replica>-next) and probed. Only
+        once all of them are ready is NPM switched to them, in a single
+        proxy host update; the old containers are removed after draining
+        and the new ones take their names. If a new container cannot be
+        started or is not ready, or NPM cannot be switched, the new
+        containers are removed and the old ones keep serving.
+
+        Args:
+            service: service_name, container_id, network_name, internal_port and npm_proxy_host_id
+            request: Creation request of the service
+            image: New image
+
+        Returns:
+            {"switched": whether NPM now routes to the new image, "replicas": replicas serving, "errors": [...]}
+        """
+        name = service["service_name"]
+        network_name = service["network_name"]
+
+        old = await asyncio.to_thread(self.list_replicas, name)
+        if not old:
+            # Service created before replicas were tracked
+            old = [await self._describe(service["container_id"], name, 0, network_name)]
+        request = {**request, "docker_image": image}
+
+        async def start_next(replica: Dict) -> Dict:
+            next_name = replica_name(name, replica["index"]) + NEXT_SUFFIX
+            leftover = await asyncio.to_thread(self.docker_service.get_container, next_name)
+            if leftover:
+                # From an update that was interrupted before the switch
+                await self._remove(leftover.id, next_name)
+            return await self._create(name, request, network_name, replica["index"], next_name)
+
+        outcomes = await asyncio.gather(*(start_next(replica) for replica in old), return_exceptions=True)
+        new = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+        errors = [
+            f"Replica {replica['index']}: {outcome}"
+            for replica, outcome in zip(old, outcomes) if isinstance(outcome, BaseException)
+        ]
+        if not errors:
+            not_ready = await self.wait_ready(new, service["internal_port"])
+            errors = [f"Replica {index}: {error}" for index, error in not_ready.items() if error]
+        if not errors and service.get("npm_proxy_host_id"):
+            if not await self.publish(service["npm_proxy_host_id"], new):
+                errors.append("Failed to update the NPM proxy host")
+
+        if errors:
+            await asyncio.gather(*(self._remove(replica["container_id"], replica["container_name"]) for replica in new))
+            return {"switched": False, "replicas": old, "errors": errors}
+
+        await asyncio.sleep(settings.replica_drain_seconds)
+
+        async def replace(old_replica: Dict, new_replica: Dict) -> Optional[str]:
+            container = await asyncio.to_thread(
+                self.docker_service.get_container, old_replica["container_id"] or old_replica["container_name"]
+            )
+            target = replica_name(name, new_replica["index"])
+            if container and not await self._remove(container.id, container.name):
+                error = f"Failed to remove old container {old_replica['container_name']}"
+            elif not await asyncio.to_thread(self.docker_service.rename_container, new_replica["container_id"], target):
+                error = f"Failed to rename container {new_replica['container_name']}"
+            else:
+                if self.network_pool:
+                    await asyncio.to_thread(self.network_pool.rename, new_replica["container_name"], target)
+                new_replica["container_name"] = target
+                error = None
+            await asyncio.to_thread(self._save, name, new_replica)
+            return error
+
+        new.sort(key=lambda replica: replica["index"])
+        old.sort(key=lambda replica: replica["index"])
+        replaced = await asyncio.gather(*(replace(o, n) for o, n in zip(old, new)))
+        await asyncio.to_thread(self._set_image, name, image, new[0]["container_id"])
+        return {"switched": True, "replicas": new, "errors": [error for error in replaced if error]}
+
+    def _set_image(self, service_name: str, image: str, container_id: str):
+        db = SessionLocal()
+        try:
+            db.query(Service).filter(Service.service_name == service_name).update(
+                {"docker_image": image, "container_id": container_id}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
@@ -1,59 +1,214 @@
 import ipaddress
-from typing import Optional, Set
+from typing import Dict, List, Optional, Set
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from database import Subnet
+from .addressing import AddressPlan, Span, container_plan, merge, parse_ranges, span
+
+
+def _collect_free(first: int, prefix: int, used: List[Span], out: List[ipaddress.IPv4Network]):
+    """Append the maximal free sub-blocks of the block first/prefix, given the used spans overlapping it"""
+    last = first + (1 << (32 - prefix)) - 1
+    used = [u for u in used if u[0] <= last and u[1] >= first]
+    if not used:
+        out.append(ipaddress.IPv4Network((first, prefix)))
+        return
+    if any(u[0] <= first and u[1] >= last for u in used) or prefix >= 32:
+        return
+    half = 1 << (31 - prefix)
+    _collect_free(first, prefix + 1, used, out)
+    _collect_free(first + half, prefix + 1, used, out)
 
 
 class SubnetManager:
-    """Manages subnet allocation for Docker networks"""
+    """
+    Manages subnet allocation for Docker networks
+
+    Subnets of any prefix length are carved out of one or more pools with a
+    buddy allocator. The free space is the set of maximal aligned blocks
+    not overlapping an allocated subnet: a request takes the smallest free
+    block that fits (the first pool wins ties) and splits off its first
+    half until it has the requested size. Released subnets coalesce with
+    their free buddies by construction, as free blocks are derived from the
+    allocated ones rather than stored. Block arithmetic is done on integer
+    address spans (see addressing). Reserved ranges are never allocated.
+    """
 
-    def __init__(self, pool: str, subnet_size: int):
+    LOCK_NAME = "subnet-allocator"
+
+    # Smallest subnet a Docker network can use: gateway and one container
+    MAX_PREFIX = 30
+
+    def __init__(
+        self,
+        pool: str,
+        subnet_size: int,
+        lock_manager=None,
+        min_prefix: Optional[int] = None,
+        reserved: str = ""
+    ):
         """
         Initialize subnet manager
 
         Args:
-            pool: CIDR notation of the subnet pool (e.g., "172.20.0.0/16")
-            subnet_size: Size of subnets to allocate (e.g., 24 for /24)
+            pool: CIDR notation of the subnet pool(s), comma-separated (e.g., "172.20.0.0/16,10.90.0.0/16")
+            subnet_size: Default prefix length of allocated subnets (e.g., 24 for /24)
+            lock_manager: Optional JobLockManager serializing allocation across workers
+            min_prefix: Largest subnet (smallest prefix length) a request may ask for
+            reserved: Ranges inside the pools never to allocate, e.g. "172.20.255.0/24,172.20.0.1-172.20.0.9"
+
+        Raises:
+            ValueError: If a pool or range is malformed or pools overlap
         """
-        self.pool = ipaddress.IPv4Network(pool)
+        self.pools = [ipaddress.IPv4Network(p.strip()) for p in pool.split(",") if p.strip()]
+        if not self.pools:
+            raise ValueError("SUBNET_POOL must name at least one pool")
+        for i, first in enumerate(self.pools):
+            for second in self.pools[i + 1:]:
+                if first.overlaps(second):
+                    raise ValueError(f"Subnet pools {first} and {second} overlap")
+        self.pool = self.pools[0]
         self.subnet_size = subnet_size
+        self.lock_manager = lock_manager
+        self.min_prefix = min_prefix if min_prefix is not None else min(p.prefixlen for p in self.pools)
+        self.reserved = parse_ranges(reserved)
+        self.validate_prefix(subnet_size)
+
+    def validate_prefix(self, prefix: int):
+        """
+        Check that subnets of a prefix length can be allocated
+
+        Raises:
+            ValueError: If the prefix is outside the allowed range or larger than every pool
+        """
+        smallest = max(self.min_prefix, min(p.prefixlen for p in self.pools))
+        if not smallest <= prefix <= self.MAX_PREFIX:
+            raise ValueError(f"Subnet prefix must be between /{smallest} and /{self.MAX_PREFIX}")
 
     def get_available_subnets(self, db: Session) -> Set[str]:
         """Get all used subnets from database"""
         used_subnets = db.query(Subnet.subnet).filter(Subnet.in_use == True).all()
         return {subnet[0] for subnet in used_subnets}
 
-    def allocate_subnet(self, db: Session, service_name: str) -> Optional[str]:
+    def _used_networks(self, db: Session) -> List[ipaddress.IPv4Network]:
+        return sorted(ipaddress.IPv4Network(s) for s in self.get_available_subnets(db))
+
+    def free_blocks(self, used: List[ipaddress.IPv4Network]) -> List[ipaddress.IPv4Network]:
+        """Maximal free aligned blocks of the pools (outside used subnets and reserved ranges), in pool then address order"""
+        taken = merge([span(u) for u in used] + self.reserved)
+        blocks = []
+        for pool in self.pools:
+            _collect_free(int(pool.network_address), pool.prefixlen, taken, blocks)
+        return blocks
+
+    def allocate_subnet(self, db: Session, service_name: str, prefix: Optional[int] = None) -> Optional[str]:
         """
         Allocate a new subnet for a service
 
         Args:
             db: Database session
             service_name: Name of the service requesting the subnet
+            prefix: Prefix length of the subnet (default: subnet_size)
 
         Returns:
             Subnet in CIDR notation or None if no subnets available
         """
-        used_subnets = self.get_available_subnets(db)
-
-        # Generate all possible subnets from the pool
-        for subnet in self.pool.subnets(new_prefix=self.subnet_size):
-            subnet_str = str(subnet)
-            if subnet_str not in used_subnets:
-                # Allocate this subnet
-                new_subnet = Subnet(
-                    subnet=subnet_str,
-                    service_name=service_name,
-                    in_use=True
-                )
-                db.add(new_subnet)
-                db.commit()
-                return subnet_str
-
-        return None
+        prefix = prefix or self.subnet_size
+        token = None
+        if self.lock_manager:
+            token = self.lock_manager.acquire(self.LOCK_NAME, ttl=30, wait=10.0)
+            if not token:
+                return None
+
+        try:
+            # A claim only fails if a worker without the lock took an overlapping subnet meanwhile
+            for _ in range(5):
+                fitting = [b for b in self.free_blocks(self._used_networks(db)) if b.prefixlen <= prefix]
+                if not fitting:
+                    return None
+                block = max(fitting, key=lambda b: b.prefixlen)
+                subnet_str = str(ipaddress.IPv4Network((int(block.network_address), prefix)))
+                if self._claim_subnet(db, subnet_str, service_name):
+                    return subnet_str
+
+            return None
+        finally:
+            if token:
+                self.lock_manager.release(self.LOCK_NAME, token)
+
+    def _claim_subnet(self, db: Session, subnet: str, service_name: str) -> bool:
+        """
+        Atomically mark a subnet as used by service_name
+
+        Released subnets keep their row, so they are reclaimed with a
+        conditional UPDATE; new ones are inserted and rely on the unique
+        constraint if another worker raced us to the same subnet.
+        """
+        reclaimed = db.query(Subnet).filter(
+            Subnet.subnet == subnet,
+            Subnet.in_use == False
+        ).update(
+            {"in_use": True, "service_name": service_name},
+            synchronize_session=False
+        )
+        if reclaimed:
+            db.commit()
+            return True
+
+        try:
+            db.add(Subnet(subnet=subnet, service_name=service_name, in_use=True))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    def reserve_subnet(self, db: Session, subnet: str, service_name: str) -> bool:
+        """
+        Claim a specific subnet for a service (e.g. when restoring an export)
+
+        Args:
+            db: Database session
+            subnet: Subnet in CIDR notation, inside a pool
+            service_name: Service the subnet is reserved for
+
+        Returns:
+            True if the subnet is (now) allocated to service_name
+        """
+        network = ipaddress.IPv4Network(subnet)
+        if not any(network.subnet_of(pool) for pool in self.pools):
+            return False
+
+        current = self.get_service_subnet(db, service_name)
+        if current:
+            return current == str(network)
+
+        token = None
+        if self.lock_manager:
+            token = self.lock_manager.acquire(self.LOCK_NAME, ttl=30, wait=10.0)
+            if not token:
+                return False
+        try:
+            first, last = span(network)
+            if any(network.overlaps(used) for used in self._used_networks(db)) or any(
+                r_first <= last and r_last >= first for r_first, r_last in self.reserved
+            ):
+                return False
+            return self._claim_subnet(db, str(network), service_name)
+        finally:
+            if token:
+                self.lock_manager.release(self.LOCK_NAME, token)
+
+    def get_service_subnet(self, db: Session, service_name: str) -> Optional[str]:
+        """Get the subnet currently allocated to a service, if any"""
+        subnet_record = db.query(Subnet).filter(
+            Subnet.service_name == service_name,
+            Subnet.in_use == True
+        ).first()
+        return subnet_record.subnet if subnet_record else None
 
     def release_subnet(self, db: Session, subnet: str) -> bool:
         """
@@ -73,12 +228,55 @@ class SubnetManager:
             return True
         return False
 
+    def stats(self, db: Session) -> Dict:
+        """
+        Utilization and fragmentation of each pool
+
+        Fragmentation is the share of the free addresses that are not in
+        the largest free block (0: all free space is one block); stranded
+        addresses are free ones in blocks too small for a default subnet.
+        """
+        used = self._used_networks(db)
+        free = self.free_blocks(used)
+        pools = []
+        for pool in self.pools:
+            pool_free = [b for b in free if b.subnet_of(pool)]
+            free_addresses = sum(b.num_addresses for b in pool_free)
+            largest = max(pool_free, key=lambda b: b.num_addresses, default=None)
+            by_prefix: Dict[str, int] = {}
+            for block in pool_free:
+                by_prefix[f"/{block.prefixlen}"] = by_prefix.get(f"/{block.prefixlen}", 0) + 1
+            pool_first, pool_last = span(pool)
+            reserved = sum(
+                min(last, pool_last) - max(first, pool_first) + 1
+                for first, last in self.reserved if first <= pool_last and last >= pool_first
+            )
+            pools.append({
+                "pool": str(pool),
+                "addresses": pool.num_addresses,
+                "reserved_addresses": reserved,
+                "allocated_addresses": pool.num_addresses - free_addresses - reserved,
+                "utilization": round(1 - free_addresses / (pool.num_addresses - reserved), 4) if reserved < pool.num_addresses else 1.0,
+                "subnets": sum(1 for u in used if u.subnet_of(pool)),
+                "free_blocks": dict(sorted(by_prefix.items(), key=lambda item: int(item[0][1:]))),
+                "largest_free_block": str(largest) if largest else None,
+                "fragmentation": round(1 - largest.num_addresses / free_addresses, 4) if largest else 0.0,
+                "free_default_subnets": sum(
+                    b.num_addresses >> (32 - self.subnet_size) for b in pool_free if b.prefixlen <= self.subnet_size
+                ),
+                "stranded_addresses": sum(b.num_addresses for b in pool_free if b.prefixlen > self.subnet_size)
+            })
+        return {"default_prefix": self.subnet_size, "min_prefix": self.min_prefix, "pools": pools}
+
+    @staticmethod
+    def container_capacity(subnet: str) -> int:
+        """Containers a network on this subnet can hold (network, gateway and broadcast addresses excluded)"""
+        return len(container_plan(subnet))
+
     def get_gateway_ip(self, subnet: str) -> str:
         """Get the gateway IP for a subnet (first usable IP)"""
-        network = ipaddress.IPv4Network(subnet)
-        return str(list(network.hosts())[0])
+        return AddressPlan(subnet).nth(0)
 
     def get_container_ip(self, subnet: str) -> str:
         """Get the container IP for a subnet (second usable IP)"""
-        network = ipaddress.IPv4Network(subnet)
-        return str(list(network.hosts())[1])
+        return AddressPlan(subnet).nth(1)
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import SessionLocal, TeardownStep
+from .rate_limiter import background_priority
+
+logger = logging.getLogger(__name__)
+
+# Steps that must be done before a step may run: a network cannot be removed
+# while containers are attached, and its subnet must not be handed to another
+# service before it is gone. NPM and DNS have no prerequisite.
+DEPENDS_ON = {
+    "network": ("containers",),
+    "subnet": ("containers", "network")
+}
+
+STEP_ERRORS = {
+    "containers": "Failed to remove Docker containers",
+    "network": "Failed to remove Docker network",
+    "subnet": "Failed to release subnet",
+    "npm_host": "Failed to remove NPM proxy host",
+    "dns_record": "Failed to remove DNS record"
+}
+
+
+def _step_to_dict(row: TeardownStep) -> Dict:
+    return {
+        "step": row.step,
+        "target": json.loads(row.target) if row.target else {},
+        "status": row.status,
+        "attempts": row.attempts,
+        "error": row.error,
+        "next_attempt_at": row.next_attempt_at.isoformat() if row.next_attempt_at else None
+    }
+
+
+class TeardownQueue:
+    """
+    Cleanup of deleted services, in parallel, ordered and retried in the background
+
+    Deleting a service records one step per resource to remove (containers,
+    network, subnet, NPM proxy host, DNS record) in the same transaction as
+    the service row, so nothing is forgotten if the process stops. Steps run
+    as soon as their prerequisites (DEPENDS_ON) are done: the NPM and DNS
+    deletions overlap with the container stop, and the network and subnet
+    follow the containers. A failed step is retried with a growing delay,
+    up to max_attempts; the steps that depend on it wait for it. Steps are
+    claimed in the database, so several workers can resume the same
+    teardown; finished teardowns are dropped.
+    """
+
+    # A running step older than this was abandoned by a stopped worker
+    STALE_AFTER = timedelta(minutes=10)
+
+    def __init__(
+        self,
+        docker_service,
+        replica_manager,
+        subnet_manager,
+        get_npm_service: Callable,
+        zone_registry,
+        certificate_queue=None,
+        network_pool=None,
+        max_attempts: int = 5,
+        retry_delay: float = 30.0
+    ):
+        """
+        Initialize the queue
+
+        Args:
+            docker_service: Docker client
+            replica_manager: Removes the replica containers of a service
+            subnet_manager: Releases dedicated subnets
+            get_npm_service: Returns the current NPM client
+            zone_registry: DNS clients by zone
+            certificate_queue: Forgets the certificate request of a removed proxy host
+            network_pool: Releases the static IPs of services on pooled networks
+            max_attempts: Attempts before a step is marked failed
+            retry_delay: Delay before the first retry (doubled on each retry)
+        """
+        self.docker_service = docker_service
+        self.replica_manager = replica_manager
+        self.subnet_manager = subnet_manager
+        self.get_npm_service = get_npm_service
+        self.zone_registry = zone_registry
+        self.certificate_queue = certificate_queue
+        self.network_pool = network_pool
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._tasks = set()
+
+    # Queueing
+
+    def enqueue(self, db: Session, service) -> str:
+        """
+        Record the teardown steps of a service in db (committed by the caller)
+
+        Args:
+            db: Session the service row is deleted in
+            service: Service row
+
+        Returns:
+            Teardown ID
+        """
+        shared = self.network_pool is not None and self.network_pool.is_shared(service.network_name)
+        steps = [("containers", {"container_id": service.container_id})]
+        if service.network_name and not shared:
+            steps.append(("network", {"network_name": service.network_name}))
+        if service.subnet and not shared:
+            steps.append(("subnet", {"subnet": service.subnet}))
+        if service.npm_proxy_host_id:
+            steps.append(("npm_host", {"proxy_host_id": service.npm_proxy_host_id}))
+        if service.dns_record_id:
+            steps.append(("dns_record", {"record_id": service.dns_record_id, "zone": service.dns_zone}))
+
+        teardown_id = uuid.uuid4().hex
+        for step, target in steps:
+            db.add(TeardownStep(
+                teardown_id=teardown_id,
+                service_name=service.service_name,
+                step=step,
+                target=json.dumps(target),
+                status="pending",
+                attempts=0
+            ))
+        return teardown_id
+
+    async def run(self, teardown_id: str, wait: float) -> List[Dict]:
+        """
+        Start a teardown and wait for it at most wait seconds
+
+        Returns:
+            Steps as they stand when it finished or wait ran out (the rest goes on)
+        """
+        task = self._spawn(teardown_id)
+        await asyncio.wait({task}, timeout=wait)
+        return self.steps(teardown_id)
+
+    def _spawn(self, teardown_id: str, delay: float = 0.0) -> asyncio.Task:
+        task = asyncio.create_task(self._run(teardown_id, delay))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def resume(self):
+        """Restart teardowns left unfinished by a stopped worker"""
+        db = SessionLocal()
+        try:
+            db.query(TeardownStep).filter(
+                TeardownStep.status == "running",
+                TeardownStep.updated_at < datetime.utcnow() - self.STALE_AFTER
+            ).update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+            teardown_ids = [
+                teardown_id for (teardown_id,) in
+                db.query(TeardownStep.teardown_id).filter(TeardownStep.status == "pending").distinct()
+            ]
+        finally:
+            db.close()
+
+        for teardown_id in teardown_ids:
+            self._spawn(teardown_id)
+
+    def retry(self, teardown_id: str) -> bool:
+        """Give the failed steps of a teardown a new round of attempts"""
+        db = SessionLocal()
+        try:
+            retried = db.query(TeardownStep).filter(
+                TeardownStep.teardown_id == teardown_id,
+                TeardownStep.status == "failed"
+            ).update(
+                {"status": "pending", "attempts": 0, "next_attempt_at": None},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        if retried:
+            self._spawn(teardown_id)
+        return retried > 0
+
+    # Status
+
+    def steps(self, teardown_id: str) -> List[Dict]:
+        """Steps of a teardown (empty once every step is done)"""
+        db = SessionLocal()
+        try:
+            rows = db.query(TeardownStep).filter(
+                TeardownStep.teardown_id == teardown_id
+            ).order_by(TeardownStep.id).all()
+            return [_step_to_dict(row) for row in rows]
+        finally:
+            db.close()
+
+    def list_teardowns(self) -> List[Dict]:
+        """Unfinished teardowns with their steps"""
+        db = SessionLocal()
+        try:
+            teardowns: Dict[str, Dict] = {}
+            for row in db.query(TeardownStep).order_by(TeardownStep.id).all():
+                teardown = teardowns.setdefault(row.teardown_id, {
+                    "teardown_id": row.teardown_id,
+                    "service_name": row.service_name,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "steps": []
+                })
+                teardown["steps"].append(_step_to_dict(row))
+            return list(teardowns.values())
+        finally:
+            db.close()
+
+    def pending(self, service_name: str) -> bool:
+        """Whether resources of a deleted service with this name may still exist"""
+        db = SessionLocal()
+        try:
+            return db.query(TeardownStep.id).filter(
+                TeardownStep.service_name == service_name
+            ).first() is not None
+        finally:
+            db.close()
+
+    # Execution
+
+    def _ready(self, teardown_id: str) -> Tuple[List[int], Optional[datetime]]:
+        """Steps that may run now, and the time of the next scheduled retry"""
+        db = SessionLocal()
+        try:
+            rows = db.query(TeardownStep).filter(TeardownStep.teardown_id == teardown_id).all()
+        finally:
+            db.close()
+
+        statuses = {row.step: row.status for row in rows}
+        now = datetime.utcnow()
+        ready, next_attempt = [], None
+        for row in rows:
+            if row.status != "pending":
+                continue
+            if any(statuses.get(step, "done") != "done" for step in DEPENDS_ON.get(row.step, ())):
+                continue
+            if row.next_attempt_at and row.next_attempt_at > now:
+                next_attempt = min(next_attempt or row.next_attempt_at, row.next_attempt_at)
+                continue
+            ready.append(row.id)
+        return ready, next_attempt
+
+    def _claim(self, step_id: int) -> Optional[TeardownStep]:
+        """Move a pending step to running; None if another worker took it"""
+        db = SessionLocal()
+        try:
+            claimed = db.query(TeardownStep).filter(
+                TeardownStep.id == step_id,
+                TeardownStep.status == "pending"
+            ).update(
+                {"status": "running", "attempts": TeardownStep.attempts + 1},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return None
+            row = db.query(TeardownStep).filter(TeardownStep.id == step_id).first()
+            db.expunge(row)
+            return row
+        finally:
+            db.close()
+
+    def _finish(self, step_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(TeardownStep).filter(TeardownStep.id == step_id).update(fields, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _drop_if_done(self, teardown_id: str):
+        db = SessionLocal()
+        try:
+            unfinished = db.query(TeardownStep.id).filter(
+                TeardownStep.teardown_id == teardown_id,
+                TeardownStep.status != "done"
+            ).first()
+            if not unfinished:
+                db.query(TeardownStep).filter(TeardownStep.teardown_id == teardown_id).delete()
+                db.commit()
+        finally:
+            db.close()
+
+    def _release_subnet(self, subnet: str):
+        db = SessionLocal()
+        try:
+            self.subnet_manager.release_subnet(db, subnet)
+        finally:
+            db.close()
+
+    async def _run(self, teardown_id: str, delay: float = 0.0):
+        if delay:
+            await asyncio.sleep(delay)
+
+        while True:
+            ready, next_attempt = await asyncio.to_thread(self._ready, teardown_id)
+            if not ready:
+                break
+            await asyncio.gather(*(self._attempt(step_id) for step_id in ready))
+
+        await asyncio.to_thread(self._drop_if_done, teardown_id)
+        if next_attempt:
+            self._spawn(teardown_id, max((next_attempt - datetime.utcnow()).total_seconds(), 0.0))
+
+    async def _attempt(self, step_id: int):
+        row = await asyncio.to_thread(self._claim, step_id)
+        if not row:
+            return
+
+        try:
+            with background_priority():
+                await self._execute(row.service_name, row.step, json.loads(row.target or "{}"))
+        except Exception as e:
+            error = f"{STEP_ERRORS[row.step]}: {e}" if str(e) else STEP_ERRORS[row.step]
+            logger.warning(
+                "Teardown step %s of %s failed (attempt %d/%d): %s",
+                row.step, row.service_name, row.attempts, self.max_attempts, error,
+                extra={"service": row.service_name, "teardown_id": row.teardown_id, "step": row.step}
+            )
+            if row.attempts < self.max_attempts:
+                retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (row.attempts - 1))
+                await asyncio.to_thread(self._finish, step_id, status="pending", error=error, next_attempt_at=retry_at)
+            else:
+                await asyncio.to_thread(self._finish, step_id, status="failed", error=error, next_attempt_at=None)
+            return
+
+        await asyncio.to_thread(self._finish, step_id, status="done", error=None, next_attempt_at=None)
+
+    async def _execute(self, service_name: str, step: str, target: Dict):
+        """Run one step; raises on failure (an empty message uses STEP_ERRORS)"""
+        if step == "containers":
+            errors = await self.replica_manager.remove_all(service_name, target.get("container_id"))
+            if errors:
+                raise Exception("; ".join(errors))
+            if self.network_pool:
+                await asyncio.to_thread(self.network_pool.release_service, service_name)
+
+        elif step == "network":
+            network_name = target["network_name"]
+            if await asyncio.to_thread(self.docker_service.get_network, network_name) is None:
+                return
+            if not await asyncio.to_thread(self.docker_service.remove_network, network_name):
+                raise Exception()
+
+        elif step == "subnet":
+            await asyncio.to_thread(self._release_subnet, target["subnet"])
+
+        elif step == "npm_host":
+            npm_service = self.get_npm_service()
+            proxy_host_id = target["proxy_host_id"]
+            if not await asyncio.to_thread(npm_service.delete_proxy_host, proxy_host_id, True):
+                raise Exception()
+            if self.certificate_queue:
+                await asyncio.to_thread(self.certificate_queue.forget, proxy_host_id)
+
+        elif step == "dns_record":
+            try:
+                dns_service = await self.zone_registry.get(target.get("zone"))
+            except KeyError as e:
+                raise Exception(str(e).strip("'\""))
+            if not (await dns_service.batch_delete([target["record_id"]], missing_ok=True))[0]:
+                raise Exception(dns_service.last_error or "")
+
+        else:
+            raise Exception(f"Unknown teardown step {step}")
@@ -0,0 +1,88 @@
+import logging
+import time
+import requests
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import settings
+from tracing import KIND_CLIENT, tracer
+from .circuit_breaker import get_breaker
+from .rate_limiter import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamSession(requests.Session):
+    """
+    requests.Session whose calls go through the upstream's scheduler and breaker
+
+    Every request is rejected with CircuitOpenError while the upstream's
+    circuit is open, otherwise waits for a rate-limit token, feeds the
+    response back to the scheduler, and is retried after the advertised
+    delay on HTTP 429. Connection errors, timeouts and 5xx responses count
+    as breaker failures. Calls get a default timeout and connections are
+    pooled across calls.
+    """
+
+    def __init__(self, upstream: str):
+        super().__init__()
+        self.upstream = upstream
+        self.max_retries = settings.upstream_max_retries
+
+    def request(self, method, url, *args, **kwargs):
+        started = time.monotonic()
+        fields = {"upstream": self.upstream, "http_method": method.upper(), "url": url.split("?")[0]}
+        try:
+            if tracer.enabled:
+                response = self._traced_send(method, url, fields, *args, **kwargs)
+            else:
+                response = self._send(method, url, *args, **kwargs)
+        except Exception as e:
+            fields["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+            logger.warning("Upstream call failed: %s", e, extra=fields)
+            raise
+
+        fields["status"] = response.status_code
+        fields["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        if response.status_code >= 500 or response.status_code == 429:
+            logger.warning("Upstream call returned HTTP %s", response.status_code, extra=fields)
+        else:
+            logger.info("Upstream call", extra={**fields, "sample": True})
+        return response
+
+    def _traced_send(self, method, url, fields, *args, **kwargs):
+        attributes = {"upstream": self.upstream, "http.method": fields["http_method"], "http.url": fields["url"]}
+        with tracer.span(f"HTTP {method.upper()}", kind=KIND_CLIENT, **attributes) as span:
+            response = self._send(method, url, *args, **kwargs)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.record_error(f"HTTP {response.status_code}")
+            return response
+
+    def _send(self, method, url, *args, **kwargs):
+        scheduler = get_scheduler(self.upstream)
+        breaker = get_breaker(self.upstream)
+        kwargs.setdefault("timeout", settings.upstream_timeout)
+
+        for attempt in range(self.max_retries + 1):
+            breaker.before_call()
+            response = None
+            try:
+                scheduler.acquire()
+                response = super().request(method, url, *args, **kwargs)
+            finally:
+                # Anything but a response (connection error, bad URL, interrupt, failing
+                # hook) is a failure, so a half-open probe slot is always given back
+                if response is None or response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            scheduler.observe(response.status_code, response.headers)
+
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            scheduler.record_retry()
+            if tracer.enabled:
+                tracer.current_span().set_attribute("http.retries", attempt + 1)
+
+        return response
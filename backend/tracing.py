@@ -0,0 +1,375 @@
+"""
+Lightweight request tracing with OpenTelemetry-compatible spans
+
+Spans carry W3C trace context IDs (32 hex digit trace ID, 16 hex digit span
+ID) and nest through a context variable, so spans opened in asyncio tasks or
+in asyncio.to_thread() workers become children of the span that started them.
+Finished spans are queued and exported in batches from a background thread,
+either as JSON lines to a file or as OTLP/JSON to a local collector
+(`POST <endpoint>/v1/traces`), so exporting never blocks a request.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from config import settings
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace"""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "kind",
+        "attributes", "start_ns", "end_ns", "error", "_tracer"
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict] = None
+    ):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.error = str(error) or type(error).__name__
+        if isinstance(error, BaseException):
+            self.attributes["exception.type"] = type(error).__name__
+
+    def end(self):
+        """Finish the span and hand it to the exporter (ending twice is a no-op)"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._tracer._finish(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def traceparent(self) -> str:
+        """W3C traceparent header value continuing this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class FileExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps({"service": self.service_name, **span.to_dict()}, default=str) + "\n")
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """Sends finished spans to an OpenTelemetry collector over OTLP/HTTP (JSON encoding)"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        # Deliberately not an UpstreamSession: export calls are not traced or rate limited
+        self.session = requests.Session()
+
+    def _span(self, span: Span) -> Dict:
+        data = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items() if value is not None
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+        if span.parent_id:
+            data["parentSpanId"] = span.parent_id
+        return data
+
+    def export(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "docker-orchestrator"},
+                    "spans": [self._span(span) for span in spans]
+                }]
+            }]
+        }
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    """
+    Creates spans and exports them in the background
+
+    Without an exporter, spans are still created for requests (so responses
+    carry a trace ID) but traced methods skip span creation entirely.
+    Finished spans wait in a bounded queue; when the exporter falls behind,
+    new spans are dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(
+        self,
+        exporter=None,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 2.0
+    ):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.exported = 0
+        self.export_errors = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict] = None,
+        kind: int = KIND_INTERNAL,
+        parent: Optional[Tuple[str, str]] = None
+    ) -> Span:
+        """
+        Start a span without making it current (for leaf spans such as SQL statements)
+
+        Args:
+            name: Span name
+            attributes: Initial attributes
+            kind: KIND_INTERNAL, KIND_SERVER or KIND_CLIENT
+            parent: (trace ID, span ID) of a remote parent, default the current span
+
+        Returns:
+            The started span; call end() to finish it
+        """
+        if parent:
+            trace_id, parent_id = parent
+        else:
+            current = _current_span.get()
+            trace_id = current.trace_id if current else secrets.token_hex(16)
+            parent_id = current.span_id if current else None
+        return Span(self, name, trace_id, parent_id, kind, attributes)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: int = KIND_INTERNAL,
+        parent: Optional[Tuple[str, str]] = None,
+        **attributes
+    ):
+        """Run a block inside a new current span, recording any exception it raises"""
+        span = self.start_span(name, attributes, kind, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def _finish(self, span: Span):
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._worker is None:
+            self._start_worker()
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.export_errors += 1
+            logger.warning("Error exporting %d trace spans: %s", len(batch), e, extra={"exporter": type(self.exporter).__name__})
+
+    def flush(self):
+        """Export every queued span now (e.g. at shutdown)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch and self.enabled:
+            self._export(batch)
+
+    def stats(self) -> Dict:
+        return {
+            "exporter": type(self.exporter).__name__ if self.exporter else None,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "export_errors": self.export_errors
+        }
+
+
+def _build_exporter():
+    if settings.tracing_exporter == "file":
+        return FileExporter(settings.tracing_file, settings.tracing_service_name)
+    if settings.tracing_exporter == "otlp":
+        return OTLPExporter(settings.tracing_otlp_endpoint, settings.tracing_service_name)
+    return None
+
+
+tracer = Tracer(_build_exporter())
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace ID, parent span ID) from a W3C traceparent header, None if absent or malformed"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+def traced(name: str):
+    """Decorator running a sync or async function inside a span (when tracing is enabled)"""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_methods(prefix: str, include: Tuple[str, ...] = (), exclude: Tuple[str, ...] = ()):
+    """
+    Class decorator tracing the methods a class defines
+
+    Public methods, plus the private ones listed in include, each get a
+    "<prefix>.<method>" span. Generators and static/class methods are left as is.
+    """
+    def decorate(cls):
+        for attr, value in list(vars(cls).items()):
+            if not inspect.isfunction(value) or attr in exclude:
+                continue
+            if attr.startswith("_") and attr not in include:
+                continue
+            if inspect.isgeneratorfunction(value) or inspect.isasyncgenfunction(value):
+                continue
+            setattr(cls, attr, traced(f"{prefix}.{attr}")(value))
+        return cls
+    return decorate
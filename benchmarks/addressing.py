@@ -0,0 +1,92 @@
+"""
+Micro-benchmark gateway/container IP computation, /8 through /30
+
+Compares, per prefix length, the previous SubnetManager approach -
+`list(network.hosts())[i]`, which builds every host address - with the
+positional arithmetic of services/addressing.py:
+
+- hosts_list: list(network.hosts())[1] (skipped above --legacy-max-hosts hosts)
+- nth: AddressPlan(subnet).nth(1), the container IP
+- capacity: len(container_plan(subnet)), what a network can hold
+- first_free: container_plan(subnet, reserved).first_free(taken) with 64 taken addresses
+
+    python benchmarks/addressing.py
+    python benchmarks/addressing.py --prefixes 8,16,24,30 --legacy-max-hosts 16777216
+"""
+import argparse
+import ipaddress
+import json
+import os
+import sys
+import timeit
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend", "services"))
+from addressing import AddressPlan, container_plan, host_span, parse_ranges
+
+BASE = "10.0.0.0"
+
+
+def per_call_us(fn: Callable, budget: float) -> float:
+    """Microseconds per call, running fn for about budget seconds"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < budget:
+        number = max(int(number * budget / max(elapsed, 1e-9)), 1)
+        elapsed = timer.timeit(number)
+    return elapsed / number * 1e6
+
+
+def measure(prefix: int, legacy_max_hosts: int, budget: float) -> Dict[str, Optional[float]]:
+    subnet = f"{BASE}/{prefix}"
+    network = ipaddress.IPv4Network(subnet)
+    first_host = host_span(subnet)[0]
+    taken = set(range(first_host + 1, first_host + 65))
+    reserved = parse_ranges(f"{ipaddress.IPv4Address(first_host + 100)}-{ipaddress.IPv4Address(first_host + 110)}")
+
+    results = {
+        "hosts": len(AddressPlan(subnet)),
+        "hosts_list_us": None,
+        "nth_us": round(per_call_us(lambda: AddressPlan(subnet).nth(1), budget), 2),
+        "capacity_us": round(per_call_us(lambda: len(container_plan(subnet)), budget), 2),
+        "first_free_us": round(per_call_us(lambda: container_plan(subnet, reserved).first_free(taken), budget), 2)
+    }
+    if results["hosts"] <= legacy_max_hosts:
+        # Building the list dominates; one or a few runs are representative
+        results["hosts_list_us"] = round(per_call_us(lambda: str(list(network.hosts())[1]), budget), 2)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefixes", default=",".join(str(p) for p in range(8, 31)),
+                        help="Comma-separated prefix lengths (default: 8 to 30)")
+    parser.add_argument("--legacy-max-hosts", type=int, default=1 << 16,
+                        help="Largest subnet (in hosts) to time list(network.hosts()) on")
+    parser.add_argument("--budget", type=float, default=0.2, help="Seconds of timing per measurement")
+    parser.add_argument("--json", help="Write results to this file")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    prefixes = [int(p) for p in args.prefixes.split(",")]
+    results = {}
+    print(f"{'prefix':<7}  {'hosts':>10}  {'hosts list us':>14}  {'nth us':>8}  {'capacity us':>11}  {'first_free us':>13}")
+    for prefix in prefixes:
+        r = measure(prefix, args.legacy_max_hosts, args.budget)
+        results[f"/{prefix}"] = r
+        legacy = r["hosts_list_us"] if r["hosts_list_us"] is not None else "skipped"
+        print(
+            f"/{prefix:<6}  {r['hosts']:>10}  {legacy:>14}  {r['nth_us']:>8}  "
+            f"{r['capacity_us']:>11}  {r['first_free_us']:>13}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"addressing": results, "options": {k: v for k, v in vars(args).items() if k != "json"}}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
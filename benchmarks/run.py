@@ -0,0 +1,331 @@
+"""
+Benchmark the backend API against local upstream stubs
+
+Starts the NPM, OVH, Cloudflare and Docker stubs (see stubs.py), launches
+the backend with uvicorn pointed at them, then drives each endpoint
+scenario with concurrent clients and reports p50/p99 latency and
+throughput per endpoint.
+
+    python benchmarks/run.py --requests 500 --concurrency 32
+    python benchmarks/run.py --cloudflare-latency 0.2 --npm-error-rate 0.05
+    python benchmarks/run.py --json results.json --baseline previous.json
+
+With --baseline, endpoints whose p99 grew (or throughput dropped) by more
+than --tolerance are reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import CloudflareStub, DockerStub, NPMStub, OVHStub, StubConfig
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+ZONE = "bench.test"
+STUBS = ("npm", "ovh", "cloudflare", "docker")
+
+
+@dataclass
+class Scenario:
+    """One endpoint driven by `requests` calls, `concurrency` at a time"""
+
+    name: str
+    method: str
+    path: Callable[[int], str]
+    body: Optional[Callable[[int], Dict]] = None
+    requests: int = 100
+    concurrency: int = 8
+    ok_statuses: tuple = (200,)
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile in milliseconds"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+        return ordered[min(rank, len(ordered) - 1)] * 1000
+
+    def summary(self) -> Dict:
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "p50_ms": round(self.percentile(50), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "throughput_rps": round(count / self.elapsed, 2) if self.elapsed else 0.0
+        }
+
+
+def run_scenario(base_url: str, scenario: Scenario) -> Result:
+    result = Result(scenario.name)
+    lock = threading.Lock()
+    local = threading.local()
+
+    def call(i: int):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(
+                scenario.method,
+                f"{base_url}{scenario.path(i)}",
+                json=scenario.body(i) if scenario.body else None,
+                timeout=120
+            )
+            status = str(response.status_code)
+            failed = response.status_code not in scenario.ok_statuses
+        except requests.RequestException as e:
+            status = type(e).__name__
+            failed = True
+        duration = time.perf_counter() - started
+        with lock:
+            result.latencies.append(duration)
+            result.statuses[status] = result.statuses.get(status, 0) + 1
+            result.errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scenario.concurrency) as pool:
+        list(pool.map(call, range(scenario.requests)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def build_scenarios(args) -> List[Scenario]:
+    n, c = args.requests, args.concurrency
+    services = args.services
+    return [
+        Scenario("GET /health", "GET", lambda i: "/health", requests=n, concurrency=c),
+        Scenario("GET /api/npm/hosts", "GET", lambda i: "/api/npm/hosts", requests=n, concurrency=c),
+        Scenario("GET /api/dns/records", "GET", lambda i: "/api/dns/records", requests=n, concurrency=c),
+        Scenario(
+            "GET /api/subdomains/{name}/availability", "GET",
+            lambda i: f"/api/subdomains/seed-{i % max(args.records, 1)}/availability",
+            requests=n, concurrency=c
+        ),
+        Scenario(
+            "POST /api/dns-proxy", "POST", lambda i: "/api/dns-proxy",
+            body=lambda i: {
+                "subdomain": f"proxy-{i}",
+                "target_host": "10.1.0.1",
+                "target_port": 8080,
+                "enable_ssl": False
+            },
+            requests=n, concurrency=c
+        ),
+        Scenario(
+            "POST /api/services", "POST", lambda i: "/api/services",
+            body=lambda i: {"service_name": f"bench-{i}", "docker_image": "nginx:alpine", "internal_port": 80},
+            requests=services, concurrency=c
+        ),
+        Scenario("GET /api/services", "GET", lambda i: "/api/services", requests=n, concurrency=c),
+        Scenario(
+            "DELETE /api/services/{name}", "DELETE", lambda i: f"/api/services/bench-{i}",
+            requests=services, concurrency=c
+        ),
+    ]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def backend_env(
+    stubs: Dict,
+    workdir: str,
+    dns_provider: str = "ovh",
+    workers: int = 1,
+    docker_host: Optional[str] = None
+) -> Dict[str, str]:
+    """Start the stubs and build the backend environment pointing at them (and at a scratch database)"""
+    return {
+        "NPM_URL": stubs["npm"].start_tcp(),
+        "NPM_EMAIL": "bench@example.com",
+        "NPM_PASSWORD": "bench",
+        "OVH_API_URL": stubs["ovh"].start_tcp() + "/1.0",
+        "OVH_APPLICATION_KEY": "bench",
+        "OVH_APPLICATION_SECRET": "bench",
+        "OVH_CONSUMER_KEY": "bench",
+        "OVH_ZONE_NAME": ZONE,
+        "CLOUDFLARE_API_URL": stubs["cloudflare"].start_tcp(),
+        "CLOUDFLARE_API_TOKEN": "bench",
+        "CLOUDFLARE_ZONE_ID": "bench-zone",
+        "DNS_PROVIDER": dns_provider,
+        "DOCKER_HOST": docker_host or stubs["docker"].start_unix(os.path.join(workdir, "docker.sock")),
+        "SERVER_PUBLIC_IP": "203.0.113.10",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'orchestrator.db')}",
+        "BROADCAST_DIR": os.path.join(workdir, "broadcast"),
+        "WORKERS": str(workers),
+        # Stub containers do not listen on their port: go by HEALTHCHECK/running state
+        "READINESS_PROBE": "healthcheck",
+        # The stubs are the thing under load, not the client-side limits
+        "NPM_RATE_LIMIT": "1000",
+        "OVH_RATE_LIMIT": "1000",
+        "CLOUDFLARE_RATE_LIMIT": "1000"
+    }
+
+
+def start_backend(env: Dict[str, str], workers: int, ready_path: str = "/health/ready") -> (subprocess.Popen, str):
+    """Launch uvicorn and wait until ready_path answers 200"""
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"
+        ],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env}
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode}")
+        try:
+            if requests.get(f"{base_url}{ready_path}", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Backend did not start within 60 seconds")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Endpoints that got slower (p99) or slower to serve (throughput) than the baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["p99_ms"] and current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']} ms -> {current['p99_ms']} ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    width = max(len(name) for name in results)
+    print(f"{'endpoint':<{width}}  {'requests':>8}  {'errors':>6}  {'p50 ms':>9}  {'p99 ms':>9}  {'req/s':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<{width}}  {r['requests']:>8}  {r['errors']:>6}  "
+            f"{r['p50_ms']:>9.2f}  {r['p99_ms']:>9.2f}  {r['throughput_rps']:>9.2f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per read/DNS scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per scenario")
+    parser.add_argument("--services", type=int, default=20, help="Services created then deleted")
+    parser.add_argument("--workers", type=int, default=1, help="Backend uvicorn workers")
+    parser.add_argument("--dns-provider", choices=("cloudflare", "ovh"), default="cloudflare")
+    parser.add_argument("--records", type=int, default=500, help="DNS records seeded in the zone")
+    parser.add_argument("--hosts", type=int, default=200, help="NPM proxy hosts seeded")
+    parser.add_argument("--scenario", action="append", help="Only run scenarios containing this text")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Compare with the results of an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    for stub in STUBS:
+        parser.add_argument(f"--{stub}-latency", type=float, default=0.0, help=f"Seconds added to {stub} responses")
+        parser.add_argument(f"--{stub}-jitter", type=float, default=0.0, help=f"Random extra {stub} latency (seconds)")
+        parser.add_argument(f"--{stub}-error-rate", type=float, default=0.0, help=f"Fraction of failed {stub} calls")
+        parser.add_argument(f"--{stub}-error-status", type=int, default=500, help=f"HTTP status of injected {stub} errors")
+    parser.add_argument("--docker-health-delay", type=float, default=0.0,
+                        help="Seconds before started containers report healthy (0: no HEALTHCHECK)")
+    parser.add_argument("--network-mode", choices=("dedicated", "shared"), default="dedicated",
+                        help="A network per service, or pooled networks with static IPs")
+    return parser.parse_args()
+
+
+def stub_config(args, stub: str) -> StubConfig:
+    key = stub.replace("-", "_")
+    return StubConfig(
+        latency=getattr(args, f"{key}_latency"),
+        jitter=getattr(args, f"{key}_jitter"),
+        error_rate=getattr(args, f"{key}_error_rate"),
+        error_status=getattr(args, f"{key}_error_status")
+    )
+
+
+def main() -> int:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="orchestrator-bench-")
+    stubs = {
+        "npm": NPMStub(stub_config(args, "npm"), hosts=args.hosts, domain=ZONE),
+        "ovh": OVHStub(stub_config(args, "ovh"), zone=ZONE, records=args.records if args.dns_provider == "ovh" else 0),
+        "cloudflare": CloudflareStub(
+            stub_config(args, "cloudflare"), zone=ZONE,
+            records=args.records if args.dns_provider == "cloudflare" else 0
+        ),
+        "docker": DockerStub(stub_config(args, "docker"), health_delay=args.docker_health_delay)
+    }
+    backend = None
+    try:
+        env = backend_env(stubs, workdir, args.dns_provider, args.workers)
+        env["NETWORK_MODE"] = args.network_mode
+        backend, base_url = start_backend(env, args.workers)
+
+        results = {}
+        for scenario in build_scenarios(args):
+            if args.scenario and not any(text in scenario.name for text in args.scenario):
+                continue
+            results[scenario.name] = run_scenario(base_url, scenario).summary()
+        results_doc = {
+            "endpoints": results,
+            "upstreams": {name: stub.stats() for name, stub in stubs.items()},
+            "options": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+        }
+
+        print_table(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results_doc, f, indent=2)
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f)["endpoints"], args.tolerance)
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            return 1 if regressions else 0
+        return 0
+    finally:
+        if backend:
+            backend.terminate()
+            backend.wait(timeout=30)
+        for stub in stubs.values():
+            stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
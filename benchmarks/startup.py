@@ -0,0 +1,170 @@
+"""
+Benchmark backend cold start
+
+Measures, over several runs against the local stubs (see stubs.py):
+
+- import: time to `import main` in a fresh interpreter
+- live: time from launching uvicorn to the first 200 from /health/live
+- ready: time from launching uvicorn to the first 200 from /health/ready
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --docker missing        # no Docker socket at all
+    python benchmarks/startup.py --docker-latency 2      # Docker answering slowly
+    python benchmarks/startup.py --import-profile 15     # slowest imports (python -X importtime)
+
+Neither liveness nor readiness should depend on Docker being reachable.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run import BACKEND_DIR, ZONE, _free_port, backend_env
+from stubs import CloudflareStub, DockerStub, NPMStub, OVHStub, StubConfig
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Seconds to import the app in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=BACKEND_DIR, env={**os.environ, **env},
+        capture_output=True, text=True, check=True, timeout=120
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_profile(env: Dict[str, str], top: int) -> List[Tuple[str, float]]:
+    """The `top` slowest modules imported directly by main (cumulative milliseconds)"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env={**os.environ, **env},
+        capture_output=True, text=True, check=True, timeout=120
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two more spaces of indent per level; main is at " main"
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+
+
+def _wait_for(session: requests.Session, url: str, process: subprocess.Popen, deadline: float) -> Optional[float]:
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode}")
+        try:
+            if session.get(url, timeout=1).status_code == 200:
+                return time.monotonic()
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def measure_boot(env: Dict[str, str], timeout: float) -> Dict[str, Optional[float]]:
+    """Seconds from launching uvicorn to the first live and ready answers (None if not within timeout)"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        with requests.Session() as session:
+            deadline = started + timeout
+            live = _wait_for(session, f"{base_url}/health/live", process, deadline)
+            ready = _wait_for(session, f"{base_url}/health/ready", process, deadline) if live else None
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        "live": live - started if live else None,
+        "ready": ready - started if ready else None
+    }
+
+
+def _summary(values: List[Optional[float]]) -> Dict:
+    measured = [v for v in values if v is not None]
+    return {
+        "runs": len(values),
+        "timeouts": len(values) - len(measured),
+        "median_ms": round(statistics.median(measured) * 1000, 1) if measured else None,
+        "max_ms": round(max(measured) * 1000, 1) if measured else None
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per measurement")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for readiness per run")
+    parser.add_argument("--docker", choices=("stub", "missing"), default="stub",
+                        help="Serve the Docker API from the stub or point at a socket that does not exist")
+    parser.add_argument("--docker-latency", type=float, default=0.0, help="Docker stub latency in seconds")
+    parser.add_argument("--dns-provider", choices=("ovh", "cloudflare"), default="ovh")
+    parser.add_argument("--import-profile", type=int, default=0, metavar="N",
+                        help="Also list the N slowest imports")
+    parser.add_argument("--json", help="Write results to this file")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="orchestrator-startup-")
+    stubs = {
+        "npm": NPMStub(StubConfig(), domain=ZONE),
+        "ovh": OVHStub(StubConfig(), zone=ZONE),
+        "cloudflare": CloudflareStub(StubConfig(), zone=ZONE),
+        "docker": DockerStub(StubConfig(latency=args.docker_latency))
+    }
+    try:
+        docker_host = f"unix://{os.path.join(workdir, 'missing.sock')}" if args.docker == "missing" else None
+        env = backend_env(stubs, workdir, args.dns_provider, docker_host=docker_host)
+
+        imports, live, ready = [], [], []
+        for _ in range(args.runs):
+            imports.append(measure_import(env))
+            boot = measure_boot(env, args.timeout)
+            live.append(boot["live"])
+            ready.append(boot["ready"])
+
+        results = {"import": _summary(imports), "live": _summary(live), "ready": _summary(ready)}
+        print(f"{'phase':<8}  {'runs':>4}  {'timeouts':>8}  {'median ms':>10}  {'max ms':>10}")
+        for phase, r in results.items():
+            print(f"{phase:<8}  {r['runs']:>4}  {r['timeouts']:>8}  {r['median_ms'] or '-':>10}  {r['max_ms'] or '-':>10}")
+
+        doc = {"startup": results, "options": {k: v for k, v in vars(args).items() if k != "json"}}
+        if args.import_profile:
+            doc["slowest_imports"] = import_profile(env, args.import_profile)
+            print("\nslowest imports (cumulative ms)")
+            for name, ms in doc["slowest_imports"]:
+                print(f"  {ms:>9.1f}  {name}")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(doc, f, indent=2)
+        return 0 if not results["ready"]["timeouts"] else 1
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,664 @@
+"""
+Local stand-ins for the upstream APIs used by the orchestrator
+
+Each stub is a small threaded HTTP server keeping its state in memory:
+
+- NPMStub: /api/tokens, /api/schema, /api/nginx/proxy-hosts, /api/nginx/certificates
+- OVHStub: /auth/time, /me, /domain/zone/{zone}/record (served under any prefix, e.g. /1.0)
+- CloudflareStub: /zones (paginated), /zones/{id}, /zones/{id}/dns_records (paginated, batch)
+- DockerStub: the subset of the Docker Engine API used by DockerService, on a unix socket
+
+Every stub takes a StubConfig adding latency and injecting errors, so the
+benchmarks can show how the backend behaves when an upstream is slow or flaky.
+"""
+import hashlib
+import ipaddress
+import itertools
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Payload answered as a JSON null body (None answers an empty body)
+NULL = object()
+
+
+@dataclass
+class StubConfig:
+    """Latency and error injection of one stub"""
+
+    latency: float = 0.0  # Seconds added to every response
+    jitter: float = 0.0  # Up to this many extra seconds, uniformly distributed
+    error_rate: float = 0.0  # Fraction of requests answered with error_status
+    error_status: int = 500
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self):
+        stub = self.server.stub
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+
+        status, payload = stub.respond(self.command, url.path, query, body)
+
+        if isinstance(payload, bytes):
+            data, content_type = payload, "text/plain"
+        else:
+            data = b"" if payload is None else b"null" if payload is NULL else json.dumps(payload).encode()
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Stub:
+    """
+    Base class of the stubs: routing, injection and server lifecycle
+
+    Subclasses list (method, path regex, handler name) tuples in ROUTES;
+    handlers receive the regex groups, the query and the JSON body, and
+    return (status, payload).
+    """
+
+    ROUTES: List[Tuple[str, str, str]] = []
+    name = "stub"
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.lock = threading.RLock()
+        self.requests = 0
+        self.injected_errors = 0
+        self._ids = itertools.count(1)
+        self._routes = [(method, re.compile(f"^{pattern}$"), handler) for method, pattern, handler in self.ROUTES]
+        self._server = None
+        self._thread = None
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self._ids)
+
+    def normalize_path(self, path: str) -> str:
+        return path.rstrip("/") or "/"
+
+    def respond(self, method: str, path: str, query: Dict, body) -> Tuple[int, object]:
+        with self.lock:
+            self.requests += 1
+        delay = self.config.latency + random.uniform(0, self.config.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            with self.lock:
+                self.injected_errors += 1
+            return self.config.error_status, {"message": f"{self.name} stub: injected error"}
+
+        path = self.normalize_path(path)
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return getattr(self, handler)(*match.groups(), query=query, body=body)
+        return 404, {"message": f"{self.name} stub: no route for {method} {path}"}
+
+    def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a TCP port (0 picks a free one) and return the base URL"""
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def start_unix(self, socket_path: str) -> str:
+        """Serve on a unix socket and return its unix:// URL"""
+        self._server = _UnixHTTPServer(socket_path, _Handler)
+        self._start()
+        return f"unix://{socket_path}"
+
+    def _start(self):
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests, "injected_errors": self.injected_errors}
+
+
+class NPMStub(Stub):
+    """Nginx Proxy Manager API"""
+
+    name = "npm"
+    ROUTES = [
+        ("POST", r"/api/tokens", "create_token"),
+        ("GET", r"/api/schema", "schema"),
+        ("GET", r"/api/nginx/proxy-hosts", "list_hosts"),
+        ("POST", r"/api/nginx/proxy-hosts", "create_host"),
+        ("GET", r"/api/nginx/proxy-hosts/(\d+)", "get_host"),
+        ("PUT", r"/api/nginx/proxy-hosts/(\d+)", "update_host"),
+        ("DELETE", r"/api/nginx/proxy-hosts/(\d+)", "delete_host"),
+        ("GET", r"/api/nginx/certificates", "list_certificates"),
+        ("POST", r"/api/nginx/certificates", "create_certificate"),
+    ]
+
+    def __init__(self, config: Optional[StubConfig] = None, hosts: int = 0, domain: str = "bench.test"):
+        super().__init__(config)
+        self.hosts: Dict[int, Dict] = {}
+        self.certificates: Dict[int, Dict] = {}
+        for i in range(hosts):
+            self._add_host({
+                "domain_names": [f"seed-{i}.{domain}"],
+                "forward_host": f"10.0.{i // 250}.{i % 250 + 1}",
+                "forward_port": 80
+            })
+
+    def _add_host(self, body: Dict) -> Dict:
+        host = {
+            "id": self.next_id(),
+            "domain_names": body.get("domain_names") or [],
+            "forward_scheme": body.get("forward_scheme", "http"),
+            "forward_host": body.get("forward_host"),
+            "forward_port": body.get("forward_port"),
+            "certificate_id": body.get("certificate_id") or 0,
+            "ssl_forced": bool(body.get("ssl_forced")),
+            "advanced_config": body.get("advanced_config") or "",
+            "access_list_id": body.get("access_list_id") or 0,
+            "caching_enabled": bool(body.get("caching_enabled")),
+            "block_exploits": bool(body.get("block_exploits")),
+            "allow_websocket_upgrade": bool(body.get("allow_websocket_upgrade")),
+            "http2_support": bool(body.get("http2_support")),
+            "hsts_enabled": bool(body.get("hsts_enabled")),
+            "hsts_subdomains": bool(body.get("hsts_subdomains")),
+            "enabled": True,
+            "created_on": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self.lock:
+            self.hosts[host["id"]] = host
+        return host
+
+    def create_token(self, query, body):
+        return 200, {"token": "bench-token", "expires": "2099-01-01T00:00:00.000Z"}
+
+    def schema(self, query, body):
+        return 200, {"openapi": "3.1.0"}
+
+    def list_hosts(self, query, body):
+        with self.lock:
+            return 200, list(self.hosts.values())
+
+    def create_host(self, query, body):
+        return 201, self._add_host(body or {})
+
+    def get_host(self, host_id, query, body):
+        host = self.hosts.get(int(host_id))
+        return (200, host) if host else (404, {"error": {"message": "Not Found"}})
+
+    def update_host(self, host_id, query, body):
+        with self.lock:
+            host = self.hosts.get(int(host_id))
+            if not host:
+                return 404, {"error": {"message": "Not Found"}}
+            host.update(body or {})
+            return 200, dict(host)
+
+    def delete_host(self, host_id, query, body):
+        with self.lock:
+            return (200, True) if self.hosts.pop(int(host_id), None) else (404, {"error": {"message": "Not Found"}})
+
+    def list_certificates(self, query, body):
+        with self.lock:
+            return 200, list(self.certificates.values())
+
+    def create_certificate(self, query, body):
+        certificate = {
+            "id": self.next_id(),
+            "provider": "letsencrypt",
+            "nice_name": ",".join((body or {}).get("domain_names") or []),
+            "domain_names": (body or {}).get("domain_names") or [],
+            "expires_on": "2099-01-01 00:00:00"
+        }
+        with self.lock:
+            self.certificates[certificate["id"]] = certificate
+        return 201, certificate
+
+
+class OVHStub(Stub):
+    """OVH DNS API (requests are accepted unsigned)"""
+
+    name = "ovh"
+    ROUTES = [
+        ("GET", r"/auth/time", "auth_time"),
+        ("GET", r"/me", "me"),
+        ("GET", r"/domain/zone/([^/]+)", "get_zone"),
+        ("GET", r"/domain/zone/([^/]+)/record", "list_records"),
+        ("POST", r"/domain/zone/([^/]+)/record", "create_record"),
+        ("GET", r"/domain/zone/([^/]+)/record/(\d+)", "get_record"),
+        ("DELETE", r"/domain/zone/([^/]+)/record/(\d+)", "delete_record"),
+        ("POST", r"/domain/zone/([^/]+)/refresh", "refresh"),
+    ]
+
+    def __init__(self, config: Optional[StubConfig] = None, zone: str = "bench.test", records: int = 0):
+        super().__init__(config)
+        self.zone = zone
+        self.records: Dict[int, Dict] = {}
+        for i in range(records):
+            self._add_record({"fieldType": "A", "subDomain": f"seed-{i}", "target": "203.0.113.10", "ttl": 3600})
+
+    def normalize_path(self, path: str) -> str:
+        # The API version prefix (/1.0, /v1) is part of the endpoint URL
+        return re.sub(r"^/(1\.0|v\d+)(?=/)", "", super().normalize_path(path))
+
+    def _add_record(self, body: Dict) -> Dict:
+        record = {
+            "id": self.next_id(),
+            "zone": self.zone,
+            "fieldType": body.get("fieldType"),
+            "subDomain": body.get("subDomain") or "",
+            "target": body.get("target"),
+            "ttl": body.get("ttl") or 3600
+        }
+        with self.lock:
+            self.records[record["id"]] = record
+        return record
+
+    def auth_time(self, query, body):
+        return 200, int(time.time())
+
+    def me(self, query, body):
+        return 200, {"nichandle": "bench-ovh"}
+
+    def get_zone(self, zone, query, body):
+        return (200, {"name": zone}) if zone == self.zone else (404, {"message": "Zone not found"})
+
+    def list_records(self, zone, query, body):
+        with self.lock:
+            return 200, [
+                record["id"] for record in self.records.values()
+                if ("fieldType" not in query or record["fieldType"] == query["fieldType"])
+                and ("subDomain" not in query or record["subDomain"] == query["subDomain"])
+            ]
+
+    def create_record(self, zone, query, body):
+        return 200, self._add_record(body or {})
+
+    def get_record(self, zone, record_id, query, body):
+        record = self.records.get(int(record_id))
+        return (200, record) if record else (404, {"message": "Record not found"})
+
+    def delete_record(self, zone, record_id, query, body):
+        with self.lock:
+            return (200, NULL) if self.records.pop(int(record_id), None) else (404, {"message": "Record not found"})
+
+    def refresh(self, zone, query, body):
+        return 200, NULL
+
+
+class CloudflareStub(Stub):
+    """Cloudflare v4 API, with page/per_page pagination on every listing"""
+
+    name = "cloudflare"
+    ROUTES = [
+        ("GET", r"/zones", "list_zones"),
+        ("GET", r"/zones/([^/]+)", "get_zone"),
+        ("GET", r"/zones/([^/]+)/dns_records", "list_records"),
+        ("POST", r"/zones/([^/]+)/dns_records", "create_record"),
+        ("POST", r"/zones/([^/]+)/dns_records/batch", "batch"),
+        ("GET", r"/zones/([^/]+)/dns_records/([^/]+)", "get_record"),
+        ("DELETE", r"/zones/([^/]+)/dns_records/([^/]+)", "delete_record"),
+    ]
+
+    def __init__(
+        self,
+        config: Optional[StubConfig] = None,
+        zone_id: str = "bench-zone",
+        zone: str = "bench.test",
+        records: int = 0,
+        zones: int = 1
+    ):
+        super().__init__(config)
+        self.zones = {zone_id: {"id": zone_id, "name": zone, "status": "active"}}
+        for i in range(1, zones):
+            self.zones[f"{zone_id}-{i}"] = {"id": f"{zone_id}-{i}", "name": f"zone-{i}.{zone}", "status": "active"}
+        self.records: Dict[str, Dict] = {}
+        for i in range(records):
+            self._add_record(zone_id, {"type": "A", "name": f"seed-{i}.{zone}", "content": "203.0.113.10", "ttl": 3600})
+
+    def _page(self, items: List, query: Dict) -> Tuple[int, Dict]:
+        page = max(int(query.get("page", 1)), 1)
+        per_page = max(min(int(query.get("per_page", 20)), 5000), 1)
+        start = (page - 1) * per_page
+        return 200, {
+            "success": True,
+            "errors": [],
+            "result": items[start:start + per_page],
+            "result_info": {
+                "page": page,
+                "per_page": per_page,
+                "count": len(items[start:start + per_page]),
+                "total_count": len(items),
+                "total_pages": max((len(items) + per_page - 1) // per_page, 1)
+            }
+        }
+
+    def _add_record(self, zone_id: str, body: Dict) -> Dict:
+        zone = self.zones[zone_id]["name"]
+        name = body.get("name") or zone
+        if name != zone and not name.endswith(f".{zone}"):
+            name = f"{name}.{zone}"
+        record = {
+            "id": f"{self.next_id():032x}",
+            "zone_id": zone_id,
+            "zone_name": zone,
+            "type": body.get("type"),
+            "name": name,
+            "content": body.get("content"),
+            "ttl": body.get("ttl") or 1,
+            "proxied": bool(body.get("proxied"))
+        }
+        with self.lock:
+            self.records[record["id"]] = record
+        return record
+
+    def _not_found(self):
+        return 404, {"success": False, "errors": [{"code": 7003, "message": "Not found"}], "result": None}
+
+    def list_zones(self, query, body):
+        return self._page(list(self.zones.values()), query)
+
+    def get_zone(self, zone_id, query, body):
+        zone = self.zones.get(zone_id)
+        return (200, {"success": True, "errors": [], "result": zone}) if zone else self._not_found()
+
+    def list_records(self, zone_id, query, body):
+        if zone_id not in self.zones:
+            return self._not_found()
+        with self.lock:
+            records = [
+                record for record in self.records.values()
+                if record["zone_id"] == zone_id
+                and ("type" not in query or record["type"] == query["type"])
+                and ("name" not in query or record["name"] == query["name"])
+            ]
+        return self._page(records, query)
+
+    def create_record(self, zone_id, query, body):
+        if zone_id not in self.zones:
+            return self._not_found()
+        return 200, {"success": True, "errors": [], "result": self._add_record(zone_id, body or {})}
+
+    def batch(self, zone_id, query, body):
+        if zone_id not in self.zones:
+            return self._not_found()
+        body = body or {}
+        deletes = []
+        with self.lock:
+            for item in body.get("deletes") or []:
+                record = self.records.pop(item.get("id"), None)
+                if record:
+                    deletes.append(record)
+        posts = [self._add_record(zone_id, item) for item in body.get("posts") or []]
+        return 200, {"success": True, "errors": [], "result": {"deletes": deletes, "posts": posts}}
+
+    def get_record(self, zone_id, record_id, query, body):
+        record = self.records.get(record_id)
+        return (200, {"success": True, "errors": [], "result": record}) if record else self._not_found()
+
+    def delete_record(self, zone_id, record_id, query, body):
+        with self.lock:
+            record = self.records.pop(record_id, None)
+        return (200, {"success": True, "errors": [], "result": {"id": record_id}}) if record else self._not_found()
+
+
+class DockerStub(Stub):
+    """
+    Docker Engine API subset used by DockerService
+
+    Containers "run" as soon as they are started and get the second host
+    address of their network's subnet after the ones already handed out.
+    """
+
+    name = "docker"
+    API_VERSION = "1.43"
+    ROUTES = [
+        ("GET", r"/_ping", "ping"),
+        ("HEAD", r"/_ping", "ping"),
+        ("GET", r"/version", "version"),
+        ("GET", r"/info", "info"),
+        ("POST", r"/networks/create", "create_network"),
+        ("GET", r"/networks", "list_networks"),
+        ("GET", r"/networks/([^/]+)", "get_network"),
+        ("DELETE", r"/networks/([^/]+)", "delete_network"),
+        ("GET", r"/images/(.+)/json", "get_image"),
+        ("POST", r"/images/create", "pull_image"),
+        ("GET", r"/containers/json", "list_containers"),
+        ("POST", r"/containers/create", "create_container"),
+        ("POST", r"/containers/([^/]+)/start", "start_container"),
+        ("POST", r"/containers/([^/]+)/stop", "stop_container"),
+        ("POST", r"/containers/([^/]+)/rename", "rename_container"),
+        ("GET", r"/containers/([^/]+)/json", "get_container"),
+        ("DELETE", r"/containers/([^/]+)", "delete_container"),
+    ]
+
+    def __init__(
+        self,
+        config: Optional[StubConfig] = None,
+        cpus: int = 8,
+        memory_mb: int = 32768,
+        health_delay: float = 0.0
+    ):
+        super().__init__(config)
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        # With a delay, containers have a HEALTHCHECK that passes this long after start
+        self.health_delay = health_delay
+        self.networks: Dict[str, Dict] = {}
+        self.containers: Dict[str, Dict] = {}
+        self.images = set()
+
+    def normalize_path(self, path: str) -> str:
+        return re.sub(r"^/v\d+\.\d+(?=/)", "", super().normalize_path(path))
+
+    def _find(self, items: Dict[str, Dict], key: str) -> Optional[Dict]:
+        if key in items:
+            return items[key]
+        return next((item for item in items.values() if item["Name"].lstrip("/") == key), None)
+
+    def _missing(self, what: str, key: str):
+        return 404, {"message": f"No such {what}: {key}"}
+
+    def ping(self, query, body):
+        return 200, b"OK"
+
+    def version(self, query, body):
+        return 200, {"Version": "24.0.0", "ApiVersion": self.API_VERSION, "MinAPIVersion": "1.12"}
+
+    def info(self, query, body):
+        return 200, {"NCPU": self.cpus, "MemTotal": self.memory_mb * 1024 * 1024, "ServerVersion": "24.0.0"}
+
+    def create_network(self, query, body):
+        body = body or {}
+        with self.lock:
+            if self._find(self.networks, body.get("Name", "")):
+                return 409, {"message": f"network with name {body.get('Name')} already exists"}
+            network = {
+                "Id": f"{self.next_id():064x}",
+                "Name": body.get("Name"),
+                "Driver": body.get("Driver") or "bridge",
+                "IPAM": body.get("IPAM") or {"Config": []},
+                "Labels": body.get("Labels") or {},
+                "Containers": {},
+                "_next_host": 2
+            }
+            self.networks[network["Id"]] = network
+        return 201, {"Id": network["Id"], "Warning": ""}
+
+    def list_networks(self, query, body):
+        with self.lock:
+            return 200, [
+                {k: v for k, v in network.items() if not k.startswith("_")}
+                for network in self.networks.values()
+            ]
+
+    def get_network(self, key, query, body):
+        network = self._find(self.networks, key)
+        if not network:
+            return self._missing("network", key)
+        return 200, {k: v for k, v in network.items() if not k.startswith("_")}
+
+    def delete_network(self, key, query, body):
+        with self.lock:
+            network = self._find(self.networks, key)
+            if not network:
+                return self._missing("network", key)
+            del self.networks[network["Id"]]
+        return 204, None
+
+    def get_image(self, name, query, body):
+        if name not in self.images and f"{name}:latest" not in self.images:
+            return self._missing("image", name)
+        return 200, {"Id": f"sha256:{hashlib.sha256(name.encode()).hexdigest()}", "RepoTags": [name]}
+
+    def pull_image(self, query, body):
+        image = query.get("fromImage", "")
+        tag = query.get("tag") or "latest"
+        with self.lock:
+            self.images.add(image if ":" in image.split("/")[-1] else f"{image}:{tag}")
+        return 200, {"status": f"Downloaded newer image for {image}:{tag}"}
+
+    def _container_ip(self, network: Dict) -> str:
+        config = (network["IPAM"].get("Config") or [{}])[0]
+        subnet = ipaddress.IPv4Network(config.get("Subnet") or "172.31.0.0/16")
+        address = str(subnet.network_address + network["_next_host"])
+        network["_next_host"] += 1
+        return address
+
+    def create_container(self, query, body):
+        body = body or {}
+        name = query.get("name") or f"container-{self.next_id()}"
+        host_config = body.get("HostConfig") or {}
+        endpoints = ((body.get("NetworkingConfig") or {}).get("EndpointsConfig") or {})
+        network_names = list(endpoints) or [host_config.get("NetworkMode") or "bridge"]
+
+        with self.lock:
+            if self._find(self.containers, name):
+                return 409, {"message": f'Conflict. The container name "/{name}" is already in use'}
+            networks = {}
+            for network_name in network_names:
+                network = self._find(self.networks, network_name)
+                static_ip = ((endpoints.get(network_name) or {}).get("IPAMConfig") or {}).get("IPv4Address")
+                if network:
+                    networks[network_name] = {
+                        "NetworkID": network["Id"],
+                        "IPAddress": static_ip or self._container_ip(network)
+                    }
+            container = {
+                "Id": f"{self.next_id():064x}",
+                "Name": f"/{name}",
+                "Image": body.get("Image"),
+                "Config": {
+                    "Image": body.get("Image"),
+                    "Env": body.get("Env") or [],
+                    "Labels": body.get("Labels") or {}
+                },
+                "HostConfig": host_config,
+                "State": {"Status": "created", "Running": False},
+                "NetworkSettings": {"Networks": networks}
+            }
+            self.containers[container["Id"]] = container
+        return 201, {"Id": container["Id"], "Warnings": []}
+
+    def _set_state(self, key: str, status: str):
+        with self.lock:
+            container = self._find(self.containers, key)
+            if not container:
+                return self._missing("container", key)
+            container["State"] = {"Status": status, "Running": status == "running"}
+            container["_started_at"] = time.monotonic() if status == "running" else None
+        return 204, None
+
+    def start_container(self, key, query, body):
+        return self._set_state(key, "running")
+
+    def stop_container(self, key, query, body):
+        return self._set_state(key, "exited")
+
+    def rename_container(self, key, query, body):
+        name = query.get("name", "")
+        with self.lock:
+            container = self._find(self.containers, key)
+            if not container:
+                return self._missing("container", key)
+            other = self._find(self.containers, name)
+            if other and other is not container:
+                return 409, {"message": f'Conflict. The container name "/{name}" is already in use'}
+            container["Name"] = f"/{name}"
+        return 204, None
+
+    def list_containers(self, query, body):
+        """Container summaries, running only unless all=1, filtered by "label" (key or key=value)"""
+        labels = json.loads(query.get("filters") or "{}").get("label") or []
+        show_all = query.get("all") in ("1", "true", "True")
+        summaries = []
+        with self.lock:
+            for container in self.containers.values():
+                if not show_all and not container["State"]["Running"]:
+                    continue
+                container_labels = container["Config"]["Labels"]
+                if not all(
+                    container_labels.get(k) == v if sep else k in container_labels
+                    for k, sep, v in (label.partition("=") for label in labels)
+                ):
+                    continue
+                summaries.append({
+                    "Id": container["Id"],
+                    "Names": [container["Name"]],
+                    "Image": container["Image"],
+                    "Labels": container_labels,
+                    "State": container["State"]["Status"]
+                })
+        return 200, summaries
+
+    def get_container(self, key, query, body):
+        container = self._find(self.containers, key)
+        if not container:
+            return self._missing("container", key)
+        data = {k: v for k, v in container.items() if not k.startswith("_")}
+        if self.health_delay and container["State"]["Running"]:
+            healthy = time.monotonic() - container["_started_at"] >= self.health_delay
+            data["State"] = {**container["State"], "Health": {"Status": "healthy" if healthy else "starting"}}
+        return 200, data
+
+    def delete_container(self, key, query, body):
+        with self.lock:
+            container = self._find(self.containers, key)
+            if not container:
+                return self._missing("container", key)
+            del self.containers[container["Id"]]
+        return 204, None
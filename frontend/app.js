@@ -1,5 +1,6 @@
-// API Configuration
-const API_URL = 'http://localhost:8000';
+// API Configuration: same origin, nginx proxies /api/ and /health to the backend
+// (and micro-caches list responses). Set the backend URL when serving without nginx.
+const API_URL = '';
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', () => {
@@ -20,17 +21,12 @@ document.addEventListener('DOMContentLoaded', () => {
     }, 30000);
 });
 
-// Cache for DNS records and NPM hosts
-let cachedDNSRecords = [];
-let cachedNPMHosts = [];
-let cacheTimestamp = 0;
-const CACHE_DURATION = 60000; // 1 minute
-
 // Delete modal state
 let deleteModalState = {
     type: null, // 'dns' or 'npm'
     id: null,
     name: null,
+    zone: null, // DNS zone of the record (multi-zone setups)
     callback: null
 };
 
@@ -67,18 +63,17 @@ function setupDeleteModal() {
 
         try {
             if (deleteModalState.type === 'dns') {
-                await deleteDNSRecord(deleteModalState.id);
+                await deleteDNSRecord(deleteModalState.id, deleteModalState.zone);
             } else if (deleteModalState.type === 'npm') {
                 await deleteNPMHost(deleteModalState.id);
             }
 
             closeDeleteModal();
 
-            // Invalidate cache and reload
-            cacheTimestamp = 0;
+            // Reload lists, past the nginx micro-cache
             setTimeout(() => {
-                loadNPMHosts();
-                loadDNSRecords();
+                loadNPMHosts(true);
+                loadDNSRecords(true);
             }, 500);
 
         } catch (error) {
@@ -98,7 +93,7 @@ function setupDeleteModal() {
 }
 
 // Show delete confirmation modal
-function showDeleteModal(type, id, name) {
+function showDeleteModal(type, id, name, zone = null) {
     const modal = document.getElementById('deleteModal');
     const targetElement = document.getElementById('deleteTarget');
     const requiredTextElement = document.getElementById('deleteRequiredText');
@@ -106,7 +101,7 @@ function showDeleteModal(type, id, name) {
     const confirmBtn = document.getElementById('deleteConfirmBtn');
 
     // Store state
-    deleteModalState = { type, id, name };
+    deleteModalState = { type, id, name, zone };
 
     // Update modal content
     targetElement.textContent = name;
@@ -129,12 +124,13 @@ function showDeleteModal(type, id, name) {
 function closeDeleteModal() {
     const modal = document.getElementById('deleteModal');
     modal.classList.remove('active');
-    deleteModalState = { type: null, id: null, name: null };
+    deleteModalState = { type: null, id: null, name: null, zone: null };
 }
 
 // Delete DNS record
-async function deleteDNSRecord(recordId) {
-    const response = await fetch(`${API_URL}/api/dns/records/${recordId}`, {
+async function deleteDNSRecord(recordId, zone = null) {
+    const query = zone ? `?zone=${encodeURIComponent(zone)}` : '';
+    const response = await fetch(`${API_URL}/api/dns/records/${encodeURIComponent(recordId)}${query}`, {
         method: 'DELETE'
     });
 
@@ -160,37 +156,19 @@ async function deleteNPMHost(hostId) {
     return await response.json();
 }
 
-// Load existing DNS records and NPM hosts for validation
-async function loadExistingRecordsForValidation() {
-    const now = Date.now();
-
-    // Return cached data if still fresh
-    if (cacheTimestamp && (now - cacheTimestamp) < CACHE_DURATION) {
-        return { dns: cachedDNSRecords, npm: cachedNPMHosts };
-    }
-
+// Check a subdomain against existing DNS records and NPM hosts (answered by the backend index)
+async function loadExistingRecordsForValidation(subdomain) {
     try {
-        const [dnsResponse, npmResponse] = await Promise.all([
-            fetch(`${API_URL}/api/dns/records`).catch(() => ({ ok: false })),
-            fetch(`${API_URL}/api/npm/hosts`).catch(() => ({ ok: false }))
-        ]);
-
-        if (dnsResponse.ok) {
-            const dnsData = await dnsResponse.json();
-            cachedDNSRecords = dnsData.success ? dnsData.records : [];
-        }
-
-        if (npmResponse.ok) {
-            const npmData = await npmResponse.json();
-            cachedNPMHosts = npmData.success ? npmData.hosts : [];
+        const response = await fetch(`${API_URL}/api/subdomains/${encodeURIComponent(subdomain)}/availability`);
+        if (response.ok) {
+            const data = await response.json();
+            return data.conflicts;
         }
-
-        cacheTimestamp = now;
     } catch (error) {
-        console.error('Error loading records for validation:', error);
+        console.error('Error checking subdomain availability:', error);
     }
 
-    return { dns: cachedDNSRecords, npm: cachedNPMHosts };
+    return { dns: [], npm: [] };
 }
 
 // Input Validation and Auto-correction
@@ -278,28 +256,19 @@ function setupInputValidation() {
 
         // Check for existing records
         showFeedback(subdomainFeedback, 'Checking for duplicates...', 'info');
-        const { dns, npm } = await loadExistingRecordsForValidation();
+        const { dns, npm } = await loadExistingRecordsForValidation(value);
 
         let warnings = [];
 
         // Check DNS records
-        const existingDNS = dns.find(record => {
-            const subdomain = record.subdomain === '@' ? '' : record.subdomain;
-            return subdomain.toLowerCase() === value;
-        });
+        const existingDNS = dns[0];
 
         if (existingDNS) {
             warnings.push(`DNS: ${existingDNS.type} record exists (→ ${existingDNS.target})`);
         }
 
         // Check NPM hosts
-        const existingNPM = npm.find(host => {
-            if (!host.domain_names || host.domain_names.length === 0) return false;
-            // Extract subdomain from full domain (e.g., "myapp.domain.com" -> "myapp")
-            const fullDomain = host.domain_names[0];
-            const subdomain = fullDomain.split('.')[0];
-            return subdomain.toLowerCase() === value;
-        });
+        const existingNPM = npm[0];
 
         if (existingNPM) {
             const forwardTo = `${existingNPM.forward_host}:${existingNPM.forward_port}`;
@@ -687,12 +656,12 @@ function updateStatusIndicator(elementId, isHealthy, errorMessage) {
     }
 }
 
-// Load and display NPM hosts
-async function loadNPMHosts() {
+// Load and display NPM hosts (fresh: skip caches, e.g. right after a change)
+async function loadNPMHosts(fresh = false) {
     const hostsContainer = document.getElementById('npmHostsList');
 
     try {
-        const response = await fetch(`${API_URL}/api/npm/hosts`);
+        const response = await fetch(`${API_URL}/api/npm/hosts`, fresh ? { cache: 'reload' } : {});
         const data = await response.json();
 
         if (!data.success || data.hosts.length === 0) {
@@ -701,12 +670,6 @@ async function loadNPMHosts() {
         }
 
         hostsContainer.innerHTML = data.hosts.map(host => createNPMHostCard(host)).join('');
-
-        // Update cache with fresh data
-        if (data.success) {
-            cachedNPMHosts = data.hosts;
-        }
-
     } catch (error) {
         console.error('Failed to load NPM hosts:', error);
         hostsContainer.innerHTML = '<p class="error">Failed to load NPM hosts</p>';
@@ -934,12 +897,10 @@ function setupFormHandler() {
                     document.querySelectorAll('input[type="text"], input[type="number"]').forEach(input => {
                         input.classList.remove('valid', 'invalid');
                     });
-                    // Invalidate cache
-                    cacheTimestamp = 0;
-                    // Reload lists after a short delay
+                    // Reload lists after a short delay, past the nginx micro-cache
                     setTimeout(() => {
-                        loadNPMHosts();
-                        loadDNSRecords();
+                        loadNPMHosts(true);
+                        loadDNSRecords(true);
                     }, 1000);
                 }
             } else {
@@ -1058,11 +1019,11 @@ function filterDNSRecords(query) {
 }
 
 // Load and display DNS records
-async function loadDNSRecords() {
+async function loadDNSRecords(fresh = false) {
     const dnsContainer = document.getElementById('dnsRecordsList');
 
     try {
-        const response = await fetch(`${API_URL}/api/dns/records`);
+        const response = await fetch(`${API_URL}/api/dns/records`, fresh ? { cache: 'reload' } : {});
         const data = await response.json();
 
         if (!data.success || data.records.length === 0) {
@@ -1070,16 +1031,10 @@ async function loadDNSRecords() {
             return;
         }
 
-        // Update cache with fresh data
-        if (data.success) {
-            cachedDNSRecords = data.records;
-            cacheTimestamp = Date.now();
-        }
-
         // Create table
         let html = `
             <div style="margin-bottom: 15px;">
-                <strong>Zone:</strong> ${data.zone} |
+                <strong>${data.zones && data.zones.length > 1 ? 'Zones' : 'Zone'}:</strong> ${(data.zones || [data.zone]).join(', ')} |
                 <strong>Total records:</strong> ${data.count}
             </div>
             <table class="dns-table">
@@ -1103,7 +1058,8 @@ async function loadDNSRecords() {
 
         data.records.forEach(record => {
             const typeClass = `type-${record.type.toLowerCase()}`;
-            const subdomain = record.subdomain === '@' ? `@ (${data.zone})` : `${record.subdomain}.${data.zone}`;
+            const zone = record.zone || data.zone;
+            const subdomain = record.subdomain === '@' ? `@ (${zone})` : `${record.subdomain}.${zone}`;
             const displayName = record.subdomain === '@' ? '@' : record.subdomain;
             // Escape quotes for onclick attribute
             const escapedName = displayName.replace(/'/g, "\\'");
@@ -1116,7 +1072,7 @@ async function loadDNSRecords() {
                     <td>${record.ttl || 'N/A'}</td>
                     <td>
                         <div class="dns-table-actions">
-                            <button class="btn-delete-small" onclick="showDeleteModal('dns', ${record.id}, '${escapedName}')">
+                            <button class="btn-delete-small" onclick="showDeleteModal('dns', '${record.id}', '${escapedName}', '${zone}')">
                                 Delete
                             </button>
                         </div>